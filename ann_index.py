@@ -0,0 +1,182 @@
+"""
+Approximate nearest-neighbour indexes for large segments.
+
+Small segments are scanned exactly. Once a segment grows past
+FAISS_ANN_MIN_VECTORS it gets a FAISS index of the configured type, trained
+on its own vectors and stored next to it as seg-XXXXXX.<type>.faiss:
+
+    flat    no index, exact brute-force scan
+    hnsw    HNSW graph over full float32 vectors (fast, exact distances, most RAM)
+    ivfpq   inverted file with product-quantized codes (smallest RAM)
+    sq8     inverted file with 8-bit scalar-quantized codes
+
+"auto" picks flat, then HNSW, then IVF-PQ as a segment grows. The quantized
+types only produce candidates; their distances are recomputed exactly from
+the memory-mapped vectors, so scores stay comparable across segments.
+"""
+import math
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+import config
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivfpq', 'sq8')
+QUANTIZED_TYPES = ('ivfpq', 'sq8')
+
+
+def choose_index_type(count: int, index_type: str = None, min_vectors: int = None) -> str:
+    """
+    Index type for a segment of `count` vectors.
+
+    Args:
+        count: Number of vectors in the segment
+        index_type: "auto" or one of INDEX_TYPES (defaults to FAISS_INDEX_TYPE)
+        min_vectors: Segments smaller than this stay flat (defaults to FAISS_ANN_MIN_VECTORS)
+    """
+    index_type = index_type or config.FAISS_INDEX_TYPE
+    min_vectors = config.FAISS_ANN_MIN_VECTORS if min_vectors is None else min_vectors
+    if index_type != 'auto' and index_type not in INDEX_TYPES:
+        raise ValueError(
+            f"Unknown FAISS index type '{index_type}'. Use auto, {', '.join(INDEX_TYPES)}"
+        )
+
+    if index_type == 'flat' or count < min_vectors:
+        return 'flat'
+    if index_type == 'auto':
+        return 'hnsw' if count < config.FAISS_COMPRESSED_MIN_VECTORS else 'ivfpq'
+    return index_type
+
+
+def _nlist(count: int) -> int:
+    # ~4 * sqrt(n) lists, leaving at least 39 training points per centroid
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def _pq_subquantizers(dimension: int) -> int:
+    # Largest divisor of the dimension not above FAISS_PQ_M
+    for m in range(min(config.FAISS_PQ_M, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def build_index(vectors: np.ndarray, index_type: str):
+    """
+    Train and fill an index over vectors; row i of vectors gets label i.
+
+    Returns:
+        The FAISS index, or None for 'flat'
+    """
+    import faiss
+
+    if index_type == 'flat':
+        return None
+
+    count, dimension = vectors.shape
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(dimension, config.FAISS_HNSW_M)
+        index.hnsw.efConstruction = config.FAISS_HNSW_EF_CONSTRUCTION
+    else:
+        nlist = _nlist(count)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == 'ivfpq':
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), 8)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(
+                quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit
+            )
+        # Train on an evenly spaced sample; k-means gains little past ~64 points
+        # per list, and the PQ codebooks want ~10k points
+        step = max(1, count // max(nlist * 64, 10000))
+        index.train(np.ascontiguousarray(vectors[::step], dtype=np.float32))
+
+    # Add in slices so a memory-mapped matrix is never copied whole
+    for start in range(0, count, 65536):
+        index.add(np.ascontiguousarray(vectors[start:start + 65536], dtype=np.float32))
+    configure_search(index)
+    return index
+
+
+def configure_search(index):
+    """Apply the configured search-time accuracy knobs to a loaded index."""
+    import faiss
+
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config.FAISS_HNSW_EF_SEARCH
+    else:
+        faiss.extract_index_ivf(index).nprobe = config.FAISS_IVF_NPROBE
+
+
+def search_index(
+    index,
+    index_type: str,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    deleted: np.ndarray = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    k nearest rows of an indexed segment.
+
+    Quantized indexes fetch FAISS_RERANK_FACTOR * k candidates and rescore
+    them exactly against `vectors`, the segment's full-precision matrix.
+
+    Args:
+        deleted: Optional boolean mask of tombstoned rows; they are skipped
+            inside the index search, so k live rows come back without
+            over-fetching
+
+    Returns:
+        (distances, rows) of shape (len(queries), k), squared L2, -1 for missing rows
+    """
+    params = _search_parameters(index, deleted)
+    if index_type not in QUANTIZED_TYPES:
+        return index.search(queries, k, params=params)
+
+    candidates = min(k * config.FAISS_RERANK_FACTOR, index.ntotal)
+    _, rows = index.search(queries, candidates, params=params)
+    distances = np.full(rows.shape, np.inf, dtype=np.float32)
+    for q in range(len(queries)):
+        valid = rows[q] >= 0
+        # Sorted row order keeps reads from the memory map sequential
+        found = np.sort(rows[q][valid])
+        diffs = np.asarray(vectors[found], dtype=np.float32) - queries[q]
+        rows[q, :len(found)] = found
+        rows[q, len(found):] = -1
+        distances[q, :len(found)] = np.einsum('ij,ij->i', diffs, diffs)
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+
+def _search_parameters(index, deleted: Optional[np.ndarray]):
+    """Search parameters excluding the deleted rows, or None when nothing is deleted."""
+    import faiss
+
+    if deleted is None:
+        return None
+    # Bit i set = row i may be returned; the array must outlive the search,
+    # so it is kept on the parameters object
+    bitmap = np.packbits(~deleted, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(deleted), faiss.swig_ptr(bitmap))
+    # Parameters replace the index's own settings, so the knobs are repeated
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=config.FAISS_HNSW_EF_SEARCH)
+    else:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=config.FAISS_IVF_NPROBE)
+    params.bitmap = bitmap
+    params.selector = selector
+    return params
+
+
+def index_path(directory: str, name: str, index_type: str) -> str:
+    return os.path.join(directory, f"{name}.{index_type}.faiss")
+
+
+def find_index(directory: str, name: str) -> Optional[str]:
+    """Type of the index stored for a segment, or None if it has none."""
+    for index_type in INDEX_TYPES[1:]:
+        if os.path.exists(index_path(directory, name, index_type)):
+            return index_type
+    return None
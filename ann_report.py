@@ -0,0 +1,149 @@
+"""
+Recall-vs-latency report for the ANN index types.
+
+Builds every index type over the vectors of an existing local index (or a
+synthetic corpus) and compares it against exact search: recall@k, per-query
+latency, build time and index size. Held-out rows serve as queries.
+
+    python ann_report.py                          # vectors from FAISS_INDEX_PATH
+    python ann_report.py --synthetic 200000 --dim 384
+    python ann_report.py --sweep --json report.json
+"""
+import argparse
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+import config
+from ann_index import build_index, search_index, INDEX_TYPES
+
+# Search-time settings tried with --sweep
+HNSW_EF_SEARCH_SWEEP = (16, 32, 64, 128, 256)
+IVF_NPROBE_SWEEP = (1, 4, 16, 64)
+
+
+def load_store_vectors(path: str) -> np.ndarray:
+    """Live vectors of a segment store, concatenated."""
+    from segment_store import SegmentStore
+
+    store = SegmentStore(path)
+    parts = []
+    for segment in store._segments:
+        mask = segment.deleted_mask(store._deleted)
+        parts.append(np.asarray(segment.vectors) if mask is None else np.asarray(segment.vectors)[~mask])
+    if not parts:
+        raise ValueError(f"No vectors found in {path}")
+    return np.concatenate(parts)
+
+
+def synthetic_vectors(count: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """Clustered, normalized vectors resembling sentence embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 500), dimension))
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.6 * rng.normal(size=(count, dimension))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def _measure(search, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict:
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, rows = search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(rows[0])
+    recall = np.mean([
+        len(set(rows.tolist()) & set(expected.tolist())) / k for rows, expected in zip(found, truth)
+    ])
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'recall': round(float(recall), 4),
+        'latency_ms_mean': round(float(latencies.mean()), 3),
+        'latency_ms_p95': round(float(np.percentile(latencies, 95)), 3)
+    }
+
+
+def run_report(vectors: np.ndarray, query_count: int, k: int, index_types: List[str], sweep: bool) -> List[Dict]:
+    import faiss
+
+    rng = np.random.default_rng(1)
+    held_out = rng.choice(len(vectors), size=min(query_count, len(vectors) // 10), replace=False)
+    queries = np.ascontiguousarray(vectors[held_out])
+    base = np.ascontiguousarray(np.delete(vectors, held_out, axis=0))
+    _, truth = faiss.knn(queries, base, k)
+
+    rows = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(base, index_type)
+        build_seconds = time.perf_counter() - start
+
+        if index is None:
+            size = base.nbytes
+            search = lambda q, n: faiss.knn(q, base, n)
+        else:
+            size = len(faiss.serialize_index(index))
+            search = lambda q, n, index=index, index_type=index_type: search_index(index, index_type, base, q, n)
+
+        settings = [None]
+        if sweep and index_type == 'hnsw':
+            settings = [('efSearch', ef) for ef in HNSW_EF_SEARCH_SWEEP]
+        elif sweep and index is not None:
+            settings = [('nprobe', nprobe) for nprobe in IVF_NPROBE_SWEEP]
+
+        for setting in settings:
+            if setting is not None:
+                name, value = setting
+                if name == 'efSearch':
+                    index.hnsw.efSearch = value
+                else:
+                    faiss.extract_index_ivf(index).nprobe = value
+            row = {
+                'index_type': index_type,
+                'setting': f"{setting[0]}={setting[1]}" if setting else 'default',
+                'build_seconds': round(build_seconds, 2),
+                'index_mb': round(size / 2 ** 20, 1)
+            }
+            row.update(_measure(search, queries, truth, k))
+            rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", default=config.FAISS_INDEX_PATH, help="Segment store to read vectors from")
+    parser.add_argument("--synthetic", type=int, help="Use this many synthetic vectors instead of a store")
+    parser.add_argument("--dim", type=int, default=384, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of held-out query vectors")
+    parser.add_argument("--k", type=int, default=config.TOP_K_RESULTS, help="Neighbours per query")
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="Comma-separated index types")
+    parser.add_argument("--sweep", action="store_true", help="Vary efSearch / nprobe for each ANN type")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        vectors = load_store_vectors(args.index_path)
+
+    rows = run_report(vectors, args.queries, args.k, args.types.split(","), args.sweep)
+
+    print(f"{len(vectors)} vectors, dim {vectors.shape[1]}, recall@{args.k}")
+    print(f"{'type':<7} {'setting':<13} {'recall':>7} {'mean ms':>8} {'p95 ms':>8} {'build s':>8} {'MB':>7}")
+    for row in rows:
+        print(
+            f"{row['index_type']:<7} {row['setting']:<13} {row['recall']:>7.3f} "
+            f"{row['latency_ms_mean']:>8.3f} {row['latency_ms_p95']:>8.3f} "
+            f"{row['build_seconds']:>8.2f} {row['index_mb']:>7.1f}"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({'vectors': len(vectors), 'dimension': int(vectors.shape[1]), 'k': args.k, 'results': rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Semantic answer cache for the RAG pipeline.
+
+Answers are keyed on the question embedding: a new question whose embedding
+is close enough (cosine similarity) to a cached one, asked against the same
+documents and the same index version, is answered from the cache without a
+retrieval or LLM round-trip.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import numpy as np
+
+import config
+
+
+class SemanticAnswerCache:
+    """In-memory LRU/TTL cache of RAG results keyed by question embedding."""
+
+    def __init__(self, threshold: float = None, max_entries: int = None, ttl_seconds: float = None):
+        self.threshold = threshold or config.ANSWER_CACHE_THRESHOLD
+        self.max_entries = max_entries or config.ANSWER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or config.ANSWER_CACHE_TTL_SECONDS
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._index_version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, index_version):
+        # Any change to the corpus invalidates every cached answer
+        if index_version != self._index_version:
+            self._entries.clear()
+            self._index_version = index_version
+
+    def lookup(self, question_vector, scope: Hashable, index_version) -> Optional[Dict]:
+        """
+        Find a cached result for a semantically equivalent question.
+
+        Args:
+            question_vector: Embedding of the question
+            scope: Hashable description of the documents/filters/top_k the
+                answer must have been computed for
+            index_version: Current version of the vector index
+
+        Returns:
+            The cached result dict, or None on a miss
+        """
+        vector = _normalize(question_vector)
+        now = time.time()
+        with self._lock:
+            self._check_version(index_version)
+
+            best_key, best_similarity = None, self.threshold
+            for key, entry in list(self._entries.items()):
+                if now - entry['created_at'] > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                if entry['scope'] != scope:
+                    continue
+                similarity = float(np.dot(vector, entry['vector']))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key]['result']
+
+    def store(self, question_vector, scope: Hashable, index_version, result: Dict):
+        """Cache a result, evicting the least recently used entry when full."""
+        with self._lock:
+            # A result computed before the corpus changed is already stale
+            if self._index_version is not None and index_version < self._index_version:
+                return
+            self._check_version(index_version)
+            self._entries[self._next_key] = {
+                'vector': _normalize(question_vector),
+                'scope': scope,
+                'result': result,
+                'created_at': time.time()
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def cache_scope(top_k: int, filters: Dict = None) -> Hashable:
+    """Hashable scope key for a query's retrieval settings and document filters."""
+    if not filters:
+        return (top_k, None)
+    return (top_k, tuple(sorted(
+        (key, tuple(sorted(value)) if key == 'doc_ids' else tuple(value))
+        for key, value in filters.items() if value is not None
+    )))
@@ -2,11 +2,9 @@
 Streamlit web application for LegalEagle RAG system.
 """
 import streamlit as st
-import os
-from pdf_processor import PDFProcessor
-from vector_store import VectorStoreManager
-from rag_pipeline import RAGPipeline
 import config
+import metrics
+import resources
 
 # Page configuration
 st.set_page_config(
@@ -22,40 +20,62 @@ if 'rag_pipeline' not in st.session_state:
     st.session_state.rag_pipeline = None
 if 'documents_loaded' not in st.session_state:
     st.session_state.documents_loaded = False
+if 'last_timings' not in st.session_state:
+    st.session_state.last_timings = None
+
+# Prometheus endpoint, started once per process
+if config.METRICS_PORT:
+    metrics.start_http_server(config.METRICS_PORT)
 
 
 def load_documents(pdf_files):
     """Load and process PDF documents."""
     with st.spinner("Processing documents..."):
         try:
+            # Imported lazily so the landing page renders without loading torch/langchain
+            from pdf_processor import PDFProcessor
+            from ingestion import IngestionPipeline
+            
             processor = PDFProcessor()
-            all_chunks = []
+            # Embedding model and index are loaded once per process and shared
+            vector_store_manager = resources.get_vector_store()
             
-            for pdf_file in pdf_files:
-                # Save uploaded file temporarily
-                with open(f"temp_{pdf_file.name}", "wb") as f:
-                    f.write(pdf_file.getbuffer())
-                
-                # Extract and chunk text
-                text_with_pages = processor.extract_text_from_pdf(f"temp_{pdf_file.name}")
-                chunks = processor.chunk_text(text_with_pages)
-                all_chunks.extend(chunks)
-                
-                # Clean up temp file
-                os.remove(f"temp_{pdf_file.name}")
+            # Extract, chunk and embed uploads as a pipeline, straight from memory
+            progress_text = st.empty()
             
-            # Initialize vector store and add documents
-            vector_store_manager = VectorStoreManager()
-            vector_store_manager.add_documents(all_chunks)
+            def report_progress(stats):
+                progress_text.text(
+                    f"Indexed batch {stats['batches']}: "
+                    f"{stats['chunks']} chunks from {stats['pages']} pages"
+                )
             
-            # Initialize RAG pipeline
-            rag_pipeline = RAGPipeline(vector_store_manager)
+            pipeline = IngestionPipeline(processor, vector_store_manager)
+            stats = pipeline.run(
+                [(pdf_file.name, pdf_file.getvalue()) for pdf_file in pdf_files],
+                progress_callback=report_progress
+            )
+            progress_text.empty()
+            
+            # Shared RAG pipeline (reuses the same LLM client across sessions)
+            rag_pipeline = resources.get_rag_pipeline()
+            if rag_pipeline.clause_digest is not None:
+                # Answer the standard questions for new or changed documents
+                rag_pipeline.clause_digest.refresh_in_background(rag_pipeline)
             
             st.session_state.vector_store = vector_store_manager
             st.session_state.rag_pipeline = rag_pipeline
             st.session_state.documents_loaded = True
             
-            st.success(f"Successfully processed {len(pdf_files)} document(s) with {len(all_chunks)} chunks!")
+            st.success(f"Successfully processed {len(pdf_files)} document(s) with {stats['chunks']} chunks!")
+            if stats['skipped']:
+                st.info(f"{stats['skipped']} unchanged document(s) were already indexed and skipped.")
+            if stats['replaced']:
+                st.info(f"Replaced {stats['replaced']} older version(s) of re-uploaded documents.")
+            st.caption(
+                f"Embedding cache: {stats['cache_hits']} hits, "
+                f"{stats['cache_misses']} misses"
+                + (f" · embedded {stats['chunks_per_second']:.0f} chunks/sec" if stats['embedded_chunks'] else "")
+            )
             return True
         
         except Exception as e:
@@ -63,6 +83,16 @@ def load_documents(pdf_files):
             return False
 
 
+def format_timings(trace: dict, depth: int = 0) -> str:
+    """Render a metrics trace as a nested markdown list."""
+    attributes = ", ".join(f"{key}={value}" for key, value in trace['attributes'].items())
+    calls = f" ×{trace['calls']}" if trace.get('calls') else ""
+    line = f"{'    ' * depth}- **{trace['name']}**{calls}: {trace['ms']:.1f} ms"
+    if attributes:
+        line += f" ({attributes})"
+    return "\n".join([line] + [format_timings(child, depth + 1) for child in trace['children']])
+
+
 def main():
     st.title("⚖️ LegalEagle - Legal Contract RAG System")
     st.markdown("**Retrieval-Augmented Generation for Legal Contract Analysis**")
@@ -128,38 +158,72 @@ def main():
         placeholder="e.g., What is the termination clause? What are the confidentiality obligations?"
     )
     
+    # Optional restriction to specific contracts (filtered inside the index)
+    documents = st.session_state.vector_store.list_documents()
+    selected_docs = []
+    if len(documents) > 1:
+        selected_docs = st.multiselect(
+            "Limit search to document(s):",
+            options=list(documents),
+            format_func=lambda doc_id: documents[doc_id].get('filename', doc_id)
+        )
+    filters = {'doc_ids': selected_docs} if selected_docs else None
+    
     if st.button("🔍 Search", type="primary") or query:
         if query:
-            with st.spinner("Searching and generating answer..."):
-                try:
-                    result = st.session_state.rag_pipeline.query(query)
+            try:
+                # Reruns (e.g. opening the expander) re-render the memoized
+                # result instead of running retrieval and the LLM again
+                memo_key = resources.query_key(query, filters=filters)
+                result = resources.get_memoized(memo_key)
+                
+                st.markdown("### 📝 Answer")
+                if result is None:
+                    with st.spinner("Searching..."):
+                        streamed = st.session_state.rag_pipeline.stream_query(query, filters=filters)
                     
-                    # Display answer
-                    st.markdown("### 📝 Answer")
+                    # Display answer progressively as tokens arrive
+                    answer = st.write_stream(streamed.pop('answer_stream'))
+                    # The trace is complete once the stream has been consumed
+                    trace = streamed.pop('trace')
+                    result = {**streamed, 'answer': answer, 'timings': trace.to_dict()}
+                    resources.memoize(memo_key, result)
+                else:
                     st.markdown(result['answer'])
-                    
-                    # Display citations
-                    if result['citations']:
-                        st.markdown("### 📚 Citations")
-                        citation_text = ", ".join([f"Page {p}" for p in result['citations']])
-                        st.info(f"**Referenced Pages:** {citation_text}")
-                    
-                    # Display source excerpts
-                    with st.expander("🔍 View Source Excerpts"):
-                        for i, source in enumerate(result['sources'], 1):
-                            st.markdown(f"**Excerpt {i} (Page {source['page']})**")
-                            st.markdown(f"Similarity Score: {source['similarity_score']:.4f}")
-                            st.text_area(
-                                f"Text Preview",
-                                source['text_preview'],
-                                key=f"excerpt_{i}",
-                                height=100,
-                                disabled=True
-                            )
-                            st.markdown("---")
+                if result.get('from_digest'):
+                    st.caption("⚡ Served from the clause digest")
+                elif result.get('from_cache'):
+                    st.caption("⚡ Served from the answer cache")
+                st.session_state.last_timings = result.get('timings')
+                
+                # Display citations
+                if result['citations']:
+                    st.markdown("### 📚 Citations")
+                    citation_text = ", ".join([f"Page {p}" for p in result['citations']])
+                    st.info(f"**Referenced Pages:** {citation_text}")
                 
-                except Exception as e:
-                    st.error(f"Error processing query: {str(e)}")
+                # Display source excerpts
+                with st.expander("🔍 View Source Excerpts"):
+                    for i, source in enumerate(result['sources'], 1):
+                        st.markdown(f"**Excerpt {i} (Page {source['page']})**")
+                        # FAISS reports a distance, Pinecone a cosine similarity
+                        if config.VECTOR_STORE_TYPE == "pinecone":
+                            st.markdown(f"Cosine Similarity: {source['similarity_score']:.4f}")
+                        else:
+                            st.markdown(f"Vector Distance (lower is closer): {source['similarity_score']:.4f}")
+                        if source.get('fused_score') is not None:
+                            st.markdown(f"Hybrid Rank Score: {source['fused_score']:.4f}")
+                        st.text_area(
+                            f"Text Preview",
+                            source['text_preview'],
+                            key=f"excerpt_{i}",
+                            height=100,
+                            disabled=True
+                        )
+                        st.markdown("---")
+            
+            except Exception as e:
+                st.error(f"Error processing query: {str(e)}")
         else:
             st.warning("Please enter a question.")
     
@@ -174,6 +238,9 @@ def main():
         - **Chunk Overlap:** {config.CHUNK_OVERLAP}
         - **Top K Results:** {config.TOP_K_RESULTS}
         """)
+        if st.session_state.last_timings:
+            st.markdown("**Last query, per stage:**")
+            st.markdown(format_timings(st.session_state.last_timings))
 
 
 if __name__ == "__main__":
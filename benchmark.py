@@ -0,0 +1,422 @@
+"""
+End-to-end benchmark for LegalEagle.
+
+Generates a synthetic corpus of multi-page contract PDFs and times every
+stage of the pipeline against a throwaway index:
+
+    extract            PDFProcessor.extract_text_from_pdf, per document
+    chunk              PDFProcessor.chunk_text, per document
+    embed              embedding model, per ingest batch (fills the embedding cache)
+    add_documents      VectorStoreManager.add_documents, per batch (cache hits,
+                       so this is the indexing cost on top of embedding)
+    index_load         opening the index from disk in a new VectorStoreManager
+    similarity_search  VectorStoreManager.similarity_search, per query
+    rag_query          RAGPipeline.query with a local stub chat model, per query
+
+Each stage reports throughput, p50/p95/p99 latency and the peak RSS of the
+process once it finished. Results are written as JSON; with --baseline the
+run is compared against an earlier result file and exits non-zero if any
+stage regressed by more than --threshold.
+
+    python benchmark.py --documents 10 --pages 30 --output bench.json
+    python benchmark.py --baseline bench.json --threshold 0.2
+    python benchmark.py --embeddings hashing      # offline, no model download
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import zlib
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import config
+
+CLAUSE_TITLES = [
+    "Definitions", "Term and Termination", "Confidentiality", "Payment Terms",
+    "Indemnification", "Limitation of Liability", "Governing Law",
+    "Intellectual Property", "Representations and Warranties", "Force Majeure",
+    "Assignment", "Notices", "Dispute Resolution", "Insurance",
+    "Non-Solicitation", "Data Protection", "Audit Rights", "Severability"
+]
+
+CLAUSE_SENTENCES = [
+    "Either Party may terminate this Agreement upon {days} days prior written notice to the other Party.",
+    "The Receiving Party shall hold all Confidential Information in strict confidence for a period of {years} years.",
+    "All invoices are payable within {days} days of receipt, and late payments accrue interest at {rate} percent per month.",
+    "{party} shall indemnify and hold harmless {other} from any claims arising out of its gross negligence or wilful misconduct.",
+    "In no event shall either Party's aggregate liability exceed {amount} US dollars.",
+    "This Agreement shall be governed by the laws of the State of {state}, without regard to its conflict of laws rules.",
+    "All Intellectual Property developed under this Agreement shall vest in {party} upon full payment of the Fees.",
+    "{party} represents that it has full power and authority to enter into this Agreement.",
+    "Neither Party shall be liable for delays caused by events beyond its reasonable control, including acts of God.",
+    "{other} may not assign this Agreement without the prior written consent of {party}.",
+    "Notices shall be delivered in writing to the addresses set out in Schedule {schedule}.",
+    "Any dispute shall first be referred to senior management and, failing resolution within {days} days, to arbitration.",
+    "{party} shall maintain commercial general liability insurance of not less than {amount} US dollars.",
+    "During the Term and for {years} years thereafter, neither Party shall solicit the employees of the other.",
+    "Personal Data shall be processed only in accordance with the documented instructions of {party}.",
+    "{party} may audit the records of {other} once per calendar year on {days} days notice.",
+    "If any provision of this Agreement is held invalid, the remaining provisions remain in full force and effect."
+]
+
+PARTIES = ["Acme Holdings Inc.", "Globex Corporation", "Initech LLC", "Umbrella Partners LP", "Stark Industries Ltd."]
+STATES = ["Delaware", "New York", "California", "Texas", "Illinois"]
+
+QUESTIONS = [
+    "What is the termination notice period?",
+    "How long do confidentiality obligations last?",
+    "When are invoices payable and what is the late payment interest?",
+    "Who must indemnify whom and for what?",
+    "What is the cap on liability?",
+    "Which law governs this agreement?",
+    "Who owns the intellectual property?",
+    "Can the agreement be assigned?",
+    "How are disputes resolved?",
+    "What insurance must be maintained?",
+    "Is there a non-solicitation clause?",
+    "How is personal data handled?",
+    "What are the audit rights?",
+    "What happens if a provision is invalid?",
+    "What counts as force majeure?",
+    "Where should notices be sent?"
+]
+
+LINES_PER_PAGE = 56
+CHARS_PER_LINE = 95
+
+
+def contract_pages(pages: int, rng: random.Random) -> List[List[str]]:
+    """Text lines of a synthetic contract, one list per page."""
+    party, other = rng.sample(PARTIES, 2)
+    lines = [
+        f"MASTER SERVICES AGREEMENT between {party} and {other}",
+        ""
+    ]
+    section = 0
+    while len(lines) < pages * LINES_PER_PAGE:
+        section += 1
+        lines.append(f"{section}. {rng.choice(CLAUSE_TITLES).upper()}")
+        paragraph = " ".join(
+            f"{section}.{n + 1} " + rng.choice(CLAUSE_SENTENCES).format(
+                days=rng.choice([10, 15, 30, 45, 60, 90]),
+                years=rng.choice([1, 2, 3, 5, 7]),
+                rate=rng.choice([1, 1.5, 2]),
+                amount=f"{rng.randrange(1, 50) * 100000:,}",
+                state=rng.choice(STATES),
+                schedule=rng.choice("ABCDE"),
+                party=party,
+                other=other
+            )
+            for n in range(rng.randint(2, 6))
+        )
+        # Greedy word wrap
+        line = ""
+        for word in paragraph.split():
+            if len(line) + len(word) + 1 > CHARS_PER_LINE:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    lines = lines[:pages * LINES_PER_PAGE]
+    return [lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE)]
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """Write a minimal text-only PDF (Helvetica, US Letter), one page per line list."""
+    def escape(text: str) -> str:
+        return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    page_count = len(pages)
+    # Object numbers: 1 catalog, 2 page tree, 3 font, then a page and a content stream per page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        (
+            "<< /Type /Pages /Count %d /Kids [%s] >>"
+            % (page_count, " ".join(f"{4 + 2 * i} 0 R" for i in range(page_count)))
+        ).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    ]
+    for i, lines in enumerate(pages):
+        content = "BT /F1 10 Tf 12 TL 50 750 Td " + " ".join(
+            f"({escape(line)}) '" for line in lines
+        ) + " ET"
+        content = content.encode("latin-1", errors="replace")
+        objects.append(
+            (
+                "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                "/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i)
+            ).encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def generate_corpus(directory: str, documents: int, pages: int, seed: int = 0) -> List[str]:
+    """Write synthetic contract PDFs and return their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(directory, f"contract-{i + 1:03d}.pdf")
+        write_pdf(path, contract_pages(pages, rng))
+        paths.append(path)
+    return paths
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic feature-hashing embeddings for offline benchmark runs."""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        from lexical_index import tokenize
+
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in tokenize(text):
+            h = zlib.crc32(token.encode())
+            vector[h % self.dimension] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+class StageTimer:
+    """Collects per-item latencies and work counts for each stage."""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict] = {}
+
+    def time(self, stage: str, fn: Callable, units: int = 1, unit: str = "items"):
+        """Run fn, record its latency against stage and return its result."""
+        entry = self.stages.setdefault(stage, {'latencies': [], 'units': 0, 'unit': unit})
+        start = time.perf_counter()
+        result = fn()
+        entry['latencies'].append(time.perf_counter() - start)
+        entry['units'] += units
+        entry['peak_rss_mb'] = peak_rss_mb()
+        return result
+
+    def summary(self) -> Dict[str, Dict]:
+        summary = {}
+        for stage, entry in self.stages.items():
+            latencies = np.asarray(entry['latencies']) * 1000
+            total = float(latencies.sum()) / 1000
+            summary[stage] = {
+                'calls': len(latencies),
+                'total_seconds': round(total, 4),
+                'throughput': round(entry['units'] / total, 2) if total else None,
+                'throughput_unit': f"{entry['unit']}/s",
+                'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+                'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+                'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+                'peak_rss_mb': round(entry['peak_rss_mb'], 1)
+            }
+        return summary
+
+
+def run_benchmark(args) -> Dict:
+    from pdf_processor import PDFProcessor, document_identity
+    from rag_pipeline import RAGPipeline
+    from stub_llm import StubChatModel
+    from vector_store import VectorStoreManager
+
+    workdir = tempfile.mkdtemp(prefix="legaleagle-bench-")
+    # Point the index and embedding cache at the scratch directory and keep
+    # the answer cache out of the way so every query runs end to end; the
+    # index is always local, even with a retrieval service configured
+    config.VECTOR_STORE_TYPE = "faiss"
+    config.RETRIEVAL_SERVICE_URL = ""
+    config.FAISS_INDEX_PATH = os.path.join(workdir, "faiss_index")
+    config.EMBEDDING_CACHE_PATH = os.path.join(workdir, "embedding_cache.sqlite")
+    # Extraction is measured on the PDFs themselves, not on cached text
+    config.TEXT_CACHE_ENABLED = False
+    config.ANSWER_CACHE_ENABLED = False
+
+    def make_embeddings():
+        return HashingEmbeddings() if args.embeddings == "hashing" else None
+
+    timer = StageTimer()
+    try:
+        corpus_dir = os.path.join(workdir, "corpus")
+        os.makedirs(corpus_dir)
+        paths = generate_corpus(corpus_dir, args.documents, args.pages, args.seed)
+
+        processor = PDFProcessor()
+        chunks = []
+        for path in paths:
+            with open(path, "rb") as f:
+                identity = document_identity(os.path.basename(path), f.read())
+            pages = timer.time(
+                "extract", lambda: processor.extract_text_from_pdf(path), units=args.pages, unit="pages"
+            )
+            doc_chunks = timer.time(
+                "chunk", lambda: processor.chunk_text(pages, identity), units=len(pages), unit="pages"
+            )
+            chunks.extend(doc_chunks)
+
+        manager = VectorStoreManager(embeddings=make_embeddings())
+        batches = [chunks[i:i + config.INGEST_BATCH_SIZE] for i in range(0, len(chunks), config.INGEST_BATCH_SIZE)]
+        for batch in batches:
+            timer.time(
+                "embed",
+                lambda: manager.embeddings.embed_documents([chunk['text'] for chunk in batch]),
+                units=len(batch),
+                unit="chunks"
+            )
+        for batch in batches:
+            timer.time("add_documents", lambda: manager.add_documents(batch), units=len(batch), unit="chunks")
+        manager.vector_store.wait_for_compaction()
+
+        for _ in range(args.loads):
+            manager = timer.time(
+                "index_load", lambda: VectorStoreManager(embeddings=make_embeddings()), unit="loads"
+            )
+
+        rng = random.Random(args.seed)
+        questions = [rng.choice(QUESTIONS) for _ in range(args.queries)]
+        rag = RAGPipeline(manager, llm=StubChatModel(latency_seconds=args.llm_latency))
+        # Untimed warm-up so one-off imports and first-touch page faults are not counted
+        for question in QUESTIONS[:args.warmup]:
+            rag.query(question)
+
+        for question in questions:
+            timer.time("similarity_search", lambda: manager.similarity_search(question), unit="queries")
+
+        for question in questions:
+            timer.time("rag_query", lambda: rag.query(question), unit="queries")
+
+        return {
+            'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'parameters': {
+                'documents': args.documents,
+                'pages_per_document': args.pages,
+                'chunks': len(chunks),
+                'queries': args.queries,
+                'embeddings': args.embeddings,
+                'embedding_model': config.EMBEDDING_MODEL if args.embeddings == "model" else "hashing",
+                'llm_latency_seconds': args.llm_latency,
+                'chunk_size': config.CHUNK_SIZE,
+                'top_k': config.TOP_K_RESULTS,
+                'index_type': config.FAISS_INDEX_TYPE,
+                'hybrid_search': config.HYBRID_SEARCH
+            },
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count()
+            },
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stages': timer.summary()
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def find_regressions(result: Dict, baseline: Dict, metric: str, threshold: float) -> List[str]:
+    """Stages whose metric grew by more than threshold (a fraction) over the baseline."""
+    regressions = []
+    for stage, current in result['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous or not previous.get(metric):
+            continue
+        change = current[metric] / previous[metric] - 1
+        if change > threshold:
+            regressions.append(
+                f"{stage}: {metric} {previous[metric]:.3f} -> {current[metric]:.3f} ({change:+.0%})"
+            )
+    return regressions
+
+
+def print_report(result: Dict):
+    params = result['parameters']
+    print(
+        f"{params['documents']} documents x {params['pages_per_document']} pages, "
+        f"{params['chunks']} chunks, {params['queries']} queries, embeddings: {params['embedding_model']}"
+    )
+    print(f"{'stage':<18} {'calls':>6} {'throughput':>18} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS MB':>8}")
+    for stage, s in result['stages'].items():
+        throughput = f"{s['throughput']:.1f} {s['throughput_unit']}" if s['throughput'] else "-"
+        print(
+            f"{stage:<18} {s['calls']:>6} {throughput:>18} {s['p50_ms']:>9.2f} "
+            f"{s['p95_ms']:>9.2f} {s['p99_ms']:>9.2f} {s['peak_rss_mb']:>8.1f}"
+        )
+    print(f"Peak RSS: {result['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=5, help="Number of synthetic contracts")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per contract")
+    parser.add_argument("--queries", type=int, default=50, help="Queries for the search and RAG stages")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed queries run before the query stages")
+    parser.add_argument("--loads", type=int, default=3, help="Times the index is reopened for index_load")
+    parser.add_argument("--embeddings", choices=["model", "hashing"], default="model",
+                        help="Configured sentence-transformers model, or offline hashing embeddings")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated stub LLM latency in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the result JSON to this file")
+    parser.add_argument("--baseline", help="Earlier result JSON to compare against")
+    parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms"],
+                        help="Latency metric compared against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown per stage before failing, as a fraction (0.2 = 20%%)")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch corpus and index")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    print_report(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('parameters') != result['parameters']:
+            print("\nWarning: baseline was run with different parameters; comparison may be misleading")
+        regressions = find_regressions(result, baseline, args.metric, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo stage regressed beyond {args.threshold:.0%} ({args.metric}).")
+
+
+if __name__ == "__main__":
+    main()
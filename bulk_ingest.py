@@ -0,0 +1,306 @@
+"""
+Headless bulk ingestion of a directory tree of PDFs.
+
+Files are read in groups and each group goes through the streaming
+IngestionPipeline: extraction on a pool of worker processes, chunking, then
+batched embedding and index writes (--batch-size chunks per write, across
+files). After every group the paths and content hashes of its files are
+added to a
+checkpoint manifest, so an interrupted run resumes with the first group that
+did not finish; files already in the checkpoint are skipped without being
+parsed. A file that fails to parse is recorded as failed and the run goes on.
+
+    python bulk_ingest.py /data/room
+    python bulk_ingest.py /data/room --workers 8 --batch-size 512
+    python bulk_ingest.py /data/room --checkpoint room.checkpoint.json --restart
+
+After changing the chunking settings, --reindex rebuilds the chunks and
+embeddings of everything already indexed from the extracted-text cache,
+without a directory and without parsing any PDF:
+
+    python bulk_ingest.py --reindex
+
+With --digest, the standard questions (CLAUSE_DIGEST_QUESTIONS) are then
+answered for every new or changed document, so the app can serve them from
+the clause digest (this calls the LLM).
+
+With RETRIEVAL_SERVICE_URL set, the index writes go through the shared
+retrieval service rather than into the index directory directly.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import config
+
+CHECKPOINT_VERSION = 2
+
+
+def find_pdfs(root: str) -> List[str]:
+    """Paths of the PDF files under root, relative to it, in sorted order."""
+    paths = []
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(".pdf"):
+                paths.append(os.path.relpath(os.path.join(directory, filename), root))
+    return paths
+
+
+class Checkpoint:
+    """
+    Manifest of the files already ingested, keyed by relative path and
+    content hash: every path is its own document, so a byte-identical copy at
+    another path is ingested wherever it falls in the grouping.
+    """
+
+    def __init__(self, path: str, root: str, restart: bool = False):
+        """
+        Args:
+            path: Manifest file; created on the first save
+            root: Directory being ingested (recorded for reference)
+            restart: Ignore an existing manifest
+        """
+        self.path = path
+        self.data = {'version': CHECKPOINT_VERSION, 'root': os.path.abspath(root), 'completed': {}, 'failed': {}}
+        if not restart and os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+            if self.data.get('version') == 1:
+                # Version 1 keyed completed files by content hash alone
+                self.data['completed'] = {
+                    _checkpoint_key(entry['path'], content_hash): entry
+                    for content_hash, entry in self.data['completed'].items()
+                }
+                self.data['version'] = CHECKPOINT_VERSION
+            if self.data.get('version') != CHECKPOINT_VERSION:
+                raise ValueError(f"Unsupported checkpoint version in {path}; rerun with --restart")
+
+    def is_done(self, path: str, content_hash: str) -> bool:
+        return _checkpoint_key(path, content_hash) in self.data['completed']
+
+    def mark_done(self, files: List[Tuple[str, str]]):
+        """Record (relative path, content hash) pairs as ingested and save."""
+        for path, content_hash in files:
+            self.data['completed'][_checkpoint_key(path, content_hash)] = {'path': path, 'at': time.time()}
+            self.data['failed'].pop(path, None)
+        self.save()
+
+    def mark_failed(self, path: str, content_hash: str, error: str):
+        self.data['failed'][path] = {'content_hash': content_hash, 'error': error}
+        self.save()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def iter_groups(
+    root: str,
+    paths: List[str],
+    checkpoint: Checkpoint,
+    files_per_group: int,
+    max_group_bytes: int,
+    on_skip: Callable[[str], None]
+) -> Iterator[List[Tuple[str, bytes, str]]]:
+    """
+    Read files into groups of (relative path, content, content hash), leaving
+    out files the checkpoint already has.
+    """
+    group, group_bytes = [], 0
+    for path in paths:
+        with open(os.path.join(root, path), "rb") as f:
+            content = f.read()
+        content_hash = hashlib.sha256(content).hexdigest()
+        if checkpoint.is_done(path, content_hash):
+            on_skip(path)
+            continue
+        group.append((path, content, content_hash))
+        group_bytes += len(content)
+        if len(group) >= files_per_group or group_bytes >= max_group_bytes:
+            yield group
+            group, group_bytes = [], 0
+    if group:
+        yield group
+
+
+def ingest_directory(
+    root: str,
+    pipeline,
+    checkpoint: Checkpoint,
+    files_per_group: int = None,
+    max_group_bytes: int = None,
+    log: Callable[[str], None] = print
+) -> Dict:
+    """
+    Ingest every PDF under root that the checkpoint does not list yet.
+
+    Args:
+        root: Directory tree to ingest
+        pipeline: ingestion.IngestionPipeline writing to the target index
+        checkpoint: Manifest of completed files, updated after every group
+        files_per_group: Files per pipeline run / checkpoint (defaults to BULK_FILES_PER_GROUP)
+        max_group_bytes: Also end a group once its PDFs reach this size (defaults to BULK_MAX_GROUP_MB)
+        log: Progress output
+
+    Returns:
+        Dictionary with 'files' (found), 'ingested', 'skipped', 'failed',
+        'pages', 'chunks' and 'seconds'
+    """
+    files_per_group = files_per_group or config.BULK_FILES_PER_GROUP
+    max_group_bytes = max_group_bytes or config.BULK_MAX_GROUP_MB * 2 ** 20
+    paths = find_pdfs(root)
+    stats = {'files': len(paths), 'ingested': 0, 'skipped': 0, 'failed': 0, 'pages': 0, 'chunks': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+
+    def skip(path: str):
+        stats['skipped'] += 1
+
+    def run(group: List[Tuple[str, bytes, str]]):
+        result = pipeline.run([(path, content) for path, content, _ in group])
+        stats['pages'] += result['pages']
+        stats['chunks'] += result['chunks']
+        stats['ingested'] += len(group)
+        checkpoint.mark_done([(path, content_hash) for path, _, content_hash in group])
+
+    for group in iter_groups(root, paths, checkpoint, files_per_group, max_group_bytes, skip):
+        try:
+            run(group)
+        except Exception as e:
+            if len(group) == 1:
+                path, _, content_hash = group[0]
+                stats['failed'] += 1
+                checkpoint.mark_failed(path, content_hash, str(e))
+                log(f"  failed: {path}: {e}")
+            else:
+                # Find the bad file(s) by ingesting the group file by file
+                for item in group:
+                    try:
+                        run([item])
+                    except Exception as item_error:
+                        stats['failed'] += 1
+                        checkpoint.mark_failed(item[0], item[2], str(item_error))
+                        log(f"  failed: {item[0]}: {item_error}")
+
+        stats['seconds'] = time.perf_counter() - start
+        done = stats['ingested'] + stats['skipped'] + stats['failed']
+        log(
+            f"[{done}/{stats['files']}] {stats['ingested']} ingested, {stats['skipped']} skipped, "
+            f"{stats['failed']} failed - {stats['pages']} pages, {stats['chunks']} chunks, "
+            f"{stats['ingested'] / stats['seconds']:.2f} files/s"
+        )
+
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", help="Directory tree of PDF files")
+    parser.add_argument("--reindex", action="store_true",
+                        help="Re-chunk and re-embed the indexed documents from the text cache instead")
+    parser.add_argument("--digest", action="store_true",
+                        help="Then answer the standard questions for new or changed documents")
+    parser.add_argument("--checkpoint", help="Checkpoint manifest (default: <directory name>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--workers", type=int, default=config.PDF_EXTRACT_WORKERS or None,
+                        help="PDF extraction processes (default: one per CPU core)")
+    parser.add_argument("--batch-size", type=int, default=config.BULK_BATCH_SIZE,
+                        help="Chunks embedded and written to the index per batch")
+    parser.add_argument("--files-per-group", type=int, default=config.BULK_FILES_PER_GROUP,
+                        help="Files per checkpoint")
+    args = parser.parse_args()
+
+    if not args.reindex and (args.directory is None or not os.path.isdir(args.directory)):
+        parser.error(f"{args.directory} is not a directory" if args.directory else "a directory is required")
+
+    # Heavy imports only once the arguments are valid
+    from ingestion import IngestionPipeline
+    from pdf_processor import PDFProcessor
+    from vector_store import VectorStoreManager
+
+    manager = VectorStoreManager()
+    pipeline = IngestionPipeline(
+        PDFProcessor(), manager, batch_size=args.batch_size, extract_workers=args.workers
+    )
+    if args.reindex:
+        _reindex(pipeline, manager)
+        return
+
+    checkpoint_path = args.checkpoint or (
+        os.path.basename(os.path.abspath(args.directory)) + ".checkpoint.json"
+    )
+    checkpoint = Checkpoint(checkpoint_path, args.directory, restart=args.restart)
+
+    try:
+        stats = ingest_directory(args.directory, pipeline, checkpoint, args.files_per_group)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted; rerun the same command to resume from {checkpoint_path}")
+        sys.exit(130)
+    finally:
+        _wait_for_compaction(manager)
+
+    seconds = max(stats['seconds'], 1e-9)
+    print(
+        f"\nIngested {stats['ingested']} of {stats['files']} files in {stats['seconds']:.1f} s "
+        f"({stats['skipped']} already done, {stats['failed']} failed)"
+    )
+    print(
+        f"{stats['ingested'] / seconds:.2f} files/s, {stats['pages'] / seconds:.1f} pages/s, "
+        f"{stats['chunks'] / seconds:.1f} chunks/s"
+    )
+    print(f"Checkpoint: {checkpoint_path}")
+    if args.digest:
+        _refresh_digest(manager)
+    if stats['failed']:
+        sys.exit(1)
+
+
+def _checkpoint_key(path: str, content_hash: str) -> str:
+    return f"{content_hash}:{path}"
+
+
+def _reindex(pipeline, manager):
+    start = time.perf_counter()
+    try:
+        stats = pipeline.reindex()
+    finally:
+        _wait_for_compaction(manager)
+    seconds = max(time.perf_counter() - start, 1e-9)
+    print(
+        f"Re-indexed {stats['documents']} documents in {seconds:.1f} s: {stats['pages']} pages, "
+        f"{stats['chunks']} chunks ({stats['cache_hits']} embeddings from the cache)"
+    )
+    print(f"{stats['pages'] / seconds:.1f} pages/s, {stats['chunks'] / seconds:.1f} chunks/s")
+    if stats['missing']:
+        print(f"{stats['missing']} documents have no cached text; ingest their PDFs again to rebuild them")
+
+
+def _refresh_digest(manager):
+    from clause_digest import ClauseDigest
+    from rag_pipeline import RAGPipeline
+
+    start = time.perf_counter()
+    stats = ClauseDigest(manager).refresh(RAGPipeline(manager))
+    print(
+        f"Clause digest: {stats['answers']} answers for {stats['documents']} documents "
+        f"in {time.perf_counter() - start:.1f} s ({stats['failed']} failed, retried on the next run)"
+    )
+
+
+def _wait_for_compaction(manager):
+    if manager.store_type not in ("pinecone", "service"):
+        # Let a background segment merge finish rather than abandon it
+        manager.vector_store.wait_for_compaction()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Clause-aware chunking of whole contracts.
+
+The pages of a document are joined into one text buffer and split where
+clauses start (ARTICLE / Section headings, numbered clauses, lettered
+sub-clauses, recitals, all-caps headings), so a clause continuing on the next
+page stays in one chunk. Consecutive short clauses are packed together up to
+the chunk size; only clauses longer than that are cut, at paragraph, sentence
+or word boundaries, with overlap.
+
+Chunks are (start, end) offsets into the buffer rather than copied strings,
+and each one maps to the first and last page it covers.
+"""
+import re
+from typing import List, Tuple
+
+import numpy as np
+
+import config
+
+# Lines that open a clause. Anchored on the preceding newline rather than ^
+# so the regex engine can skip ahead to candidate lines.
+CLAUSE_HEADING = re.compile(
+    r"""\n[ \t]*(?P<clause>
+        (?:ARTICLE|Article|SECTION|Section|SCHEDULE|Schedule|EXHIBIT|Exhibit|ANNEX|Annex|APPENDIX|Appendix)
+            [ \t]+[0-9IVXLC]+[A-Za-z]?\b
+      | [0-9]{1,3}\.?[ \t]+[A-Z]                # 7. Termination / 7 TERMINATION
+      | (?:WHEREAS|NOW,?[ \t]+THEREFORE|IN[ \t]+WITNESS[ \t]+WHEREOF)\b
+      | [A-Z][A-Z0-9 ,&'/-]{3,60}[ \t]*(?=\n)     # DEFINITIONS
+      | [0-9]{1,3}(?:\.[0-9]{1,3})+\.?[ \t]+\S    # 7.2 / 7.2.1
+      | \((?:[a-z]{1,2}|[ivx]{1,5}|[0-9]{1,2})\)[ \t]+\S  # (a) / (iv) / (3)
+    )""",
+    re.VERBOSE
+)
+
+# Numbered or lettered sub-clauses run into the previous sentence, as PDF
+# extraction often joins wrapped lines: "... in full force. 1.2 All ...".
+# Each pattern starts with a literal so the scan stays fast.
+INLINE_CLAUSES = (
+    re.compile(r'\. (?P<clause>[0-9]{1,3}(?:\.[0-9]{1,3})+\.? +[A-Z"])'),   # 7.2 / 7.2.1
+    re.compile(r'; (?P<clause>\((?:[a-z]|[ivx]{1,4})\) +\S)'),             # (a) / (iv)
+)
+
+# Places to cut an over-long clause, best first
+_CUT_POINTS = ("\n\n", ".\n", ". ", "; ", "\n", " ")
+_NON_SPACE = re.compile(r"\S")
+
+
+class DocumentChunks:
+    """
+    Chunks of one document as offsets into its text buffer.
+
+    Attributes:
+        text: The document's pages joined by newlines
+        starts, ends: int64 arrays; chunk i is text[starts[i]:ends[i]]
+        first_pages, last_pages: int32 arrays; pages chunk i covers
+    """
+
+    def __init__(self, text: str, starts: np.ndarray, ends: np.ndarray, page_offsets: List[int], page_numbers: List[int]):
+        self.text = text
+        self.starts = starts
+        self.ends = ends
+        page_offsets = np.asarray(page_offsets, dtype=np.int64)
+        page_numbers = np.asarray(page_numbers, dtype=np.int32)
+        self.first_pages = page_numbers[np.searchsorted(page_offsets, starts, side="right") - 1]
+        self.last_pages = page_numbers[np.searchsorted(page_offsets, ends - 1, side="right") - 1]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def chunk(self, i: int) -> str:
+        """Text of chunk i (a copy is only made here)."""
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def pages(self, i: int) -> Tuple[int, int]:
+        """First and last page of chunk i."""
+        return int(self.first_pages[i]), int(self.last_pages[i])
+
+
+class ClauseChunker:
+    """Splits documents into clause-aligned chunks of at most chunk_size characters."""
+
+    def __init__(self, chunk_size: int = None, chunk_overlap: int = None, min_chunk_size: int = None):
+        """
+        Args:
+            chunk_size: Target maximum chunk length (defaults to CHUNK_SIZE)
+            chunk_overlap: Overlap between the pieces of a clause that has to
+                be cut (defaults to CHUNK_OVERLAP)
+            min_chunk_size: Shorter chunks are merged into a neighbour, even
+                past chunk_size (defaults to CHUNK_MIN_SIZE)
+        """
+        self.chunk_size = chunk_size or config.CHUNK_SIZE
+        self.chunk_overlap = config.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+        self.min_chunk_size = config.CHUNK_MIN_SIZE if min_chunk_size is None else min_chunk_size
+        if self.chunk_overlap >= self.chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+
+    def split(self, text_with_pages: List[Tuple[str, int]]) -> DocumentChunks:
+        """
+        Chunk a document.
+
+        Args:
+            text_with_pages: (text, page_number) tuples; sorted by page here
+
+        Returns:
+            DocumentChunks over the joined text
+        """
+        pages = sorted(text_with_pages, key=lambda page: page[1])
+        page_offsets = []
+        offset = 0
+        for text, _ in pages:
+            page_offsets.append(offset)
+            offset += len(text) + 1
+        buffer = "\n".join(text for text, _ in pages)
+
+        spans = self._pack(buffer, self._clauses(buffer))
+        starts = np.fromiter((start for start, _ in spans), dtype=np.int64, count=len(spans))
+        ends = np.fromiter((end for _, end in spans), dtype=np.int64, count=len(spans))
+        return DocumentChunks(buffer, starts, ends, page_offsets, [page for _, page in pages])
+
+    def _clauses(self, buffer: str) -> List[int]:
+        """Start offsets of the clauses, ascending."""
+        clause_starts = [0]
+        clause_starts.extend(match.start("clause") for match in CLAUSE_HEADING.finditer(buffer))
+        for pattern in INLINE_CLAUSES:
+            clause_starts.extend(match.start("clause") for match in pattern.finditer(buffer))
+        clause_starts.sort()
+        return clause_starts
+
+    def _pack(self, buffer: str, clause_starts: List[int]) -> List[Tuple[int, int]]:
+        """Greedily merge consecutive clauses into chunks, cutting over-long ones."""
+        clause_starts.append(len(buffer))
+        spans = []
+        start = 0
+        i = 1
+        while i < len(clause_starts) - 1:
+            # Keep packing while the next clause still fits
+            if (clause_starts[i + 1] - start <= self.chunk_size
+                    or clause_starts[i] - start < self.min_chunk_size):
+                i += 1
+                continue
+            pieces = self._cut(buffer, start, clause_starts[i])
+            if len(pieces) > 1:
+                # The chunk held an over-long clause: its last piece stays
+                # open, so the clauses that follow are packed onto it
+                spans.extend(pieces[:-1])
+                start = pieces[-1][0]
+                continue
+            spans.extend(pieces)
+            start = clause_starts[i]
+            i += 1
+        spans.extend(self._cut(buffer, start, len(buffer)))
+        spans = [span for span in (_strip(buffer, *span) for span in spans) if span is not None]
+
+        # A short tail goes into the previous chunk
+        if len(spans) > 1 and spans[-1][1] - spans[-1][0] < self.min_chunk_size:
+            tail = spans.pop()
+            spans[-1] = (min(spans[-1][0], tail[0]), tail[1])
+        return spans
+
+    def _cut(self, buffer: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Split [start, end) into pieces of at most chunk_size, at natural breaks."""
+        if end - start <= self.chunk_size + self.min_chunk_size:
+            return [(start, end)]
+
+        pieces = []
+        while end - start > self.chunk_size + self.min_chunk_size:
+            limit = start + self.chunk_size
+            cut = limit
+            # Never cut in the first half of the window
+            floor = start + self.chunk_size // 2
+            for separator in _CUT_POINTS:
+                found = buffer.rfind(separator, floor, limit)
+                if found != -1:
+                    # Keep the full stop / semicolon with the piece it ends
+                    cut = found + len(separator.strip())
+                    break
+            piece = _strip(buffer, start, cut)
+            if piece is not None:
+                pieces.append(piece)
+
+            next_start = max(cut - self.chunk_overlap, start + 1)
+            if self.chunk_overlap:
+                # Begin the overlap on a word boundary
+                space = buffer.find(" ", next_start, cut)
+                if space != -1:
+                    next_start = space + 1
+            next_span = _strip(buffer, next_start, end)
+            if next_span is None:
+                return pieces
+            start = next_span[0]
+
+        pieces.append((start, end))
+        return pieces
+
+
+def _strip(buffer: str, start: int, end: int):
+    """[start, end) without surrounding whitespace, or None if it is blank."""
+    if start >= end:
+        return None
+    if buffer[start].isspace():
+        match = _NON_SPACE.search(buffer, start, end)
+        if match is None:
+            return None
+        start = match.start()
+    while buffer[end - 1].isspace():
+        end -= 1
+    return start, end
@@ -0,0 +1,298 @@
+"""
+Precomputed answers to the standard contract questions.
+
+Most questions asked about a contract are the same handful (termination,
+confidentiality, governing law, ...). After documents are indexed, a
+background job answers every question in CLAUSE_DIGEST_QUESTIONS for each
+document through the normal RAG pipeline and stores the results, with their
+citations, under the document's content hash. A user question whose
+embedding matches a standard question, asked about a single document, is
+then answered from the digest without retrieval or an LLM call.
+
+Entries are keyed by content hash and by a version of the answer: the
+question text, the LLM model, TOP_K_RESULTS, the chunking settings and the
+document's index version (the ids of its current chunks, which change when it
+is re-chunked). A refresh only computes answers for new, changed or
+re-indexed documents and edited questions; unrelated uploads leave the digest
+of other documents untouched.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import config
+import metrics
+from answer_cache import _normalize
+
+logger = logging.getLogger("legaleagle.clause_digest")
+
+
+class DigestStore:
+    """SQLite store of digest answers keyed by (content hash, answer version)."""
+
+    def __init__(self, path: str = None):
+        """
+        Args:
+            path: Database file (defaults to CLAUSE_DIGEST_PATH)
+        """
+        self.path = path or config.CLAUSE_DIGEST_PATH
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                content_hash TEXT NOT NULL,
+                question_version TEXT NOT NULL,
+                question_key TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (content_hash, question_version)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def get(self, content_hash: str, question_version: str) -> Optional[Dict]:
+        """Stored result ('answer', 'citations', 'sources'), or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM answers WHERE content_hash = ? AND question_version = ?",
+                (content_hash, question_version),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def versions(self, content_hash: str) -> set:
+        """Question versions answered for a document."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT question_version FROM answers WHERE content_hash = ?", (content_hash,)
+            ).fetchall()
+        return {version for (version,) in rows}
+
+    def put(self, content_hash: str, question_version: str, question_key: str, result: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (content_hash, question_version, question_key, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (content_hash, question_version, question_key, json.dumps(result, default=float), time.time()),
+            )
+            self._conn.commit()
+
+    def prune(self, current: set) -> int:
+        """
+        Delete answers not in current, a set of (content hash, answer version)
+        pairs; returns the number deleted.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT content_hash, question_version FROM answers").fetchall()
+            stale = [row for row in rows if row not in current]
+            self._conn.executemany(
+                "DELETE FROM answers WHERE content_hash = ? AND question_version = ?", stale
+            )
+            self._conn.commit()
+        return len(stale)
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        return count
+
+
+class ClauseDigest:
+    """Builds and serves per-document answers to the standard questions."""
+
+    def __init__(
+        self,
+        vector_store_manager,
+        store: DigestStore = None,
+        questions: Dict[str, str] = None,
+        threshold: float = None
+    ):
+        """
+        Args:
+            vector_store_manager: VectorStoreManager of the indexed documents
+            store: Answer store (defaults to a DigestStore at CLAUSE_DIGEST_PATH)
+            questions: Standard questions keyed by a short name (defaults to
+                CLAUSE_DIGEST_QUESTIONS)
+            threshold: Minimum cosine similarity between a user question and a
+                standard question to answer from the digest (defaults to
+                CLAUSE_DIGEST_THRESHOLD)
+        """
+        self.vector_store = vector_store_manager
+        self.store = store if store is not None else DigestStore()
+        self.questions = dict(questions or config.CLAUSE_DIGEST_QUESTIONS)
+        self.threshold = threshold or config.CLAUSE_DIGEST_THRESHOLD
+        self._keys = list(self.questions)
+        self._versions = {key: _question_version(question) for key, question in self.questions.items()}
+        self._question_matrix = None
+        self._lock = threading.Lock()
+        self._worker = None
+        self._rerun = False
+
+    def lookup(self, question_vector: List[float], filters: Dict = None) -> Optional[Dict]:
+        """
+        Digest answer for a question, if it matches a standard question and
+        its scope is a single document with a complete digest entry.
+
+        Args:
+            question_vector: Embedding of the user question
+            filters: The query's filters; only a 'doc_ids' filter (or none,
+                with one document indexed) can be served
+
+        Returns:
+            Result dict with 'answer', 'citations', 'sources' and
+            'from_digest' True, or None
+        """
+        if filters and any(value is not None for key, value in filters.items() if key != 'doc_ids'):
+            return None
+
+        key = self._match(question_vector)
+        if key is None:
+            return None
+
+        documents = self.vector_store.list_documents()
+        doc_ids = list(filters['doc_ids']) if filters and filters.get('doc_ids') is not None else list(documents)
+        if len(doc_ids) != 1 or doc_ids[0] not in documents:
+            return None
+
+        entry = documents[doc_ids[0]]
+        content_hash = entry.get('content_hash')
+        result = self.store.get(content_hash, self._version(key, entry)) if content_hash else None
+        if result is None:
+            return None
+        return {**result, 'from_digest': True}
+
+    def _match(self, question_vector: List[float]) -> Optional[str]:
+        """Name of the closest standard question, if it is close enough."""
+        with self._lock:
+            if self._question_matrix is None:
+                vectors = self.vector_store.embeddings.embed_queries([self.questions[key] for key in self._keys])
+                self._question_matrix = np.stack([_normalize(vector) for vector in vectors])
+        similarities = self._question_matrix @ _normalize(question_vector)
+        best = int(np.argmax(similarities))
+        return self._keys[best] if similarities[best] >= self.threshold else None
+
+    def pending(self) -> Dict[str, List[str]]:
+        """Standard questions still to be answered, by doc_id, for the indexed documents."""
+        pending = {}
+        for doc_id, entry in self.vector_store.list_documents().items():
+            content_hash = entry.get('content_hash')
+            if not content_hash:
+                continue
+            answered = self.store.versions(content_hash)
+            missing = [key for key in self._keys if self._version(key, entry) not in answered]
+            if missing:
+                pending[doc_id] = missing
+        return pending
+
+    def refresh(self, rag_pipeline) -> Dict[str, int]:
+        """
+        Answer the standard questions that are missing for any indexed
+        document, then drop entries for documents no longer indexed.
+
+        Args:
+            rag_pipeline: RAGPipeline used to answer the questions
+
+        Returns:
+            Dictionary with 'documents' and 'answers' computed, 'failed'
+            answers (left for the next refresh) and 'pruned' entries
+        """
+        stats = {'documents': 0, 'answers': 0, 'failed': 0, 'pruned': 0}
+        with metrics.span("clause_digest.refresh") as refresh_span:
+            documents = self.vector_store.list_documents()
+            for doc_id, keys in self.pending().items():
+                entry = documents[doc_id]
+                content_hash = entry['content_hash']
+                # One batch per document: embedded and retrieved together,
+                # LLM calls concurrent under the batch rate limiter
+                results = rag_pipeline.query_batch(
+                    [self.questions[key] for key in keys], filters={'doc_ids': [doc_id]}
+                )
+                for key, result in zip(keys, results):
+                    if result.get('answer') is None or result.get('from_digest'):
+                        stats['failed'] += 1
+                        continue
+                    self.store.put(content_hash, self._version(key, entry), key, {
+                        'answer': result['answer'],
+                        'citations': result['citations'],
+                        'sources': result['sources'],
+                    })
+                    stats['answers'] += 1
+                stats['documents'] += 1
+
+            current = {
+                (entry.get('content_hash'), self._version(key, entry))
+                for entry in self.vector_store.list_documents().values()
+                for key in self._keys
+            }
+            stats['pruned'] = self.store.prune(current)
+            refresh_span.set(**stats)
+        metrics.increment("clause_digest_answers", stats['answers'])
+        return stats
+
+    def refresh_in_background(self, rag_pipeline):
+        """
+        Run refresh on a background thread. A call while a refresh is running
+        makes it run once more when it finishes, so documents indexed in the
+        meantime are picked up.
+        """
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                self._rerun = True
+                return
+            self._rerun = False
+            self._worker = threading.Thread(
+                target=self._refresh_loop, args=(rag_pipeline,), name="clause-digest", daemon=True
+            )
+            self._worker.start()
+
+    def _refresh_loop(self, rag_pipeline):
+        while True:
+            try:
+                self.refresh(rag_pipeline)
+            except Exception:
+                # The next refresh retries whatever is still missing
+                metrics.increment("clause_digest_errors")
+                logger.exception("Clause digest refresh failed")
+            with self._lock:
+                if not self._rerun:
+                    self._worker = None
+                    return
+                self._rerun = False
+
+    def _version(self, key: str, entry: Dict) -> str:
+        """Answer version of a standard question for one registry entry."""
+        return _answer_version(self._versions[key], entry)
+
+    def wait_for_refresh(self, timeout: float = None):
+        """Block until a background refresh has finished."""
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+
+def _question_version(question: str) -> str:
+    """Version of a standard question's answers; changes when the question or answering setup does."""
+    key = (
+        f"{question}|{config.LLM_MODEL}|{config.TOP_K_RESULTS}"
+        f"|{config.CHUNK_SIZE}|{config.CHUNK_OVERLAP}|{config.CHUNK_MIN_SIZE}"
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _answer_version(question_version: str, entry: Dict) -> str:
+    """Question version combined with the document's index version (its chunk id ranges)."""
+    key = f"{question_version}|{json.dumps(entry.get('id_ranges', []))}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
@@ -29,6 +29,13 @@ PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "")
 VECTOR_STORE_TYPE = os.getenv("VECTOR_STORE_TYPE", "faiss").lower()
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "legal-eagle-index")
 
+# Pinecone Upsert Configuration (pinecone_upsert.py)
+PINECONE_UPSERT_BATCH_SIZE = 100  # Vectors per upsert request
+PINECONE_MAX_IN_FLIGHT = int(os.getenv("PINECONE_MAX_IN_FLIGHT", "8"))  # Concurrent upsert requests
+PINECONE_MAX_RETRIES = 6  # Retries per request after a 429, 5xx or connection error
+PINECONE_BASE_BACKOFF_SECONDS = 0.5
+PINECONE_MAX_BACKOFF_SECONDS = 20.0
+
 # Model Configuration - Using Groq (free) and HuggingFace embeddings (free)
 LLM_MODEL = os.getenv("LLM_MODEL", "llama-3.3-70b-versatile")  # Groq default model (updated from deprecated llama-3.1-70b-versatile)
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # HuggingFace sentence-transformers model
@@ -36,10 +43,114 @@ EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")  # HuggingFac
 # Chunking Configuration
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+CHUNK_MIN_SIZE = 150  # Shorter clause fragments are merged into a neighbour
+
+# PDF Extraction Configuration
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))  # 0 = one per CPU core
+PDF_PAGES_PER_TASK = 16  # Minimum pages handed to a worker process at once
+
+# Extracted Text Cache Configuration
+TEXT_CACHE_ENABLED = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"  # Re-use page text of known PDFs
+TEXT_CACHE_PATH = os.getenv("TEXT_CACHE_PATH", "text_cache.sqlite")
+
+# Streaming Ingestion Configuration
+INGEST_BATCH_SIZE = 64  # Chunks embedded and indexed per batch
+INGEST_QUEUE_SIZE = 8  # Maximum items buffered between pipeline stages
+
+# Bulk Ingestion Configuration (bulk_ingest.py)
+BULK_BATCH_SIZE = 512  # Chunks embedded and indexed per batch
+BULK_FILES_PER_GROUP = 50  # Files ingested between checkpoints
+BULK_MAX_GROUP_MB = 256  # ...or fewer, once their PDFs add up to this size
 
 # Retrieval Configuration
 TOP_K_RESULTS = 3
 
+# Hybrid Search Configuration (BM25 + vector, FAISS only)
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+HYBRID_CANDIDATES = 20  # Candidates taken from each retriever before fusion
+RRF_K = 60  # Reciprocal rank fusion constant
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Batch Question Answering Configuration
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))  # Max in-flight LLM calls
+BATCH_MAX_RETRIES = 5  # Retries per question after a rate-limit response
+BATCH_BASE_BACKOFF_SECONDS = 1.0
+BATCH_MAX_BACKOFF_SECONDS = 30.0
+
+# Context Packing Configuration
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))  # Max prompt tokens of retrieved excerpts
+CONTEXT_TOKEN_ENCODING = "cl100k_base"  # tiktoken encoding used to count tokens
+CONTEXT_DUPLICATE_THRESHOLD = 0.8  # Word-trigram Jaccard similarity at which an excerpt is dropped as a repeat
+CONTEXT_MIN_EXCERPT_TOKENS = 64  # An excerpt is only truncated to fit if at least this much remains
+CONTEXT_MAX_MERGE_GAP = 3  # Chunks at most this many characters apart are joined
+
+# Answer Cache Configuration
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = 0.92  # Minimum cosine similarity between questions for a cache hit
+ANSWER_CACHE_MAX_ENTRIES = 256
+ANSWER_CACHE_TTL_SECONDS = 3600
+
+# Clause Digest Configuration (clause_digest.py)
+# Standard questions answered per document in the background after indexing;
+# matching user questions about a single document are served from the digest
+CLAUSE_DIGEST_ENABLED = os.getenv("CLAUSE_DIGEST_ENABLED", "false").lower() == "true"
+CLAUSE_DIGEST_PATH = os.getenv("CLAUSE_DIGEST_PATH", "clause_digest.sqlite")
+CLAUSE_DIGEST_THRESHOLD = 0.85  # Minimum cosine similarity between a question and a standard question
+CLAUSE_DIGEST_QUESTIONS = {
+    'termination': "Under what conditions can this contract be terminated?",
+    'confidentiality': "What are the confidentiality obligations?",
+    'indemnification': "What are the indemnification obligations?",
+    'governing_law': "What is the governing law of this contract?",
+    'liability_cap': "What is the limitation or cap on liability?",
+    'payment_terms': "What are the payment terms?",
+    'renewal': "How and when does this contract renew?",
+}
+
+# Exact (question, filters, index version) results kept so Streamlit reruns
+# re-render an answer instead of recomputing it
+QUERY_MEMO_MAX_ENTRIES = 512
+
+# Metrics Configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"  # Per-stage timing spans
+METRICS_LOG_PATH = os.getenv("METRICS_LOG_PATH", "")  # JSON-lines trace log ("" = logging module only)
+METRICS_PROMETHEUS_PATH = os.getenv("METRICS_PROMETHEUS_PATH", "")  # Prometheus text file ("" = off)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Serve /metrics on localhost (0 = off)
+METRICS_EXPORT_INTERVAL_SECONDS = 5  # Minimum time between Prometheus file rewrites
+
+# Retrieval Service Configuration (retrieval_service.py)
+# When set, e.g. http://127.0.0.1:8765, VectorStoreManager is a client of the
+# shared service instead of loading its own index and embedding model
+RETRIEVAL_SERVICE_URL = os.getenv("RETRIEVAL_SERVICE_URL", "")
+RETRIEVAL_SERVICE_HOST = "127.0.0.1"
+RETRIEVAL_SERVICE_PORT = int(os.getenv("RETRIEVAL_SERVICE_PORT", "8765"))
+RETRIEVAL_SERVICE_THREADS = int(os.getenv("RETRIEVAL_SERVICE_THREADS", "0"))  # Request threads (0 = 2 per CPU core)
+RETRIEVAL_SERVICE_TIMEOUT_SECONDS = 600  # Client wait per request (index writes embed whole batches)
+
 # FAISS Index Path
 FAISS_INDEX_PATH = "faiss_index"
+FAISS_MAX_SEGMENTS = 8  # Small segments are merged once there are more than this
+FAISS_BACKGROUND_COMPACTION = True  # Merge segments in a background thread
+FAISS_MAX_DELETED_RATIO = 0.3  # Rewrite a segment once this fraction of its chunks is deleted
+
+# ANN index per segment: "auto", "flat" (exact), "hnsw", "ivfpq" or "sq8"
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "auto").lower()
+FAISS_ANN_MIN_VECTORS = int(os.getenv("FAISS_ANN_MIN_VECTORS", "50000"))  # Smaller segments are scanned exactly
+FAISS_COMPRESSED_MIN_VECTORS = 1000000  # "auto" switches from HNSW to IVF-PQ at this segment size
+FAISS_HNSW_M = 32  # Graph neighbours per node
+FAISS_HNSW_EF_CONSTRUCTION = 80
+FAISS_HNSW_EF_SEARCH = 64  # Higher = better recall, slower queries
+FAISS_IVF_NPROBE = 16  # Inverted lists visited per query
+FAISS_PQ_M = 48  # Product-quantizer sub-vectors (bytes per vector)
+FAISS_RERANK_FACTOR = 4  # Quantized candidates fetched per result and rescored exactly
+
+# Embedding Cache Configuration
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+# Embedding Engine Configuration
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))  # Texts per length-sorted batch
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1"))  # Encoder processes (1 = in-process)
+EMBEDDING_CORES_PER_WORKER = int(os.getenv("EMBEDDING_CORES_PER_WORKER", "0"))  # 0 = split cores evenly
+EMBEDDING_MIN_PARALLEL_TEXTS = 128  # Smaller calls are encoded in-process
 
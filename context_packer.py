@@ -0,0 +1,248 @@
+"""
+Token-budgeted packing of retrieved chunks into prompt context.
+
+Neighbouring hits often share text: chunks of one clause overlap by
+CHUNK_OVERLAP, and consecutive clauses are both retrieved. Pasting them in
+verbatim spends prompt tokens on repeats. The packer:
+
+  1. merges chunks of the same document whose text overlaps or which are
+     adjacent (by their character offsets, or else by a shared prefix/suffix),
+  2. drops excerpts that are near-duplicates of a better-ranked one (e.g. the
+     same boilerplate in two versions of a contract),
+  3. adds excerpts best-first until CONTEXT_TOKEN_BUDGET tokens are used,
+     truncating the last one if a useful part of it still fits.
+
+Every excerpt keeps the page span and document of the chunks it came from, so
+citations are unchanged.
+"""
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+import config
+
+_WORD = re.compile(r"\w+")
+
+_encoding_lock = threading.Lock()
+_encoding = None
+
+
+def token_counter() -> Callable[[str], int]:
+    """
+    Token count function using the CONTEXT_TOKEN_ENCODING tiktoken encoding.
+
+    tiktoken downloads its BPE files on first use; when that is impossible
+    (offline, not installed) tokens are estimated as characters / 4.
+    """
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(config.CONTEXT_TOKEN_ENCODING)
+            except Exception:
+                _encoding = False
+    if _encoding is False:
+        return lambda text: (len(text) + 3) // 4
+    return lambda text: len(_encoding.encode_ordinary(text))
+
+
+def _truncate(text: str, tokens: int) -> str:
+    """Leading part of text within a token count, cut at a sentence or word end."""
+    if _encoding:
+        head = _encoding.decode(_encoding.encode_ordinary(text)[:tokens])
+    else:
+        head = text[:tokens * 4]
+    for separator in (". ", "\n", " "):
+        cut = head.rfind(separator)
+        if cut > len(head) // 2:
+            return head[:cut + 1].rstrip()
+    return head
+
+
+class ContextPacker:
+    """Merges, de-duplicates and budgets retrieved chunks for the prompt."""
+
+    def __init__(self, token_budget: int = None, duplicate_threshold: float = None):
+        """
+        Args:
+            token_budget: Maximum context tokens (defaults to CONTEXT_TOKEN_BUDGET)
+            duplicate_threshold: Word-shingle Jaccard similarity above which an
+                excerpt is dropped as a near-duplicate (defaults to
+                CONTEXT_DUPLICATE_THRESHOLD)
+        """
+        self.token_budget = token_budget or config.CONTEXT_TOKEN_BUDGET
+        self.duplicate_threshold = (
+            config.CONTEXT_DUPLICATE_THRESHOLD if duplicate_threshold is None else duplicate_threshold
+        )
+        self.count_tokens = token_counter()
+
+    def pack(self, search_results: List[Dict]) -> List[Dict]:
+        """
+        Pack search results, best first, into excerpts.
+
+        Args:
+            search_results: Results of VectorStoreManager.similarity_search
+
+        Returns:
+            List of excerpts in rank order, each with 'text', 'metadata'
+            (doc_id, filename, page and page_end of the merged chunks),
+            'chunks' (number of chunks merged) and 'tokens'
+        """
+        excerpts = self._merge(search_results)
+        excerpts = self._drop_duplicates(excerpts)
+
+        packed = []
+        remaining = self.token_budget
+        for excerpt in excerpts:
+            tokens = self.count_tokens(excerpt['text'])
+            if tokens > remaining:
+                # Only worth truncating if a useful part of it fits
+                if remaining < config.CONTEXT_MIN_EXCERPT_TOKENS:
+                    continue
+                excerpt['text'] = _truncate(excerpt['text'], remaining)
+                tokens = self.count_tokens(excerpt['text'])
+            excerpt['tokens'] = tokens
+            packed.append(excerpt)
+            remaining -= tokens
+        return packed
+
+    def _merge(self, search_results: List[Dict]) -> List[Dict]:
+        """Fold each result into a better-ranked excerpt it overlaps or adjoins."""
+        excerpts = []
+        for result in search_results:
+            metadata = result['metadata']
+            for excerpt in excerpts:
+                if _join(excerpt, result['text'], metadata):
+                    excerpt['chunks'] += 1
+                    break
+            else:
+                excerpts.append({
+                    'text': result['text'],
+                    'metadata': {
+                        key: metadata[key]
+                        for key in ('doc_id', 'filename', 'page', 'page_end', 'char_start', 'char_end')
+                        if key in metadata
+                    },
+                    'chunks': 1
+                })
+
+        # A merge can make two excerpts touch; repeat until nothing changes
+        merged_any = True
+        while merged_any and len(excerpts) > 1:
+            merged_any = False
+            for i, excerpt in enumerate(excerpts):
+                for other in excerpts[i + 1:]:
+                    if _join(excerpt, other['text'], other['metadata']):
+                        excerpt['chunks'] += other['chunks']
+                        excerpts.remove(other)
+                        merged_any = True
+                        break
+                if merged_any:
+                    break
+        return excerpts
+
+    def _drop_duplicates(self, excerpts: List[Dict]) -> List[Dict]:
+        kept = []
+        kept_shingles = []
+        for excerpt in excerpts:
+            shingles = _shingles(excerpt['text'])
+            if any(_jaccard(shingles, other) >= self.duplicate_threshold for other in kept_shingles):
+                continue
+            kept.append(excerpt)
+            kept_shingles.append(shingles)
+        return kept
+
+
+def _join(excerpt: Dict, text: str, metadata: Dict) -> bool:
+    """
+    Merge a chunk into an excerpt if they are from the same document and
+    overlap or adjoin; returns whether it was merged.
+    """
+    current = excerpt['metadata']
+    if current.get('doc_id') != metadata.get('doc_id') or current.get('filename') != metadata.get('filename'):
+        return False
+    page, page_end = metadata.get('page'), metadata.get('page_end', metadata.get('page'))
+    current_page, current_end = current.get('page'), current.get('page_end', current.get('page'))
+    if not all(isinstance(value, int) for value in (page, page_end, current_page, current_end)):
+        return False
+    # Page spans must overlap or touch
+    if page > current_end + 1 or current_page > page_end + 1:
+        return False
+
+    start, end = metadata.get('char_start'), metadata.get('char_end')
+    if start is not None and end is not None and 'char_start' in current and 'char_end' in current:
+        merged = _join_by_offsets(excerpt['text'], current['char_start'], current['char_end'], text, start, end)
+    else:
+        merged = _join_by_text(excerpt['text'], text)
+        start = end = None
+    if merged is None:
+        return False
+
+    excerpt['text'] = merged
+    current['page'] = min(current_page, page)
+    current['page_end'] = max(current_end, page_end)
+    if start is not None:
+        current['char_start'] = min(current['char_start'], start)
+        current['char_end'] = max(current['char_end'], end)
+    else:
+        current.pop('char_start', None)
+        current.pop('char_end', None)
+    return True
+
+
+def _join_by_offsets(text_a: str, start_a: int, end_a: int, text_b: str, start_b: int, end_b: int) -> Optional[str]:
+    """Union of two chunks given their offsets in the document text, or None if apart."""
+    if start_b > start_a:
+        first, first_end, second, second_start, second_end = text_a, end_a, text_b, start_b, end_b
+    else:
+        first, first_end, second, second_start, second_end = text_b, end_b, text_a, start_a, end_a
+    gap = second_start - first_end
+    if gap > config.CONTEXT_MAX_MERGE_GAP:
+        return None
+    if second_end <= first_end:
+        return first
+    if gap <= 0:
+        return first + second[first_end - second_start:]
+    # Adjacent: only whitespace (line breaks) separated them; keep the text
+    # length equal to the offset span so later merges stay aligned
+    return first + "\n" * gap + second
+
+
+def _join_by_text(text_a: str, text_b: str) -> Optional[str]:
+    """Union of two chunks whose ends overlap textually (either order), or None."""
+    if text_b in text_a:
+        return text_a
+    if text_a in text_b:
+        return text_b
+    for first, second in ((text_a, text_b), (text_b, text_a)):
+        overlap = _suffix_prefix_overlap(first, second)
+        if overlap:
+            return first + second[overlap:]
+    return None
+
+
+def _suffix_prefix_overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is a prefix of second (0 if under 32 chars)."""
+    probe = first[-32:]
+    if len(probe) < 32:
+        return 0
+    # The overlap region can only lie at the start of second
+    position = second.find(probe, 0, config.CHUNK_OVERLAP * 2 + len(probe))
+    while position != -1:
+        length = position + len(probe)
+        if first.endswith(second[:length]):
+            return length
+        position = second.find(probe, position + 1, config.CHUNK_OVERLAP * 2 + len(probe))
+    return 0
+
+
+def _shingles(text: str) -> set:
+    words = _WORD.findall(text.lower())
+    return {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
@@ -0,0 +1,185 @@
+"""
+Persistent embedding cache for chunk embeddings.
+Entries are keyed by (embedding model, SHA-256 of chunk text) so re-uploaded or
+lightly revised contracts only pay for the chunks that actually changed.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import config
+
+
+def text_hash(text: str) -> str:
+    """Return the hex SHA-256 digest used as the cache key for a chunk."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite-backed embedding store with size-bounded LRU eviction."""
+
+    def __init__(self, path: str = None, model_name: str = None, max_entries: int = None):
+        self.path = path or config.EMBEDDING_CACHE_PATH
+        self.model_name = model_name or config.EMBEDDING_MODEL
+        self.max_entries = max_entries or config.EMBEDDING_CACHE_MAX_ENTRIES
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings(last_access)"
+        )
+        self._conn.commit()
+
+    def get_many(self, hashes: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up cached vectors.
+
+        Args:
+            hashes: Text hashes to look up
+
+        Returns:
+            Mapping of text hash to vector for every hash found in the cache
+        """
+        found = {}
+        if not hashes:
+            return found
+
+        unique = list(dict.fromkeys(hashes))
+        now = time.time()
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_name, key) for key in found],
+                )
+                self._conn.commit()
+
+        return found
+
+    def put_many(self, hashes: List[str], vectors: List[List[float]]):
+        """
+        Store vectors and evict the least recently used entries beyond the size bound.
+
+        Args:
+            hashes: Text hashes, aligned with vectors
+            vectors: Embedding vectors to store
+        """
+        if not hashes:
+            return
+
+        now = time.time()
+        rows = [
+            (self.model_name, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in zip(hashes, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the oldest entries once the cache exceeds max_entries."""
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves document vectors from an EmbeddingCache."""
+
+    def __init__(self, base: Embeddings, cache: Optional[EmbeddingCache] = None):
+        self.base = base
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, only sending cache misses through the underlying model."""
+        hashes = [text_hash(text) for text in texts]
+        cached = self.cache.get_many(hashes)
+
+        # Deduplicate misses so repeated boilerplate is only encoded once
+        missing = {}
+        for key, text in zip(hashes, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            new_vectors = self.base.embed_documents(list(missing.values()))
+            self.cache.put_many(list(missing.keys()), new_vectors)
+            cached.update(zip(missing.keys(), new_vectors))
+
+        misses = sum(1 for key in hashes if key in missing)
+        with self._lock:
+            self.misses += misses
+            self.hits += len(texts) - misses
+
+        return [cached[key] for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Queries are not cached; they go straight to the underlying model."""
+        return self.base.embed_query(text)
+    
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries in one batched model call, bypassing the cache."""
+        # Through embed_queries where available, so queries are not counted
+        # as ingestion work in the base model's stats
+        if hasattr(self.base, 'embed_queries'):
+            return self.base.embed_queries(texts)
+        return self.base.embed_documents(texts)
+
+    def take_stats(self) -> Dict[str, int]:
+        """Return hit/miss counts (plus the base model's stats) since the last call and reset them."""
+        with self._lock:
+            stats = {'cache_hits': self.hits, 'cache_misses': self.misses}
+            self.hits = 0
+            self.misses = 0
+        if hasattr(self.base, 'take_stats'):
+            stats.update(self.base.take_stats())
+        return stats
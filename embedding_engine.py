@@ -0,0 +1,195 @@
+"""
+Length-bucketed, multi-process embedding engine.
+
+Chunks range from short signature-page fragments to full clauses, and a batch
+is padded to its longest text, so mixing them wastes most of the compute.
+Texts are sorted by length and cut into batches of EMBEDDING_BATCH_SIZE, so
+every batch holds texts of similar length. Batches are encoded in-process or
+fanned out to a pool of worker processes, each pinned to its own set of CPU
+cores with a matching torch thread count. Vectors are returned in input order.
+"""
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import config
+
+# Model loaded once per worker process by _init_worker
+_worker_model = None
+
+
+def _load_model(model_name: str, device: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name, device=device)
+
+
+def _init_worker(model_name: str, device: str, core_sets):
+    """Pin this worker to the next free core set and load the model."""
+    global _worker_model
+    cores = core_sets.get()
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+    torch.set_num_threads(max(1, len(cores)) if cores else 1)
+    _worker_model = _load_model(model_name, device)
+
+
+def _encode(model, texts: List[str]) -> np.ndarray:
+    return np.asarray(
+        model.encode(texts, batch_size=len(texts), show_progress_bar=False, convert_to_numpy=True),
+        dtype=np.float32
+    )
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return _encode(_worker_model, texts)
+
+
+def length_buckets(texts: List[str], batch_size: int) -> List[np.ndarray]:
+    """Indices of texts grouped into batches of similar length, longest first."""
+    order = np.argsort([-len(text) for text in texts], kind="stable")
+    return [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def core_sets(workers: int, cores_per_worker: int = 0) -> List[List[int]]:
+    """Split the CPU cores available to this process into one set per worker."""
+    if hasattr(os, "sched_getaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+    else:
+        available = list(range(os.cpu_count() or 1))
+    per_worker = min(cores_per_worker or max(1, len(available) // workers), len(available))
+    # Wraps around when more cores are requested than exist
+    return [
+        [available[(i * per_worker + j) % len(available)] for j in range(per_worker)]
+        for i in range(workers)
+    ]
+
+
+class EmbeddingEngine(Embeddings):
+    """SentenceTransformer embeddings with length bucketing and a worker pool."""
+
+    def __init__(
+        self,
+        model_name: str = None,
+        batch_size: int = None,
+        workers: int = None,
+        cores_per_worker: int = None,
+        device: str = "cpu"
+    ):
+        """
+        Args:
+            model_name: SentenceTransformer model (defaults to EMBEDDING_MODEL)
+            batch_size: Texts per encode call (defaults to EMBEDDING_BATCH_SIZE)
+            workers: Worker processes; 1 encodes in-process (defaults to EMBEDDING_WORKERS)
+            cores_per_worker: Cores pinned per worker; 0 splits the available
+                cores evenly (defaults to EMBEDDING_CORES_PER_WORKER)
+            device: Torch device for the model
+        """
+        self.model_name = model_name or config.EMBEDDING_MODEL
+        self.batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+        self.workers = workers or config.EMBEDDING_WORKERS
+        self.cores_per_worker = (
+            config.EMBEDDING_CORES_PER_WORKER if cores_per_worker is None else cores_per_worker
+        )
+        self.device = device
+        self._model = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Guards the lazy model and pool and the stats: the retrieval
+        # service embeds queries from many threads at once
+        self._lock = threading.Lock()
+        self.embedded = 0
+        self.seconds = 0.0
+
+    @property
+    def model(self):
+        """In-process model, loaded on first use (queries and small batches)."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = _load_model(self.model_name, self.device)
+        return self._model
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            return self._get_pool_locked()
+
+    def _get_pool_locked(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawn rather than fork: forking a process that has already
+            # started torch's thread pool can deadlock the children
+            context = multiprocessing.get_context("spawn")
+            queue = context.Queue()
+            for cores in core_sets(self.workers, self.cores_per_worker):
+                queue.put(cores)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.model_name, self.device, queue)
+            )
+        return self._pool
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in length-sorted batches, counting them in take_stats.
+
+        Returns:
+            One vector per text, in input order
+        """
+        if not texts:
+            return []
+        start = time.perf_counter()
+        vectors = self._embed(texts)
+        with self._lock:
+            self.embedded += len(texts)
+            self.seconds += time.perf_counter() - start
+        return vectors
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed many queries in batches, like embed_documents, but not counted as ingestion work."""
+        if not texts:
+            return []
+        return self._embed(texts)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        # Same preprocessing as HuggingFaceEmbeddings, so cached vectors stay valid
+        texts = [text.replace("\n", " ") for text in texts]
+        buckets = length_buckets(texts, self.batch_size)
+
+        if self.workers > 1 and len(texts) >= config.EMBEDDING_MIN_PARALLEL_TEXTS:
+            pool = self._get_pool()
+            futures = [
+                pool.submit(_encode_in_worker, [texts[i] for i in bucket]) for bucket in buckets
+            ]
+            batches = [future.result() for future in futures]
+        else:
+            batches = [_encode(self.model, [texts[i] for i in bucket]) for bucket in buckets]
+
+        vectors = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        for bucket, batch in zip(buckets, batches):
+            vectors[bucket] = batch
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return _encode(self.model, [text.replace("\n", " ")])[0].tolist()
+
+    def take_stats(self) -> Dict[str, float]:
+        """Return chunks embedded and seconds spent since the last call, and reset them."""
+        with self._lock:
+            stats = {'embedded_chunks': self.embedded, 'embed_seconds': self.seconds}
+            self.embedded = 0
+            self.seconds = 0.0
+        return stats
+
+    def close(self):
+        """Shut down the worker pool, if one was started."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
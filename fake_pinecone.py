@@ -0,0 +1,290 @@
+"""
+In-process stand-in for a Pinecone index, for testing offline.
+
+FakePineconeIndex implements the parts of the pinecone Index API the app uses
+(upsert, query, fetch, delete, describe_index_stats) over an in-memory dict,
+with cosine scoring and Pinecone's metadata filter operators. It can add a
+per-request latency and fail a fraction of requests with 429/503 errors, half
+of them after the write has been applied (a lost response), so the throughput
+and retry behaviour of the upsert pipeline can be measured without a network:
+
+    manager = VectorStoreManager(pinecone_index=FakePineconeIndex(latency_seconds=0.05))
+
+    python fake_pinecone.py --vectors 20000 --latency 0.05 --failure-rate 0.05
+"""
+import argparse
+import random
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+
+class FakePineconeError(Exception):
+    """Error response from the fake index; status is the HTTP status code."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"({status}) {message}")
+        self.status = status
+
+
+class FakePineconeIndex:
+    """Thread-safe in-memory vector index with the pinecone Index interface."""
+
+    def __init__(
+        self,
+        dimension: int = None,
+        latency_seconds: float = 0.0,
+        failure_rate: float = 0.0,
+        max_batch_size: int = 1000,
+        seed: int = None
+    ):
+        """
+        Args:
+            dimension: Vector dimension (defaults to that of the first upsert)
+            latency_seconds: Simulated round trip added to every request
+            failure_rate: Fraction of upsert requests answered with a 429 or 503
+            max_batch_size: Upserts with more vectors are rejected with a 400
+            seed: Seed for the failure injection
+        """
+        self.dimension = dimension
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.max_batch_size = max_batch_size
+        self._random = random.Random(seed)
+        self._namespaces: Dict[str, Dict[str, tuple]] = {}
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.stats = {'requests': 0, 'failures': 0, 'max_in_flight': 0}
+
+    def upsert(self, vectors: List, namespace: str = "", **kwargs) -> Dict:
+        """Insert or overwrite vectors given as dicts or (id, values[, metadata]) tuples."""
+        records = [_as_record(vector) for vector in vectors]
+        if len(records) > self.max_batch_size:
+            raise FakePineconeError(400, f"Upsert of {len(records)} vectors exceeds {self.max_batch_size}")
+        for vector_id, values, metadata in records:
+            if self.dimension is None:
+                self.dimension = len(values)
+            if len(values) != self.dimension:
+                raise FakePineconeError(
+                    400, f"Vector dimension {len(values)} does not match the index dimension {self.dimension}"
+                )
+            if any(value is None for value in metadata.values()):
+                raise FakePineconeError(400, f"Metadata of {vector_id} contains null values")
+
+        with self._request():
+            failure = self._draw_failure()
+            if failure is not None and self._random.random() < 0.5:
+                raise failure
+            with self._lock:
+                store = self._namespaces.setdefault(namespace, {})
+                for vector_id, values, metadata in records:
+                    store[vector_id] = (np.asarray(values, dtype=np.float32), dict(metadata))
+            if failure is not None:
+                # Applied, but the client never hears about it
+                raise failure
+        return {'upserted_count': len(records)}
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        filter: Dict = None,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        namespace: str = "",
+        **kwargs
+    ) -> Dict:
+        """Top-k vectors by cosine similarity, among those matching filter."""
+        with self._request():
+            with self._lock:
+                items = [
+                    (vector_id, values, metadata)
+                    for vector_id, (values, metadata) in self._namespaces.get(namespace, {}).items()
+                    if not filter or _matches(metadata, filter)
+                ]
+        if not items:
+            return {'matches': [], 'namespace': namespace}
+
+        matrix = np.stack([values for _, values, _ in items])
+        query = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        scores = matrix @ query / np.where(norms == 0, 1.0, norms)
+        order = np.argsort(-scores)[:top_k]
+
+        matches = []
+        for position in order:
+            vector_id, values, metadata = items[position]
+            match = {'id': vector_id, 'score': float(scores[position])}
+            if include_metadata:
+                match['metadata'] = dict(metadata)
+            if include_values:
+                match['values'] = values.tolist()
+            matches.append(match)
+        return {'matches': matches, 'namespace': namespace}
+
+    def fetch(self, ids: List[str], namespace: str = "", **kwargs) -> Dict:
+        """Stored vectors and metadata by id."""
+        with self._request():
+            with self._lock:
+                store = self._namespaces.get(namespace, {})
+                vectors = {
+                    vector_id: {'id': vector_id, 'values': store[vector_id][0].tolist(), 'metadata': dict(store[vector_id][1])}
+                    for vector_id in ids if vector_id in store
+                }
+        return {'vectors': vectors, 'namespace': namespace}
+
+    def delete(
+        self,
+        ids: List[str] = None,
+        delete_all: bool = False,
+        filter: Dict = None,
+        namespace: str = "",
+        **kwargs
+    ) -> Dict:
+        """Delete vectors by id, by metadata filter, or all of a namespace."""
+        with self._request():
+            with self._lock:
+                store = self._namespaces.get(namespace, {})
+                if delete_all:
+                    store.clear()
+                elif ids is not None:
+                    for vector_id in ids:
+                        store.pop(vector_id, None)
+                elif filter:
+                    for vector_id in [key for key, (_, metadata) in store.items() if _matches(metadata, filter)]:
+                        del store[vector_id]
+                else:
+                    raise FakePineconeError(400, "Delete needs ids, a filter or delete_all")
+        return {}
+
+    def describe_index_stats(self, **kwargs) -> Dict:
+        with self._lock:
+            namespaces = {name: {'vector_count': len(store)} for name, store in self._namespaces.items()}
+        return {
+            'dimension': self.dimension,
+            'namespaces': namespaces,
+            'total_vector_count': sum(entry['vector_count'] for entry in namespaces.values()),
+        }
+
+    def _request(self):
+        return _Request(self)
+
+    def _draw_failure(self):
+        with self._lock:
+            if self._random.random() >= self.failure_rate:
+                return None
+            self.stats['failures'] += 1
+            status = self._random.choice((429, 503))
+        return FakePineconeError(status, "Too Many Requests" if status == 429 else "Service Unavailable")
+
+
+class _Request:
+    """Counts concurrent requests and adds the simulated latency."""
+
+    def __init__(self, index: FakePineconeIndex):
+        self.index = index
+
+    def __enter__(self):
+        with self.index._lock:
+            self.index._in_flight += 1
+            self.index.stats['requests'] += 1
+            self.index.stats['max_in_flight'] = max(self.index.stats['max_in_flight'], self.index._in_flight)
+        if self.index.latency_seconds:
+            time.sleep(self.index.latency_seconds)
+
+    def __exit__(self, *exc_info):
+        with self.index._lock:
+            self.index._in_flight -= 1
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure upsert throughput and retry handling against the fake index."
+    )
+    parser.add_argument("--vectors", type=int, default=20000, help="Vectors to upsert")
+    parser.add_argument("--dimension", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per request")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="Fraction of requests failing with 429/503")
+    parser.add_argument("--batch-size", type=int, default=None, help="Vectors per request")
+    parser.add_argument("--in-flight", default="1,4,8,16", help="Comma-separated concurrency limits to compare")
+    args = parser.parse_args()
+
+    import config
+    from pinecone_upsert import PineconeUpserter
+
+    # Retries back off for real, but briefly
+    config.PINECONE_BASE_BACKOFF_SECONDS = min(config.PINECONE_BASE_BACKOFF_SECONDS, 0.05)
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.vectors, args.dimension), dtype=np.float32)
+    ids = [f"chunk-{i}" for i in range(args.vectors)]
+    metadatas = [{'doc_id': f"doc-{i // 100}", 'page': i % 100} for i in range(args.vectors)]
+
+    print(f"{args.vectors} vectors, {args.latency * 1000:.0f} ms per request, "
+          f"{args.failure_rate:.0%} of requests failing")
+    for max_in_flight in [int(value) for value in args.in_flight.split(",")]:
+        index = FakePineconeIndex(latency_seconds=args.latency, failure_rate=args.failure_rate, seed=max_in_flight)
+        upserter = PineconeUpserter(index, batch_size=args.batch_size, max_in_flight=max_in_flight, max_retries=10)
+        start = time.perf_counter()
+        result = upserter.upsert(ids, vectors, metadatas)
+        seconds = time.perf_counter() - start
+        upserter.close()
+        stored = index.describe_index_stats()['total_vector_count']
+        print(
+            f"  in flight {max_in_flight:>3}: {result['vectors'] / seconds:>9.0f} vectors/s, "
+            f"{result['requests']} requests, {result['retries']} retries, "
+            f"{stored} stored{'' if stored == args.vectors else ' (MISMATCH)'}"
+        )
+
+
+def _as_record(vector) -> tuple:
+    if isinstance(vector, dict):
+        return vector['id'], list(vector['values']), dict(vector.get('metadata') or {})
+    vector_id, values, *rest = vector
+    return vector_id, list(values), dict(rest[0] if rest else {})
+
+
+def _matches(metadata: Dict, filter: Dict) -> bool:
+    """Evaluate a Pinecone metadata filter against one vector's metadata."""
+    for key, condition in filter.items():
+        if key == '$and':
+            if not all(_matches(metadata, part) for part in condition):
+                return False
+        elif key == '$or':
+            if not any(_matches(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not all(_compare(metadata.get(key), operator, operand) for operator, operand in condition.items()):
+                return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+def _compare(value, operator: str, operand) -> bool:
+    if operator == '$eq':
+        return value == operand
+    if operator == '$ne':
+        return value != operand
+    if operator == '$in':
+        return value in operand
+    if operator == '$nin':
+        return value not in operand
+    if value is None:
+        return False
+    if operator == '$gt':
+        return value > operand
+    if operator == '$gte':
+        return value >= operand
+    if operator == '$lt':
+        return value < operand
+    if operator == '$lte':
+        return value <= operand
+    raise FakePineconeError(400, f"Unsupported filter operator {operator}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Streaming ingestion pipeline: extract -> chunk -> embed -> index.
+
+Each stage runs concurrently and hands work to the next through bounded
+queues, so memory stays roughly constant regardless of how many documents are
+uploaded, and embedding starts as soon as the first document is parsed.
+Documents are chunked whole, so clauses running across a page break stay in
+one chunk. reindex() feeds the same stages from the extracted-text cache
+instead of the PDFs.
+"""
+import contextvars
+import queue
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import config
+import metrics
+from pdf_processor import PDFProcessor, document_identity
+from vector_store import VectorStoreManager
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+class _StageError:
+    """Carries an exception raised in a stage to the consuming thread."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class IngestionPipeline:
+    """Overlaps PDF extraction, chunking and batched embedding/indexing."""
+
+    def __init__(
+        self,
+        processor: PDFProcessor,
+        vector_store_manager: VectorStoreManager,
+        batch_size: int = None,
+        queue_size: int = None,
+        extract_workers: int = None
+    ):
+        """
+        Args:
+            processor: Extracts and chunks the PDFs
+            vector_store_manager: Index the chunks are added to
+            batch_size: Chunks per add_documents call (defaults to INGEST_BATCH_SIZE)
+            queue_size: Bound of the queues between stages (defaults to INGEST_QUEUE_SIZE)
+            extract_workers: PDF extraction processes (defaults to PDF_EXTRACT_WORKERS)
+        """
+        self.processor = processor
+        self.vector_store = vector_store_manager
+        self.batch_size = batch_size or config.INGEST_BATCH_SIZE
+        self.queue_size = queue_size or config.INGEST_QUEUE_SIZE
+        self.extract_workers = extract_workers
+
+    def run(
+        self,
+        documents: List[Tuple[str, bytes]],
+        progress_callback: Optional[Callable[[Dict], None]] = None
+    ) -> Dict[str, int]:
+        """
+        Ingest PDFs into the vector store.
+
+        Documents that are already indexed with identical content are
+        skipped. A new version of a file replaces the old one once it has been
+        fully indexed.
+
+        Extraction and chunking run in background threads; embedding and
+        indexing run in the calling thread, which is also where
+        progress_callback is invoked after every batch (so it may safely
+        update Streamlit elements).
+
+        Args:
+            documents: (filename, raw PDF bytes) pairs
+            progress_callback: Called with the running totals after each batch
+
+        Returns:
+            Dictionary with 'documents', 'skipped', 'replaced', 'pages',
+            'chunks', 'batches', 'cache_hits', 'cache_misses',
+            'embedded_chunks', 'embed_seconds' totals and the model's
+            'chunks_per_second' throughput
+        """
+        with metrics.span("ingest.run", documents=len(documents)) as trace:
+            stats = self._run(documents, progress_callback)
+            trace.set(skipped=stats['skipped'], pages=stats['pages'], chunks=stats['chunks'])
+        return stats
+
+    def reindex(self, progress_callback: Optional[Callable[[Dict], None]] = None) -> Dict[str, int]:
+        """
+        Rebuild the chunks and embeddings of every indexed document from the
+        text cache, without reading or parsing any PDF.
+
+        Use after changing CHUNK_SIZE, CHUNK_OVERLAP or the chunker. Chunks
+        whose text is unchanged are served by the embedding cache.
+
+        Documents are re-indexed one at a time. A document's new chunks are
+        staged next to its current ones, which stay searchable, and swapped
+        in when it is committed; its registry entry (and content hash) is
+        kept throughout. If the run fails, documents already done keep their
+        new chunks, the rest keep their old ones, and running it again
+        finishes the job.
+
+        Args:
+            progress_callback: Called with the running totals after each batch
+
+        Returns:
+            The same totals as run, plus 'missing': documents whose text is
+            not in the cache (indexed before it existed, or with another
+            extractor version); they are left as they are
+        """
+        text_cache = self.processor.text_cache
+        if text_cache is None:
+            raise ValueError("Re-indexing needs the text cache; set TEXT_CACHE_ENABLED")
+
+        with metrics.span("ingest.reindex") as trace:
+            stats = _new_stats()
+            stats['missing'] = 0
+            identities = []
+            for doc_id, entry in self.vector_store.list_documents().items():
+                content_hash = entry.get('content_hash')
+                if not content_hash or not text_cache.has(content_hash):
+                    stats['missing'] += 1
+                    continue
+                identities.append({'doc_id': doc_id, 'filename': entry.get('filename'), 'content_hash': content_hash})
+
+            for identity in identities:
+                def cached_document(content_hash=identity['content_hash']):
+                    # Pages are decompressed on the extraction thread
+                    pages = list(text_cache.iter_pages(content_hash))
+                    if pages:
+                        yield 0, pages
+
+                self.vector_store.begin_reindex(identity)
+                self._index([identity], cached_document, stats, progress_callback, staged=True)
+            trace.set(documents=stats['documents'], missing=stats['missing'], chunks=stats['chunks'])
+        return stats
+
+    def _run(
+        self,
+        documents: List[Tuple[str, bytes]],
+        progress_callback: Optional[Callable[[Dict], None]]
+    ) -> Dict[str, int]:
+        stats = _new_stats()
+
+        identities = []
+        pdf_sources = []
+        for filename, content in documents:
+            identity = document_identity(filename, content)
+            if self.vector_store.has_document(identity['doc_id']):
+                stats['skipped'] += 1
+                continue
+            self.vector_store.begin_document(identity)
+            identities.append(identity)
+            pdf_sources.append(content)
+
+        if not pdf_sources:
+            return stats
+
+        def extracted_documents():
+            return self.processor.iter_documents_from_pdfs(pdf_sources, max_workers=self.extract_workers)
+
+        self._index(identities, extracted_documents, stats, progress_callback)
+        return stats
+
+    def _index(
+        self,
+        identities: List[Dict],
+        iter_documents: Callable[[], Iterator[Tuple[int, List[Tuple[str, int]]]]],
+        stats: Dict,
+        progress_callback: Optional[Callable[[Dict], None]],
+        staged: bool = False
+    ):
+        """
+        Chunk, embed and index documents, then commit them.
+
+        Args:
+            identities: Identities of the documents, already begun
+            iter_documents: Returns an iterator of (index into identities,
+                pages) per document; it is run on the extraction thread
+            stats: Totals updated in place
+            progress_callback: Called with the running totals after each batch
+            staged: Add the chunks as replacements for the documents' current
+                ones, swapped in by the commit (see VectorStoreManager.begin_reindex)
+        """
+        document_queue = queue.Queue(maxsize=self.queue_size)
+        batch_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+
+        def put(target: queue.Queue, item) -> bool:
+            # Block on a full queue, but give up once the pipeline is stopping
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(source: queue.Queue):
+            # Wait for the next item, treating a stopped pipeline as end of input
+            while not stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def extract():
+            try:
+                # Wall time of the stage, including waits on a full page queue
+                with metrics.span("ingest.extract") as extract_span:
+                    pages = 0
+                    for item in iter_documents():
+                        if not put(document_queue, item):
+                            return
+                        pages += len(item[1])
+                    extract_span.set(pages=pages)
+                metrics.increment("pages_extracted", pages)
+                put(document_queue, _DONE)
+            except BaseException as e:
+                put(document_queue, _StageError(e))
+
+        def chunk():
+            try:
+                batch = []
+                while True:
+                    item = get(document_queue)
+                    if item is _DONE:
+                        break
+                    if isinstance(item, _StageError):
+                        put(batch_queue, item)
+                        return
+
+                    index, text_with_pages = item
+                    stats['pages'] += len(text_with_pages)
+                    batch.extend(self.processor.chunk_text(text_with_pages, identities[index]))
+                    while len(batch) >= self.batch_size:
+                        if not put(batch_queue, batch[:self.batch_size]):
+                            return
+                        batch = batch[self.batch_size:]
+
+                if stop.is_set():
+                    return
+                if batch and not put(batch_queue, batch):
+                    return
+                put(batch_queue, _DONE)
+            except BaseException as e:
+                put(batch_queue, _StageError(e))
+
+        # Each thread runs in a copy of this context, so its spans nest
+        # under the ingest.run trace
+        workers = [
+            threading.Thread(target=contextvars.copy_context().run, args=(extract,), name="ingest-extract", daemon=True),
+            threading.Thread(target=contextvars.copy_context().run, args=(chunk,), name="ingest-chunk", daemon=True),
+        ]
+        for worker in workers:
+            worker.start()
+
+        try:
+            while True:
+                batch = batch_queue.get()
+                if batch is _DONE:
+                    break
+                if isinstance(batch, _StageError):
+                    raise batch.error
+
+                batch_stats = self.vector_store.add_documents(batch, staged=staged)
+                stats['chunks'] += len(batch)
+                stats['batches'] += 1
+                stats['cache_hits'] += batch_stats['cache_hits']
+                stats['cache_misses'] += batch_stats['cache_misses']
+                stats['embedded_chunks'] += batch_stats.get('embedded_chunks', 0)
+                stats['embed_seconds'] += batch_stats.get('embed_seconds', 0.0)
+                if stats['embed_seconds']:
+                    stats['chunks_per_second'] = stats['embedded_chunks'] / stats['embed_seconds']
+
+                if progress_callback:
+                    progress_callback(dict(stats))
+        finally:
+            stop.set()
+            for worker in workers:
+                worker.join()
+
+        # Only now are the documents complete; this also retires older
+        # versions of the same files
+        for identity in identities:
+            stats['replaced'] += self.vector_store.commit_document(identity)
+        stats['documents'] += len(identities)
+
+
+def _new_stats() -> Dict:
+    return {
+        'documents': 0, 'skipped': 0, 'replaced': 0, 'pages': 0, 'chunks': 0,
+        'batches': 0, 'cache_hits': 0, 'cache_misses': 0,
+        'embedded_chunks': 0, 'embed_seconds': 0.0, 'chunks_per_second': 0.0
+    }
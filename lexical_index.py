@@ -0,0 +1,517 @@
+"""
+BM25 inverted index over chunk text, kept next to the vector index.
+
+Dense embeddings handle exact strings such as "Section 12.3", defined terms and
+party names poorly; this index scores them lexically so they can be fused with
+vector results.
+
+Like the vector index, it is a directory of immutable, memory-mapped blocks:
+every add writes a new block instead of updating shared postings, and a
+manifest lists the live blocks. A block is a set of files sharing a name prefix:
+
+    lex-000001.terms.npy          str (t,) the block's terms, sorted
+    lex-000001.offsets.npy        int64 (t + 1,) start of each term's postings
+    lex-000001.ids.npy            int64 (p,) chunk ids, ascending within a term
+    lex-000001.tfs.npy            float32 (p,) term frequency in the chunk
+    lex-000001.lengths.npy        float32 (p,) token count of the chunk
+    lex-000001.max_tfs.npy        float32 (t,) highest tf of each term
+    lex-000001.min_lengths.npy    float32 (t,) shortest chunk containing each term
+    lex-000001.chunks.npy         int64 (n,) ids of the chunks indexed, ascending
+    lex-000001.chunk_lengths.npy  float32 (n,) their token counts
+
+Searches read the current list of blocks without a lock, so they never wait
+for a write. Before each search the manifest is checked and reloaded if
+another process (the index's writer) has replaced it, so an index opened
+read-only stays current. Document frequencies are the posting list lengths, and scoring
+is MaxScore top-k: once the k-th best partial score beats the most the
+remaining query terms could add, those terms (the common, low-idf ones with
+long posting lists) only score the chunks already found, by binary search,
+instead of their whole posting lists. Small blocks are merged in a background
+thread so their number stays logarithmic in the index size. Deleting chunks
+rewrites only the blocks that hold them.
+"""
+import glob
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+MANIFEST_NAME = "manifest.json"
+
+# Keeps section numbers like "12.3" and "4.2.1" as single tokens
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)*")
+
+_STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this
+to was were will with shall any such which all not no
+""".split())
+
+# Parts of a block, saved as <name>.<part>.npy
+_BLOCK_PARTS = (
+    'terms', 'offsets', 'ids', 'tfs', 'lengths', 'max_tfs', 'min_lengths', 'chunks', 'chunk_lengths'
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word/number tokens with common stopwords removed."""
+    return [
+        token for token in _TOKEN_PATTERN.findall(text.lower())
+        if token not in _STOPWORDS
+    ]
+
+
+class _Block:
+    """Postings of one batch of chunks, memory-mapped from disk."""
+
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+        for part in _BLOCK_PARTS:
+            setattr(self, part, np.load(self._path(part), mmap_mode="r"))
+
+    def _path(self, part: str) -> str:
+        return os.path.join(self.directory, f"{self.name}.{part}.npy")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, float, float]]:
+        """(ids, tfs, lengths, max tf, min length) of a term, or None if absent."""
+        position = int(np.searchsorted(self.terms, term))
+        if position == len(self.terms) or self.terms[position] != term:
+            return None
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return (
+            self.ids[start:end],
+            self.tfs[start:end],
+            self.lengths[start:end],
+            float(self.max_tfs[position]),
+            float(self.min_lengths[position])
+        )
+
+    def posting_terms(self) -> np.ndarray:
+        """Row in self.terms of every posting."""
+        return np.repeat(np.arange(len(self.terms)), np.diff(self.offsets))
+
+    @classmethod
+    def build(cls, directory: str, name: str, chunk_ids: List[int], texts: Iterable[str]) -> "_Block":
+        """Tokenize and write a block for new chunks."""
+        posting_terms, ids, tfs, lengths, chunk_lengths = [], [], [], [], []
+        for chunk_id, text in zip(chunk_ids, texts):
+            tokens = tokenize(text)
+            chunk_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                posting_terms.append(term)
+                ids.append(chunk_id)
+                tfs.append(tf)
+                lengths.append(len(tokens))
+
+        terms, rows = np.unique(np.asarray(posting_terms, dtype=str), return_inverse=True)
+        return cls.write(
+            directory, name, terms, rows,
+            np.asarray(ids, dtype=np.int64),
+            np.asarray(tfs, dtype=np.float32),
+            np.asarray(lengths, dtype=np.float32),
+            np.asarray(chunk_ids, dtype=np.int64),
+            np.asarray(chunk_lengths, dtype=np.float32)
+        )
+
+    @classmethod
+    def merge(cls, directory: str, name: str, blocks: List["_Block"]) -> "_Block":
+        """Write one block holding the postings of several."""
+        terms = np.unique(np.concatenate([block.terms for block in blocks]))
+        rows = np.concatenate([
+            np.searchsorted(terms, block.terms)[block.posting_terms()] for block in blocks
+        ])
+        return cls.write(
+            directory, name, terms, rows,
+            np.concatenate([block.ids for block in blocks]),
+            np.concatenate([block.tfs for block in blocks]),
+            np.concatenate([block.lengths for block in blocks]),
+            np.concatenate([block.chunks for block in blocks]),
+            np.concatenate([block.chunk_lengths for block in blocks])
+        )
+
+    def without(self, name: str, id_ranges: np.ndarray) -> Optional["_Block"]:
+        """Copy of the block without the chunks in id_ranges, or None if none remain."""
+        kept = ~_in_ranges(self.chunks, id_ranges)
+        if not kept.any():
+            return None
+        keep = ~_in_ranges(self.ids, id_ranges)
+        return self.write(
+            self.directory, name, self.terms, self.posting_terms()[keep],
+            self.ids[keep], self.tfs[keep], self.lengths[keep],
+            self.chunks[kept], self.chunk_lengths[kept]
+        )
+
+    @classmethod
+    def write(
+        cls,
+        directory: str,
+        name: str,
+        terms: np.ndarray,
+        rows: np.ndarray,
+        ids: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray,
+        chunks: np.ndarray,
+        chunk_lengths: np.ndarray
+    ) -> "_Block":
+        """
+        Sort postings by (term, chunk id), drop terms without postings and
+        save the block.
+
+        Args:
+            terms: Sorted term vocabulary
+            rows: Row in terms of each posting
+        """
+        order = np.lexsort((ids, rows))
+        rows, ids, tfs, lengths = rows[order], ids[order], tfs[order], lengths[order]
+        counts = np.bincount(rows, minlength=len(terms))
+        used = counts > 0
+        offsets = np.zeros(int(used.sum()) + 1, dtype=np.int64)
+        np.cumsum(counts[used], out=offsets[1:])
+        starts = offsets[:-1]
+
+        chunk_order = np.argsort(chunks, kind="stable")
+        arrays = {
+            'terms': np.asarray(terms)[used],
+            'offsets': offsets,
+            'ids': ids.astype(np.int64),
+            'tfs': tfs.astype(np.float32),
+            'lengths': lengths.astype(np.float32),
+            'max_tfs': np.maximum.reduceat(tfs, starts).astype(np.float32) if len(starts) else tfs[:0],
+            'min_lengths': np.minimum.reduceat(lengths, starts).astype(np.float32) if len(starts) else lengths[:0],
+            'chunks': chunks[chunk_order].astype(np.int64),
+            'chunk_lengths': chunk_lengths[chunk_order].astype(np.float32),
+        }
+        for part, array in arrays.items():
+            _save_npy(os.path.join(directory, f"{name}.{part}.npy"), np.ascontiguousarray(array))
+        return cls(directory, name)
+
+    def delete_files(self):
+        for part in _BLOCK_PARTS:
+            path = self._path(part)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class BM25Index:
+    """Block-based BM25 index keyed by chunk id."""
+
+    def __init__(self, path: str, k1: float = None, b: float = None, background_merge: bool = None):
+        """
+        Args:
+            path: Index directory
+            k1, b: BM25 parameters (default to BM25_K1 and BM25_B)
+            background_merge: Merge blocks in a background thread (defaults
+                to FAISS_BACKGROUND_COMPACTION); otherwise merges run in add
+        """
+        self.path = path
+        self.k1 = k1 or config.BM25_K1
+        self.b = b or config.BM25_B
+        self.background_merge = (
+            config.FAISS_BACKGROUND_COMPACTION if background_merge is None else background_merge
+        )
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()
+        self._merge_thread: Optional[threading.Thread] = None
+
+        os.makedirs(self.path, exist_ok=True)
+        self._snapshot = ([], 0, 0)
+        self._load()
+
+    def _load(self):
+        # Blocks already open are reused; names are never reused
+        opened = {block.name: block for block in self._snapshot[0]}
+        while True:
+            signature = _file_signature(os.path.join(self.path, MANIFEST_NAME))
+            manifest = self._read_manifest()
+            try:
+                blocks = [opened.get(name) or _Block(self.path, name) for name in manifest['blocks']]
+                break
+            except FileNotFoundError:
+                # Another process merged a block away after the manifest was
+                # read; the current manifest lists its replacement
+                if _file_signature(os.path.join(self.path, MANIFEST_NAME)) == signature:
+                    raise
+        self._manifest = manifest
+        self._manifest_signature = signature
+        # (blocks, chunk count, total token count) as one tuple, replaced
+        # whole by writers so a search reads a consistent state without a lock
+        self._snapshot = (blocks, manifest['chunks'], manifest['total_length'])
+
+    def refresh(self):
+        """Reload the manifest if another process has replaced it since it was read."""
+        if _file_signature(os.path.join(self.path, MANIFEST_NAME)) == self._manifest_signature:
+            return
+        with self._lock:
+            if _file_signature(os.path.join(self.path, MANIFEST_NAME)) != self._manifest_signature:
+                self._load()
+
+    def _read_manifest(self) -> Dict:
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        if not os.path.exists(manifest_path):
+            return {'version': 0, 'chunks': 0, 'total_length': 0, 'next_block': 0, 'blocks': []}
+        with open(manifest_path) as f:
+            return json.load(f)
+
+    @property
+    def version(self) -> int:
+        """Vector store version this index was last synchronised with."""
+        self.refresh()
+        return self._manifest['version']
+
+    def set_version(self, version: int):
+        with self._lock:
+            self._publish(self._snapshot[0], version=version)
+
+    def _publish(self, blocks: List[_Block], chunks: int = 0, total_length: int = 0, version: int = None):
+        """Make a new block list visible on disk and in memory; chunks and total_length are deltas."""
+        manifest = dict(self._manifest)
+        manifest['blocks'] = [block.name for block in blocks]
+        manifest['chunks'] += chunks
+        manifest['total_length'] += total_length
+        if version is not None:
+            manifest['version'] = version
+        _write_json_atomic(os.path.join(self.path, MANIFEST_NAME), manifest)
+        self._manifest = manifest
+        self._manifest_signature = _file_signature(os.path.join(self.path, MANIFEST_NAME))
+        self._snapshot = (blocks, manifest['chunks'], manifest['total_length'])
+
+    def _new_block_name(self) -> str:
+        self._manifest['next_block'] += 1
+        return f"lex-{self._manifest['next_block']:06d}"
+
+    def add(self, chunk_ids: Iterable[int], texts: Iterable[str]):
+        """Index the text of new chunks."""
+        chunk_ids = [int(chunk_id) for chunk_id in chunk_ids]
+        if not chunk_ids:
+            return
+        with self._lock:
+            block = _Block.build(self.path, self._new_block_name(), chunk_ids, texts)
+            self._publish(
+                self._snapshot[0] + [block], chunks=len(chunk_ids), total_length=int(block.chunk_lengths.sum())
+            )
+
+        if self.background_merge:
+            self._merge_in_background()
+        else:
+            self.merge()
+
+    def remove_ranges(self, id_ranges: List[Tuple[int, int]]):
+        """Remove every chunk whose id falls in one of the [start, end) ranges."""
+        id_ranges = np.asarray(sorted(id_ranges), dtype=np.int64).reshape(-1, 2)
+        if not len(id_ranges):
+            return
+        with self._lock:
+            blocks, removed_chunks, removed_length, stale = [], 0, 0, []
+            for block in self._snapshot[0]:
+                removed = _in_ranges(block.chunks, id_ranges)
+                if not removed.any():
+                    blocks.append(block)
+                    continue
+                removed_chunks += int(removed.sum())
+                removed_length += int(block.chunk_lengths[removed].sum())
+                replacement = block.without(self._new_block_name(), id_ranges)
+                if replacement is not None:
+                    blocks.append(replacement)
+                stale.append(block)
+            if not stale:
+                return
+            self._publish(blocks, chunks=-removed_chunks, total_length=-removed_length)
+        for block in stale:
+            block.delete_files()
+
+    def clear(self):
+        with self._lock:
+            self._publish([], chunks=-self._manifest['chunks'], total_length=-self._manifest['total_length'])
+            # Also removes blocks orphaned by a crash between write and publish
+            for path in glob.glob(os.path.join(self.path, "lex-*.npy")):
+                os.remove(path)
+
+    def merge(self):
+        """
+        Merge adjacent blocks until each has more than twice the postings of
+        the next, keeping their number logarithmic in the index size.
+        """
+        with self._merge_lock:
+            while True:
+                with self._lock:
+                    blocks = self._snapshot[0]
+                    candidates = [i for i in range(len(blocks) - 1) if len(blocks[i]) <= 2 * len(blocks[i + 1])]
+                    if not candidates:
+                        return
+                    # Smallest pair first, so a posting is rewritten a
+                    # logarithmic number of times
+                    start = min(candidates, key=lambda i: len(blocks[i]) + len(blocks[i + 1]))
+                    to_merge = blocks[start:start + 2]
+                    name = self._new_block_name()
+
+                # The copy runs without the lock, so adds and searches continue
+                merged = _Block.merge(self.path, name, to_merge)
+
+                with self._lock:
+                    blocks = self._snapshot[0]
+                    if not all(any(block is other for other in blocks) for block in to_merge):
+                        # A delete rewrote one of them meanwhile; try again
+                        merged.delete_files()
+                        continue
+                    position = next(i for i, block in enumerate(blocks) if block is to_merge[0])
+                    self._publish(blocks[:position] + [merged] + blocks[position + 2:])
+                for block in to_merge:
+                    block.delete_files()
+
+    def _merge_in_background(self):
+        with self._lock:
+            if self._merge_thread and self._merge_thread.is_alive():
+                return
+            self._merge_thread = threading.Thread(target=self.merge, name="lexical-merge", daemon=True)
+            self._merge_thread.start()
+
+    def wait_for_merge(self):
+        """Block until any running background merge has finished."""
+        thread = self._merge_thread
+        if thread:
+            thread.join()
+
+    def search(
+        self,
+        query: str,
+        k: int,
+        allowed_ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Score chunks against the query with BM25.
+
+        Args:
+            query: Query string
+            k: Number of results to return
+            allowed_ids: Optional sorted array of chunk ids to restrict results to
+
+        Returns:
+            List of (chunk_id, score) pairs, best first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+
+        self.refresh()
+        blocks, chunk_count, total_length = self._snapshot
+        if chunk_count <= 0:
+            return []
+        avg_length = max(total_length / chunk_count, 1e-9)
+
+        # Each term's postings, idf and the most it can add to any chunk's score
+        entries = []
+        for term in terms:
+            postings = [found for found in (block.postings(term) for block in blocks) if found is not None]
+            df = sum(len(ids) for ids, *_ in postings)
+            if not df:
+                continue
+            idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+            bound = max(
+                float(self._weights(idf, max_tf, min_length, avg_length))
+                for _, _, _, max_tf, min_length in postings
+            )
+            entries.append((bound, idf, postings))
+        if not entries:
+            return []
+
+        entries.sort(key=lambda entry: -entry[0])
+        # remaining[i]: the most terms i.. together can add to a score
+        remaining = np.cumsum([bound for bound, _, _ in entries][::-1])[::-1]
+
+        ids = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+        for i, (_, idf, postings) in enumerate(entries):
+            threshold = np.partition(scores, len(scores) - k)[len(scores) - k] if len(scores) >= k else -np.inf
+            if threshold > remaining[i]:
+                # A chunk not scored yet can no longer reach the top k: only
+                # add this term's weight to the candidates that still can
+                keep = scores + remaining[i] >= threshold
+                ids, scores = ids[keep], scores[keep]
+                for term_ids, tfs, lengths, _, _ in postings:
+                    positions = np.minimum(np.searchsorted(term_ids, ids), len(term_ids) - 1)
+                    found = term_ids[positions] == ids
+                    positions = positions[found]
+                    scores[found] += self._weights(idf, tfs[positions], lengths[positions], avg_length)
+                continue
+
+            term_ids = np.concatenate([postings_ids for postings_ids, *_ in postings])
+            term_scores = np.concatenate([
+                self._weights(idf, tfs, lengths, avg_length) for _, tfs, lengths, _, _ in postings
+            ])
+            if allowed_ids is not None:
+                keep = _isin_sorted(term_ids, allowed_ids)
+                term_ids, term_scores = term_ids[keep], term_scores[keep]
+            ids, inverse = np.unique(np.concatenate([ids, term_ids]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores, term_scores]), minlength=len(ids))
+
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _weights(self, idf: float, tfs, lengths, avg_length: float) -> np.ndarray:
+        """BM25 term weight for postings with the given tf and chunk length."""
+        tfs = np.asarray(tfs, dtype=np.float64)
+        norm = self.k1 * (1 - self.b + self.b * np.asarray(lengths, dtype=np.float64) / avg_length)
+        return idf * tfs * (self.k1 + 1) / (tfs + norm)
+
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = None) -> Dict[int, float]:
+    """
+    Fuse several ranked id lists into one score per id.
+
+    Each list contributes 1 / (RRF_K + rank) for every id it contains.
+    """
+    k = k or config.RRF_K
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def _write_json_atomic(path: str, data: Dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _save_npy(path: str, array: np.ndarray):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """(inode, size, mtime) of a file, or None if it does not exist; changes when it is replaced."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _in_ranges(ids: np.ndarray, id_ranges: np.ndarray) -> np.ndarray:
+    """Mask of ids inside one of the sorted, disjoint [start, end) ranges."""
+    if not len(id_ranges) or not len(ids):
+        return np.zeros(len(ids), dtype=bool)
+    positions = np.searchsorted(id_ranges[:, 0], ids, side="right") - 1
+    return (positions >= 0) & (ids < id_ranges[np.maximum(positions, 0), 1])
+
+
+def _isin_sorted(values: np.ndarray, sorted_array: np.ndarray) -> np.ndarray:
+    if not len(sorted_array):
+        return np.zeros(len(values), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_array, values), len(sorted_array) - 1)
+    return sorted_array[positions] == values
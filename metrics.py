@@ -0,0 +1,304 @@
+"""
+Lightweight tracing and metrics for ingestion and queries.
+
+Code marks stages with nested spans:
+
+    with metrics.span("rag.query") as root:
+        with metrics.span("retrieval.search", k=5):
+            ...
+    root.to_dict()   # {'name', 'ms', 'attributes', 'children': [...]}
+
+Every finished span feeds a per-stage latency histogram, and counters track
+chunk/token counts and cache hits. When a top-level span finishes, its tree
+is written as one JSON log line (logger "legaleagle.metrics", plus
+METRICS_LOG_PATH if set). The aggregates are exported in the Prometheus text
+format to METRICS_PROMETHEUS_PATH and/or an HTTP /metrics endpoint on
+METRICS_PORT.
+
+With METRICS_ENABLED off, span() returns a shared no-op object and counters
+return immediately, so instrumented code pays one attribute lookup per call.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import config
+
+logger = logging.getLogger("legaleagle.metrics")
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_current_span = contextvars.ContextVar("legaleagle_span", default=None)
+_lock = threading.Lock()
+_histograms: Dict[str, list] = {}
+_counters: Dict[tuple, float] = {}
+_last_export = 0.0
+_log_handler: Optional[logging.Handler] = None
+_http_server = None
+
+
+class Span:
+    """
+    One timed stage, with attributes and nested child spans.
+
+    Finished children are aggregated by name as they close (see _add_child),
+    so a long-running root such as ingest.run holds one entry per stage name
+    rather than one per batch.
+    """
+
+    __slots__ = ('name', 'attributes', 'children', 'calls', 'start', 'seconds', 'parent', 'emit', '_token')
+
+    def __init__(self, name: str, attributes: Dict, parent: "Span" = None, emit: bool = True):
+        self.name = name
+        self.attributes = attributes
+        self.children: Dict[str, "Span"] = {}
+        self.calls = 1
+        self.parent = parent
+        self.emit = emit
+        self.start = 0.0
+        self.seconds = None
+        self._token = None
+
+    def set(self, **attributes):
+        """Attach attributes such as counts or cache outcomes."""
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        if self.parent is None:
+            self.parent = _current_span.get()
+        self._token = _current_span.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        _observe(self.name, self.seconds)
+        if self.parent is not None:
+            self.parent._add_child(self)
+        elif self.emit:
+            emit(self)
+        return False
+
+    def _add_child(self, child: "Span"):
+        """
+        Attach a finished child. A sibling with the same name (e.g. one per
+        page or batch) is merged into the existing entry: 'seconds' and
+        numeric attributes are summed, 'calls' counted and grandchildren
+        merged the same way.
+        """
+        with _lock:
+            self._merge_child(child)
+
+    def _merge_child(self, child: "Span"):
+        previous = self.children.get(child.name)
+        if previous is None:
+            self.children[child.name] = child
+            return
+        previous.seconds = (previous.seconds or 0.0) + (child.seconds or 0.0)
+        previous.calls += child.calls
+        for key, value in child.attributes.items():
+            if isinstance(value, (int, float)) and isinstance(previous.attributes.get(key), (int, float)):
+                previous.attributes[key] += value
+            else:
+                previous.attributes[key] = value
+        for grandchild in child.children.values():
+            previous._merge_child(grandchild)
+
+    def to_dict(self) -> Dict:
+        """The span tree as plain data; merged siblings carry a 'calls' count."""
+        with _lock:
+            children = list(self.children.values())
+        entry = {
+            'name': self.name,
+            'ms': round(self.seconds * 1000, 3) if self.seconds is not None else None,
+            'attributes': dict(self.attributes),
+            'children': [child.to_dict() for child in children]
+        }
+        if self.calls > 1:
+            entry['calls'] = self.calls
+        return entry
+
+
+class _NoopSpan:
+    """Stand-in returned by span() while metrics are disabled."""
+
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def to_dict(self):
+        return None
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name: str, parent: Span = None, emit: bool = True, **attributes):
+    """
+    Context manager timing a stage, nested under the current span.
+
+    Args:
+        name: Stage name, e.g. "retrieval.search"
+        parent: Explicit parent, for work that runs after the parent's block
+            has exited (e.g. a generator consumed later)
+        emit: For top-level spans, whether to log and export on exit; pass
+            False and call emit() yourself when children are added afterwards
+        **attributes: Initial attributes
+    """
+    if not config.METRICS_ENABLED or parent is _NOOP:
+        return _NOOP
+    return Span(name, attributes, parent, emit)
+
+
+def record(name: str, seconds: float, parent: Span, **attributes):
+    """
+    Add a stage that was timed by hand, e.g. across the yields of a generator
+    (a span open across a yield would leak into the consumer's code).
+    """
+    if not config.METRICS_ENABLED or parent is _NOOP:
+        return
+    finished = Span(name, attributes, parent)
+    finished.seconds = seconds
+    _observe(name, seconds)
+    if parent is not None:
+        parent._add_child(finished)
+
+
+def increment(name: str, value: float = 1, **labels):
+    """Add to a counter, exported as legaleagle_<name>_total."""
+    if not config.METRICS_ENABLED or not value:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _observe(stage: str, seconds: float):
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            # [count, sum, per-bucket counts]
+            histogram = _histograms[stage] = [0, 0.0, [0] * len(LATENCY_BUCKETS)]
+        histogram[0] += 1
+        histogram[1] += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram[2][i] += 1
+                break
+
+
+def emit(root):
+    """Log a finished trace as JSON and refresh the Prometheus export."""
+    if root is _NOOP:
+        return
+    _configure_log_file()
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({'ts': time.time(), 'trace': root.to_dict()}, default=str))
+
+    global _last_export
+    if config.METRICS_PROMETHEUS_PATH and time.time() - _last_export >= config.METRICS_EXPORT_INTERVAL_SECONDS:
+        _last_export = time.time()
+        write_prometheus(config.METRICS_PROMETHEUS_PATH)
+
+
+def _configure_log_file():
+    global _log_handler
+    if _log_handler is not None or not config.METRICS_LOG_PATH:
+        return
+    with _lock:
+        if _log_handler is None:
+            _log_handler = logging.FileHandler(config.METRICS_LOG_PATH)
+            _log_handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(_log_handler)
+            logger.setLevel(logging.INFO)
+
+
+def _label_text(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def render_prometheus() -> str:
+    """Current metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        histograms = {stage: (h[0], h[1], list(h[2])) for stage, h in _histograms.items()}
+        counters = dict(_counters)
+
+    if histograms:
+        lines.append("# HELP legaleagle_stage_duration_seconds Time spent per pipeline stage.")
+        lines.append("# TYPE legaleagle_stage_duration_seconds histogram")
+        for stage, (count, total, buckets) in sorted(histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f'legaleagle_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'legaleagle_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'legaleagle_stage_duration_seconds_sum{{stage="{stage}"}} {total:.6f}')
+            lines.append(f'legaleagle_stage_duration_seconds_count{{stage="{stage}"}} {count}')
+
+    names = sorted({name for name, _ in counters})
+    for name in names:
+        lines.append(f"# TYPE legaleagle_{name}_total counter")
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"legaleagle_{name}_total{_label_text(labels)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: str):
+    """Atomically write the Prometheus text export (for node_exporter's textfile collector)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def start_http_server(port: int):
+    """Serve /metrics on localhost:port from a daemon thread (once per process)."""
+    global _http_server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    with _lock:
+        if _http_server is not None:
+            return
+        _http_server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=_http_server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+def reset():
+    """Clear all collected metrics."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
@@ -1,79 +1,338 @@
 """
 PDF processing module for extracting and chunking text from legal contracts.
 """
+import hashlib
+import io
+import math
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, List, Optional, Tuple, Union
 import PyPDF2
-from typing import List, Tuple
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import config
+import metrics
+from chunker import ClauseChunker, DocumentChunks
+from text_cache import TextCache
+
+# A PDF can be given as a file path or as the raw bytes of an upload
+PDFSource = Union[str, bytes]
+
+# Identifies the text extraction in the text cache; bump the suffix when
+# _extract_page_range changes what it returns
+EXTRACTOR_VERSION = f"PyPDF2-{PyPDF2.__version__}/1"
+
+
+def _open_reader(pdf_source: PDFSource) -> PyPDF2.PdfReader:
+    """Open a PdfReader from a path or from in-memory bytes."""
+    if isinstance(pdf_source, (bytes, bytearray, memoryview)):
+        return PyPDF2.PdfReader(io.BytesIO(pdf_source))
+    return PyPDF2.PdfReader(pdf_source)
+
+
+def _extract_page_range(
+    pdf_source: PDFSource,
+    start: int,
+    end: int,
+    pdf_reader: Optional[PyPDF2.PdfReader] = None
+) -> List[Tuple[str, int]]:
+    """
+    Extract pages [start, end) of a PDF. Runs inside worker processes, so it
+    must stay a module-level function.
+    
+    A caller that already has the PDF open passes its reader so the file is
+    not parsed twice.
+    """
+    if pdf_reader is None:
+        pdf_reader = _open_reader(pdf_source)
+    text_with_pages = []
+    for page_num in range(start, end):
+        text = pdf_reader.pages[page_num].extract_text()
+        if text.strip():  # Only add non-empty pages
+            text_with_pages.append((text, page_num + 1))
+    return text_with_pages
+
+
+def document_identity(filename: str, content: bytes) -> dict:
+    """
+    Build the stable identity of an uploaded document.
+    
+    The id combines the filename with a hash of the file content, so an
+    unchanged re-upload maps to the same id while a revised version of the
+    same file gets a new one.
+    
+    Returns:
+        Dictionary with 'doc_id', 'filename' and 'content_hash' keys
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+    return {
+        'doc_id': f"{filename}@{content_hash[:16]}",
+        'filename': filename,
+        'content_hash': content_hash
+    }
+
+
+def _source_label(pdf_source: PDFSource, index: int) -> str:
+    return pdf_source if isinstance(pdf_source, str) else f"document {index + 1}"
+
+
+def _content_hash(pdf_source: PDFSource) -> str:
+    """SHA-256 of a PDF's bytes (the text cache key, as in document_identity)."""
+    if isinstance(pdf_source, str):
+        with open(pdf_source, "rb") as f:
+            pdf_source = f.read()
+    return hashlib.sha256(pdf_source).hexdigest()
 
 
 class PDFProcessor:
     """Handles PDF extraction and text chunking with page tracking."""
     
-    def __init__(self, chunk_size: int = None, chunk_overlap: int = None):
+    def __init__(self, chunk_size: int = None, chunk_overlap: int = None, text_cache: TextCache = None):
+        """
+        Args:
+            chunk_size: Target chunk length (defaults to CHUNK_SIZE)
+            chunk_overlap: Overlap of the pieces of a cut clause (defaults to CHUNK_OVERLAP)
+            text_cache: Store of extracted page text (defaults to one at
+                TEXT_CACHE_PATH when TEXT_CACHE_ENABLED, else none)
+        """
         self.chunk_size = chunk_size or config.CHUNK_SIZE
         self.chunk_overlap = chunk_overlap or config.CHUNK_OVERLAP
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap,
-            length_function=len,
-        )
+        self.chunker = ClauseChunker(self.chunk_size, self.chunk_overlap)
+        if text_cache is None and config.TEXT_CACHE_ENABLED:
+            text_cache = TextCache()
+        self.text_cache = text_cache
     
-    def extract_text_from_pdf(self, pdf_path: str) -> List[Tuple[str, int]]:
+    def extract_text_from_pdf(self, pdf_path: PDFSource) -> List[Tuple[str, int]]:
         """
         Extract text from PDF with page number tracking.
         
+        A PDF whose text is in the text cache is not parsed again.
+        
         Args:
-            pdf_path: Path to the PDF file
+            pdf_path: Path to the PDF file, or its raw bytes
             
         Returns:
             List of tuples (text, page_number)
         """
-        text_with_pages = []
-        
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                total_pages = len(pdf_reader.pages)
+            with metrics.span("pdf.extract") as extract_span:
+                content_hash = _content_hash(pdf_path) if self.text_cache is not None else None
+                pages = self.text_cache.get(content_hash) if self.text_cache is not None else None
+                cached = pages is not None
+                extract_span.set(cached=cached)
+                if not cached:
+                    pdf_reader = _open_reader(pdf_path)
+                    extract_span.set(pages=len(pdf_reader.pages))
+                    pages = _extract_page_range(pdf_path, 0, len(pdf_reader.pages), pdf_reader)
+                    if self.text_cache is not None:
+                        self.text_cache.put(content_hash, pages)
+                    metrics.increment("pages_extracted", len(pages))
+            if self.text_cache is not None:
+                metrics.increment("text_cache_lookups", result="hit" if cached else "miss")
+            return pages
+        except Exception as e:
+            raise Exception(f"Error reading PDF {_source_label(pdf_path, 0)}: {str(e)}")
+    
+    def iter_text_from_pdfs(
+        self,
+        pdf_sources: List[PDFSource],
+        max_workers: int = None
+    ) -> Iterator[Tuple[int, str, int]]:
+        """
+        Extract text from several PDFs in parallel, spreading page ranges of
+        every file over a process pool.
+        
+        Results are yielded as soon as each page range finishes, so they are
+        not in page order. Page numbers are exact (1-based) for each file.
+        
+        Args:
+            pdf_sources: Paths or raw bytes of the PDF files
+            max_workers: Number of worker processes (defaults to PDF_EXTRACT_WORKERS)
+            
+        Yields:
+            Tuples (source_index, text, page_number)
+        """
+        for index, text_with_pages, _ in self._iter_page_ranges(pdf_sources, max_workers):
+            for text, page_num in text_with_pages:
+                yield index, text, page_num
+    
+    def iter_documents_from_pdfs(
+        self,
+        pdf_sources: List[PDFSource],
+        max_workers: int = None
+    ) -> Iterator[Tuple[int, List[Tuple[str, int]]]]:
+        """
+        Like iter_text_from_pdfs, but yields each document once all of its
+        pages are extracted, for chunking across page breaks.
+        
+        Documents come in completion order (those in the text cache first,
+        without being parsed); their pages are in page order. Documents
+        without any text are not yielded.
+        
+        Yields:
+            Tuples (source_index, [(text, page_number), ...])
+        """
+        # Documents in the text cache come first and skip the process pool
+        uncached = list(range(len(pdf_sources)))
+        content_hashes = {}
+        if self.text_cache is not None:
+            uncached = []
+            for index, pdf_source in enumerate(pdf_sources):
+                content_hashes[index] = _content_hash(pdf_source)
+                pages = self.text_cache.get(content_hashes[index])
+                if pages is None:
+                    uncached.append(index)
+                elif pages:
+                    yield index, pages
+            metrics.increment("text_cache_lookups", len(pdf_sources) - len(uncached), result="hit")
+            metrics.increment("text_cache_lookups", len(uncached), result="miss")
+        if not uncached:
+            return
+        
+        pending = {}
+        ranges = self._iter_page_ranges([pdf_sources[index] for index in uncached], max_workers)
+        for position, text_with_pages, last_range in ranges:
+            pages = pending.setdefault(position, [])
+            pages.extend(text_with_pages)
+            if last_range:
+                del pending[position]
+                pages.sort(key=lambda page: page[1])
+                index = uncached[position]
+                if self.text_cache is not None:
+                    self.text_cache.put(content_hashes[index], pages)
+                if pages:
+                    yield index, pages
+    
+    def _iter_page_ranges(
+        self,
+        pdf_sources: List[PDFSource],
+        max_workers: int = None
+    ) -> Iterator[Tuple[int, List[Tuple[str, int]], bool]]:
+        """Yields (source_index, text_with_pages, is_last_range_of_the_file) per finished page range."""
+        max_workers = max_workers or config.PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+        # Page ranges of each file not finished yet
+        remaining = {}
+        
+        def iter_tasks():
+            for index, pdf_source in enumerate(pdf_sources):
+                try:
+                    total_pages = len(_open_reader(pdf_source).pages)
+                except Exception as e:
+                    raise Exception(f"Error reading PDF {_source_label(pdf_source, index)}: {str(e)}")
                 
-                for page_num in range(total_pages):
-                    page = pdf_reader.pages[page_num]
-                    text = page.extract_text()
-                    
-                    if text.strip():  # Only add non-empty pages
-                        text_with_pages.append((text, page_num + 1))
+                # Large ranges keep the per-task copy of in-memory PDFs small;
+                # several ranges per file keep every worker busy on big contracts
+                range_size = max(config.PDF_PAGES_PER_TASK, math.ceil(total_pages / max_workers))
+                starts = range(0, total_pages, range_size)
+                remaining[index] = len(starts)
+                for start in starts:
+                    yield index, start, min(start + range_size, total_pages)
         
-        except Exception as e:
-            raise Exception(f"Error reading PDF {pdf_path}: {str(e)}")
+        tasks = iter_tasks()
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            
+            def submit_next() -> bool:
+                task = next(tasks, None)
+                if task is None:
+                    return False
+                index, start, end = task
+                futures[executor.submit(_extract_page_range, pdf_sources[index], start, end)] = index
+                return True
+            
+            # Only a bounded number of page ranges is in flight at once, so
+            # memory does not grow with the number or size of the files
+            for _ in range(max_workers * 2):
+                if not submit_next():
+                    break
+            
+            try:
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index = futures.pop(future)
+                        try:
+                            text_with_pages = future.result()
+                        except Exception as e:
+                            raise Exception(
+                                f"Error reading PDF {_source_label(pdf_sources[index], index)}: {str(e)}"
+                            )
+                        submit_next()
+                        remaining[index] -= 1
+                        yield index, text_with_pages, remaining[index] == 0
+            finally:
+                for pending in futures:
+                    pending.cancel()
+    
+    def iter_text_from_pdf(self, pdf_path: PDFSource, max_workers: int = None) -> Iterator[Tuple[str, int]]:
+        """
+        Parallel, streaming variant of extract_text_from_pdf for a single file.
+        
+        Args:
+            pdf_path: Path to the PDF file, or its raw bytes
+            max_workers: Number of worker processes
+            
+        Yields:
+            Tuples (text, page_number) in completion order
+        """
+        for _, text, page_num in self.iter_text_from_pdfs([pdf_path], max_workers=max_workers):
+            yield text, page_num
+    
+    def chunk_document(self, text_with_pages: List[Tuple[str, int]]) -> DocumentChunks:
+        """
+        Clause-aware chunks of a whole document, as offsets into its text.
         
-        return text_with_pages
+        Args:
+            text_with_pages: All (text, page_number) tuples of one document
+            
+        Returns:
+            DocumentChunks; chunks may span page breaks
+        """
+        return self.chunker.split(text_with_pages)
     
-    def chunk_text(self, text_with_pages: List[Tuple[str, int]]) -> List[dict]:
+    def chunk_text(self, text_with_pages: List[Tuple[str, int]], document: dict = None) -> List[dict]:
         """
-        Chunk text while preserving page number information.
+        Chunk a document while preserving page number information.
+        
+        Pass all pages of a document at once: clauses continuing on the next
+        page are kept together.
         
         Args:
             text_with_pages: List of (text, page_number) tuples
+            document: Optional identity from document_identity; its 'doc_id'
+                and 'filename' are added to every chunk's metadata
             
         Returns:
-            List of dictionaries with 'text', 'page', and 'metadata' keys
+            List of dictionaries with 'text', 'page', and 'metadata' keys;
+            'page' is the first page of the chunk and metadata 'page_end'
+            the last; 'char_start' and 'char_end' locate it in the document
+            text
         """
+        with metrics.span("pdf.chunk", pages=len(text_with_pages)) as chunk_span:
+            chunks = self._chunk_pages(text_with_pages, document)
+            chunk_span.set(chunks=len(chunks))
+        metrics.increment("chunks_created", len(chunks))
+        return chunks
+    
+    def _chunk_pages(self, text_with_pages: List[Tuple[str, int]], document: dict = None) -> List[dict]:
+        document_chunks = self.chunk_document(text_with_pages)
         chunks = []
         
-        for text, page_num in text_with_pages:
-            # Split text into chunks
-            text_chunks = self.text_splitter.split_text(text)
-            
-            for chunk in text_chunks:
-                chunks.append({
-                    'text': chunk,
+        for i in range(len(document_chunks)):
+            chunk = document_chunks.chunk(i)
+            page_num, page_end = document_chunks.pages(i)
+            chunks.append({
+                'text': chunk,
+                'page': page_num,
+                'metadata': {
+                    'source': 'contract',
                     'page': page_num,
-                    'metadata': {
-                        'source': 'contract',
-                        'page': page_num,
-                        'chunk_length': len(chunk)
-                    }
-                })
+                    'page_end': page_end,
+                    'char_start': int(document_chunks.starts[i]),
+                    'char_end': int(document_chunks.ends[i]),
+                    'chunk_length': len(chunk)
+                }
+            })
+            if document:
+                chunks[-1]['metadata']['doc_id'] = document['doc_id']
+                chunks[-1]['metadata']['filename'] = document['filename']
         
         return chunks
-
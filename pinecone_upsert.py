@@ -0,0 +1,139 @@
+"""
+Batched, concurrent upserts to a Pinecone index.
+
+Each add_documents batch is cut into requests of PINECONE_UPSERT_BATCH_SIZE
+vectors, and up to PINECONE_MAX_IN_FLIGHT of them are sent at once, so a
+large ingest is no longer bound by one network round trip per request.
+Vector ids are derived from the chunk content, so resending a request whose
+response was lost overwrites the same vectors: a failed request is simply
+retried, with exponential backoff, on rate limits (429), server errors (5xx)
+and connection failures. Other errors (e.g. a dimension mismatch) are not
+retried.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+import config
+from rate_limit import is_rate_limit_error, retry_after_seconds
+
+
+class PineconeUpserter:
+    """Sends vectors to a Pinecone index in parallel, bounded, retried batches."""
+
+    def __init__(
+        self,
+        index,
+        batch_size: int = None,
+        max_in_flight: int = None,
+        max_retries: int = None,
+        namespace: str = None
+    ):
+        """
+        Args:
+            index: A pinecone Index (or fake_pinecone.FakePineconeIndex)
+            batch_size: Vectors per upsert request (defaults to PINECONE_UPSERT_BATCH_SIZE)
+            max_in_flight: Concurrent requests (defaults to PINECONE_MAX_IN_FLIGHT)
+            max_retries: Retries per request after a retryable error (defaults to PINECONE_MAX_RETRIES)
+            namespace: Pinecone namespace to write to (defaults to the index's default)
+        """
+        self.index = index
+        self.batch_size = batch_size or config.PINECONE_UPSERT_BATCH_SIZE
+        self.max_in_flight = max_in_flight or config.PINECONE_MAX_IN_FLIGHT
+        self.max_retries = config.PINECONE_MAX_RETRIES if max_retries is None else max_retries
+        self.namespace = namespace
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def upsert(self, ids: List[str], vectors: List[List[float]], metadatas: List[Dict]) -> Dict[str, int]:
+        """
+        Upsert vectors, returning once every request has succeeded.
+
+        Args:
+            ids: Deterministic vector ids, so retries are idempotent
+            vectors: Embeddings, aligned with ids
+            metadatas: Metadata dicts, aligned with ids; None values are dropped
+                (Pinecone rejects nulls)
+
+        Returns:
+            Dictionary with 'vectors', 'requests' and 'retries' counts
+
+        Raises:
+            The error of a request that still failed after max_retries
+            retries, once all other requests have finished; calling upsert
+            again with the same arguments is safe
+        """
+        records = [
+            {
+                'id': vector_id,
+                'values': [float(value) for value in vector],
+                'metadata': {key: value for key, value in metadata.items() if value is not None}
+            }
+            for vector_id, vector, metadata in zip(ids, vectors, metadatas)
+        ]
+        batches = [records[i:i + self.batch_size] for i in range(0, len(records), self.batch_size)]
+        if not batches:
+            return {'vectors': 0, 'requests': 0, 'retries': 0}
+
+        futures = [self._get_pool().submit(self._send, batch) for batch in batches]
+        wait(futures)
+        retries = 0
+        for future in futures:
+            error = future.exception()
+            if error is not None:
+                raise error
+            retries += future.result()
+        return {'vectors': len(records), 'requests': len(batches), 'retries': retries}
+
+    def _send(self, batch: List[Dict]) -> int:
+        """Send one request, retrying retryable errors; returns the number of retries."""
+        attempt = 0
+        while True:
+            try:
+                if self.namespace is None:
+                    self.index.upsert(vectors=batch)
+                else:
+                    self.index.upsert(vectors=batch, namespace=self.namespace)
+                return attempt
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                time.sleep(_backoff_delay(attempt, e))
+                attempt += 1
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # Threads are kept across add_documents batches
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="pinecone-upsert")
+            return self._pool
+
+    def close(self):
+        """Shut down the request threads."""
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for rate limits, server errors and connection problems."""
+    status = getattr(error, 'status', None) or getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    if is_rate_limit_error(error) or isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # urllib3 errors raised by the pinecone client do not subclass the builtins
+    name = type(error).__name__
+    return any(word in name for word in ('Timeout', 'Connection', 'Protocol', 'MaxRetry'))
+
+
+def _backoff_delay(attempt: int, error: BaseException) -> float:
+    """Exponential backoff with jitter, honouring Retry-After when present."""
+    hinted = retry_after_seconds(error)
+    if hinted is not None:
+        return min(hinted, config.PINECONE_MAX_BACKOFF_SECONDS)
+    delay = min(config.PINECONE_BASE_BACKOFF_SECONDS * (2 ** attempt), config.PINECONE_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
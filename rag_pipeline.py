@@ -2,28 +2,59 @@
 RAG pipeline module for question answering with citation.
 Uses Groq for fast, free LLM inference.
 """
+import asyncio
+import time
 from typing import List, Dict
-from langchain_groq import ChatGroq
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 import config
+import metrics
+from answer_cache import SemanticAnswerCache, cache_scope
+from context_packer import ContextPacker
+from rate_limit import AdaptiveConcurrencyLimiter, backoff_delay, is_rate_limit_error
 from vector_store import VectorStoreManager
 
+NO_CONTEXT_ANSWER = "I couldn't find any relevant information in the contract to answer your question."
+
 
 class RAGPipeline:
     """Implements RAG pipeline for legal contract querying."""
     
-    def __init__(self, vector_store_manager: VectorStoreManager):
+    def __init__(
+        self,
+        vector_store_manager: VectorStoreManager,
+        answer_cache: SemanticAnswerCache = None,
+        llm: BaseChatModel = None,
+        clause_digest=None
+    ):
         self.vector_store = vector_store_manager
         
-        # Use Groq for fast, free LLM
-        if not config.GROQ_API_KEY:
-            raise ValueError("Groq API key not found. Set GROQ_API_KEY or OPENAI_API_KEY in .env")
+        # Precomputed answers to the standard questions (clause_digest.ClauseDigest)
+        self.clause_digest = clause_digest
         
-        self.llm = ChatGroq(
-            model_name=config.LLM_MODEL,
-            temperature=0,
-            groq_api_key=config.GROQ_API_KEY
-        )
+        # Merges overlapping hits and keeps the context within a token budget
+        self.context_packer = ContextPacker()
+        
+        # Semantically equivalent questions are answered from this cache
+        if answer_cache is None and config.ANSWER_CACHE_ENABLED:
+            answer_cache = SemanticAnswerCache()
+        self.answer_cache = answer_cache
+        
+        if llm is not None:
+            # Injected chat model, e.g. stub_llm.StubChatModel for offline runs
+            self.llm = llm
+        else:
+            # Use Groq for fast, free LLM
+            from langchain_groq import ChatGroq
+            
+            if not config.GROQ_API_KEY:
+                raise ValueError("Groq API key not found. Set GROQ_API_KEY or OPENAI_API_KEY in .env")
+            
+            self.llm = ChatGroq(
+                model_name=config.LLM_MODEL,
+                temperature=0,
+                groq_api_key=config.GROQ_API_KEY
+            )
         
         # Create prompt template
         self.prompt_template = ChatPromptTemplate.from_messages([
@@ -52,67 +83,351 @@ Please provide a concise answer based on the context above, with page citations.
         """
         Format search results into context string.
         
+        Overlapping and adjacent chunks are merged, near-duplicates dropped
+        and the rest packed best-first into CONTEXT_TOKEN_BUDGET tokens.
+        
         Args:
             search_results: List of search results from vector store
             
         Returns:
             Formatted context string
         """
+        return self._format_excerpts(self.context_packer.pack(search_results))
+    
+    def _format_excerpts(self, excerpts: List[Dict]) -> str:
         context_parts = []
-        for i, result in enumerate(search_results, 1):
-            page = result['metadata'].get('page', 'Unknown')
-            text = result['text']
+        for i, excerpt in enumerate(excerpts, 1):
+            page = _page_label(excerpt['metadata'])
+            text = excerpt['text']
             context_parts.append(f"[Excerpt {i} - Page {page}]\n{text}\n")
         
         return "\n".join(context_parts)
     
-    def query(self, question: str, top_k: int = None) -> Dict:
+    def _prepare(self, question: str, top_k: int = None, filters: Dict = None) -> Dict:
         """
-        Process a query through the RAG pipeline.
+        Everything a query needs before the LLM call: the answer cache lookup,
+        retrieval, citations/sources and the prompt messages.
         
-        Args:
-            question: User's question
-            top_k: Number of context chunks to retrieve
-            
         Returns:
-            Dictionary with answer, citations, and source information
+            Dictionary with 'cached' (a cached result or None), 'citations',
+            'sources', 'messages' (None when nothing relevant was found) and
+            the cache bookkeeping needed to store the final answer
         """
+        top_k = top_k or config.TOP_K_RESULTS
+        with metrics.span("embed_query"):
+            question_vector = self.vector_store.embeddings.embed_query(question)
+        prepared = self._lookup(question_vector, top_k, filters)
+        if prepared['cached'] is not None:
+            return prepared
+        
         # Retrieve relevant contexts
-        search_results = self.vector_store.similarity_search(question, k=top_k or config.TOP_K_RESULTS)
+        search_results = self.vector_store.similarity_search(
+            question, k=top_k, filters=filters, query_vector=question_vector
+        )
+        self._attach_context(prepared, question, search_results)
+        return prepared
+    
+    def _lookup(self, question_vector: List[float], top_k: int, filters: Dict = None) -> Dict:
+        """Start a prepared query and try the clause digest, then the answer cache."""
+        prepared = {
+            'cached': None,
+            'question_vector': question_vector,
+            'scope': cache_scope(top_k, filters),
+            'index_version': self.vector_store.index_version,
+            'citations': [],
+            'sources': [],
+            'messages': None
+        }
+        
+        if self.clause_digest is not None:
+            with metrics.span("clause_digest.lookup") as lookup_span:
+                prepared['cached'] = self.clause_digest.lookup(question_vector, filters)
+                outcome = "miss" if prepared['cached'] is None else "hit"
+                lookup_span.set(result=outcome)
+            metrics.increment("clause_digest_lookups", result=outcome)
+            if prepared['cached'] is not None:
+                return prepared
         
+        if self.answer_cache is not None:
+            with metrics.span("answer_cache.lookup") as lookup_span:
+                prepared['cached'] = self.answer_cache.lookup(
+                    question_vector, prepared['scope'], prepared['index_version']
+                )
+                outcome = "miss" if prepared['cached'] is None else "hit"
+                lookup_span.set(result=outcome)
+            metrics.increment("answer_cache_lookups", result=outcome)
+        return prepared
+    
+    def _attach_context(self, prepared: Dict, question: str, search_results: List[Dict]):
+        """Add prompt messages, citations and sources for the retrieved chunks."""
         if not search_results:
-            return {
-                'answer': "I couldn't find any relevant information in the contract to answer your question.",
-                'citations': [],
-                'sources': []
-            }
+            return
         
         # Format context
-        context = self.format_context(search_results)
-        
-        # Generate answer using LLM
-        messages = self.prompt_template.format_messages(
-            context=context,
-            question=question
-        )
-        
-        response = self.llm.invoke(messages)
-        answer = response.content
+        with metrics.span("prompt.format", chunks=len(search_results)) as format_span:
+            excerpts = self.context_packer.pack(search_results)
+            context = self._format_excerpts(excerpts)
+            prepared['messages'] = self.prompt_template.format_messages(
+                context=context,
+                question=question
+            )
+            format_span.set(
+                excerpts=len(excerpts),
+                context_tokens=sum(excerpt['tokens'] for excerpt in excerpts),
+                context_chars=len(context)
+            )
         
         # Extract citations and sources
-        citations = [result['metadata'].get('page', 'Unknown') for result in search_results]
-        sources = [
+        # A chunk spanning a page break cites every page it covers
+        citations = []
+        for result in search_results:
+            page = result['metadata'].get('page', 'Unknown')
+            page_end = result['metadata'].get('page_end', page)
+            if isinstance(page, int) and isinstance(page_end, int):
+                citations.extend(range(page, page_end + 1))
+            else:
+                citations.append(page)
+        prepared['citations'] = sorted(list(set(citations)))
+        prepared['sources'] = [
             {
-                'page': result['metadata'].get('page', 'Unknown'),
+                'page': _page_label(result['metadata']),
                 'text_preview': result['text'][:200] + "...",
-                'similarity_score': result['score']
+                'similarity_score': result['score'],
+                'fused_score': result.get('fused_score')
             }
             for result in search_results
         ]
+    
+    def _finish(self, prepared: Dict, answer: str) -> Dict:
+        """Build the result for a generated answer and store it in the answer cache."""
+        result = {
+            'answer': answer,
+            'citations': prepared['citations'],
+            'sources': prepared['sources']
+        }
+        
+        if self.answer_cache is not None:
+            self.answer_cache.store(
+                prepared['question_vector'], prepared['scope'], prepared['index_version'], result
+            )
+        
+        return {**result, 'from_cache': False}
+    
+    def query(self, question: str, top_k: int = None, filters: Dict = None) -> Dict:
+        """
+        Process a query through the RAG pipeline.
+        
+        Args:
+            question: User's question
+            top_k: Number of context chunks to retrieve
+            filters: Optional document/page/date filters, see
+                VectorStoreManager.similarity_search
+            
+        Returns:
+            Dictionary with answer, citations, and source information, plus
+            'from_cache' telling whether it was served by the answer cache or
+            the clause digest ('from_digest' is then also True) and
+            'timings', the nested per-stage breakdown (None if metrics are off)
+        """
+        with metrics.span("rag.query") as trace:
+            prepared = self._prepare(question, top_k, filters)
+            
+            if prepared['cached'] is not None:
+                result = {**prepared['cached'], 'from_cache': True}
+            elif prepared['messages'] is None:
+                result = {
+                    'answer': NO_CONTEXT_ANSWER,
+                    'citations': [],
+                    'sources': [],
+                    'from_cache': False
+                }
+            else:
+                # Generate answer using LLM
+                with metrics.span("llm.generate") as llm_span:
+                    response = self.llm.invoke(prepared['messages'])
+                    llm_span.set(**_token_usage(getattr(response, 'usage_metadata', None)))
+                result = self._finish(prepared, response.content)
+        
+        return {**result, 'timings': trace.to_dict()}
+    
+    def stream_query(self, question: str, top_k: int = None, filters: Dict = None) -> Dict:
+        """
+        Streaming variant of query.
+        
+        Retrieval runs immediately, so citations and sources are in the
+        returned dictionary before the first answer token is generated. The
+        answer itself is produced lazily by 'answer_stream'; once the stream
+        is exhausted the full answer is cached exactly as query would cache it.
+        
+        Args:
+            question: User's question
+            top_k: Number of context chunks to retrieve
+            filters: Optional document/page/date filters
+            
+        Returns:
+            Dictionary with 'citations', 'sources', 'from_cache' (and
+            'from_digest' for a clause digest answer), 'answer_stream', an iterator of answer text fragments, and
+            'trace', whose to_dict() gives the per-stage breakdown once the
+            stream is exhausted (None if metrics are off)
+        """
+        # The trace is emitted once the answer has been generated
+        with metrics.span("rag.stream_query", emit=False) as trace:
+            prepared = self._prepare(question, top_k, filters)
+        
+        if prepared['cached'] is not None:
+            metrics.emit(trace)
+            cached = prepared['cached']
+            # Pass through markers such as 'from_digest' along with the citations and sources
+            return {
+                **{key: value for key, value in cached.items() if key != 'answer'},
+                'from_cache': True,
+                'answer_stream': iter([cached['answer']]),
+                'trace': trace
+            }
+        
+        if prepared['messages'] is None:
+            metrics.emit(trace)
+            return {
+                'citations': [],
+                'sources': [],
+                'from_cache': False,
+                'answer_stream': iter([NO_CONTEXT_ANSWER]),
+                'trace': trace
+            }
+        
+        def answer_stream():
+            parts = []
+            start = time.perf_counter()
+            first_token = None
+            usage = None
+            for chunk in self.llm.stream(prepared['messages']):
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                if chunk.content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    parts.append(chunk.content)
+                    yield chunk.content
+            # Timed by hand: a span open across the yields would capture the caller's work
+            metrics.record(
+                "llm.stream",
+                time.perf_counter() - start,
+                parent=trace,
+                first_token_ms=round((first_token or 0) * 1000, 3),
+                **_token_usage(usage)
+            )
+            self._finish(prepared, "".join(parts))
+            metrics.emit(trace)
         
         return {
-            'answer': answer,
-            'citations': sorted(list(set(citations))),
-            'sources': sources
+            'citations': prepared['citations'],
+            'sources': prepared['sources'],
+            'from_cache': False,
+            'answer_stream': answer_stream(),
+            'trace': trace
         }
+    
+    async def aquery_batch(
+        self,
+        questions: List[str],
+        top_k: int = None,
+        filters: Dict = None,
+        max_concurrency: int = None
+    ) -> List[Dict]:
+        """
+        Answer many questions concurrently.
+        
+        All questions are embedded in one batched call and retrieved with one
+        multi-query search; LLM calls then run concurrently under an adaptive
+        cap that halves on rate-limit responses and retries them with
+        exponential backoff.
+        
+        Args:
+            questions: Questions to answer
+            top_k: Number of context chunks to retrieve per question
+            filters: Optional document/page/date filters applied to every question
+            max_concurrency: Upper bound on in-flight LLM calls
+                (defaults to BATCH_MAX_CONCURRENCY)
+            
+        Returns:
+            One result per question, in order, shaped like query's result. A
+            question whose LLM call still fails after BATCH_MAX_RETRIES has
+            'answer' None and an 'error' message.
+        """
+        if not questions:
+            return []
+        
+        top_k = top_k or config.TOP_K_RESULTS
+        question_vectors = self.vector_store.embeddings.embed_queries(questions)
+        prepared = [self._lookup(vector, top_k, filters) for vector in question_vectors]
+        
+        pending = [i for i, item in enumerate(prepared) if item['cached'] is None]
+        if pending:
+            all_results = self.vector_store.similarity_search_many(
+                [questions[i] for i in pending],
+                [question_vectors[i] for i in pending],
+                k=top_k,
+                filters=filters
+            )
+            for i, search_results in zip(pending, all_results):
+                self._attach_context(prepared[i], questions[i], search_results)
+        
+        limiter = AdaptiveConcurrencyLimiter(max_concurrency)
+        
+        async def answer(item: Dict) -> Dict:
+            if item['cached'] is not None:
+                return {**item['cached'], 'from_cache': True}
+            if item['messages'] is None:
+                return {'answer': NO_CONTEXT_ANSWER, 'citations': [], 'sources': [], 'from_cache': False}
+            
+            for attempt in range(config.BATCH_MAX_RETRIES + 1):
+                async with limiter:
+                    try:
+                        response = await self.llm.ainvoke(item['messages'])
+                    except Exception as e:
+                        if not is_rate_limit_error(e) or attempt == config.BATCH_MAX_RETRIES:
+                            return {
+                                'answer': None,
+                                'citations': item['citations'],
+                                'sources': item['sources'],
+                                'from_cache': False,
+                                'error': str(e)
+                            }
+                        limiter.on_rate_limit()
+                        error = e
+                    else:
+                        limiter.on_success()
+                        return self._finish(item, response.content)
+                # Sleep outside the limiter so the slot is free meanwhile
+                await asyncio.sleep(backoff_delay(attempt, error))
+        
+        return await asyncio.gather(*(answer(item) for item in prepared))
+    
+    def query_batch(
+        self,
+        questions: List[str],
+        top_k: int = None,
+        filters: Dict = None,
+        max_concurrency: int = None
+    ) -> List[Dict]:
+        """Synchronous wrapper around aquery_batch."""
+        return asyncio.run(self.aquery_batch(questions, top_k, filters, max_concurrency))
+
+
+def _token_usage(usage) -> Dict[str, int]:
+    """Token counts from a message's usage_metadata (if reported), added to the token counters."""
+    if not usage:
+        return {}
+    counts = {
+        'input_tokens': usage.get('input_tokens', 0),
+        'output_tokens': usage.get('output_tokens', 0)
+    }
+    metrics.increment("llm_tokens", counts['input_tokens'], kind="input")
+    metrics.increment("llm_tokens", counts['output_tokens'], kind="output")
+    return counts
+
 
+def _page_label(metadata: Dict):
+    """Page of a chunk, or "first-last" for a chunk spanning a page break."""
+    page = metadata.get('page', 'Unknown')
+    page_end = metadata.get('page_end', page)
+    return page if page_end == page else f"{page}-{page_end}"
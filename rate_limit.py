@@ -0,0 +1,77 @@
+"""
+Rate-limit-aware concurrency control for batched LLM calls.
+
+AdaptiveConcurrencyLimiter caps the number of in-flight requests and adapts
+the cap AIMD-style: it halves on a rate-limit response and creeps back up by
+roughly one slot per window of successful calls.
+"""
+import asyncio
+import random
+from typing import Optional
+
+import config
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """
+    True for HTTP 429 / rate-limit errors from Groq or any other client.
+
+    Only the status code or the client's RateLimitError class count; the
+    message text is not inspected, since "429" can appear in any error.
+    """
+    for source in (error, getattr(error, 'response', None)):
+        if 429 in (getattr(source, 'status_code', None), getattr(source, 'status', None)):
+            return True
+    return 'ratelimit' in type(error).__name__.lower()
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """The server's Retry-After hint in seconds, if the error carries one."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        value = headers.get('retry-after')
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, error: BaseException = None) -> float:
+    """Exponential backoff with jitter, honouring Retry-After when present."""
+    hinted = retry_after_seconds(error) if error is not None else None
+    if hinted is not None:
+        return min(hinted, config.BATCH_MAX_BACKOFF_SECONDS)
+    delay = min(config.BATCH_BASE_BACKOFF_SECONDS * (2 ** attempt), config.BATCH_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Async concurrency cap that backs off on rate limits (AIMD)."""
+
+    def __init__(self, max_concurrency: int = None, min_concurrency: int = 1):
+        self.max_concurrency = max_concurrency or config.BATCH_MAX_CONCURRENCY
+        self.min_concurrency = min_concurrency
+        self.limit = float(self.max_concurrency)
+        self.rate_limited = 0
+        self._active = 0
+        self._condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._active < int(self.limit))
+            self._active += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self._active -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        # Additive increase: about one extra slot per `limit` successes
+        self.limit = min(self.max_concurrency, self.limit + 1.0 / self.limit)
+
+    def on_rate_limit(self):
+        # Multiplicative decrease
+        self.rate_limited += 1
+        self.limit = max(self.min_concurrency, self.limit / 2)
@@ -0,0 +1,71 @@
+"""
+Process-wide registry of shared resources for the Streamlit app.
+
+The embedding model, the vector index and the LLM client are expensive to
+build, so they are created lazily on first use and shared by every session
+and rerun in the process. Heavy modules (torch via sentence-transformers,
+langchain) are only imported at that point, which keeps app startup fast.
+
+Query results are memoized by (question, retrieval settings, index version),
+so a Streamlit rerun re-renders an answer rather than recomputing it.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import config
+
+_lock = threading.RLock()
+_vector_store = None
+_rag_pipeline = None
+_query_memo = OrderedDict()
+
+
+def get_vector_store():
+    """The shared VectorStoreManager, created on first call."""
+    global _vector_store
+    with _lock:
+        if _vector_store is None:
+            from vector_store import VectorStoreManager
+            _vector_store = VectorStoreManager()
+        return _vector_store
+
+
+def get_rag_pipeline():
+    """The shared RAGPipeline (and its LLM client), created on first call."""
+    global _rag_pipeline
+    with _lock:
+        if _rag_pipeline is None:
+            from rag_pipeline import RAGPipeline
+            clause_digest = None
+            if config.CLAUSE_DIGEST_ENABLED:
+                from clause_digest import ClauseDigest
+                clause_digest = ClauseDigest(get_vector_store())
+            _rag_pipeline = RAGPipeline(get_vector_store(), clause_digest=clause_digest)
+        return _rag_pipeline
+
+
+def query_key(question: str, top_k: int = None, filters: Dict = None) -> Hashable:
+    """Memo key for a query against the current state of the index."""
+    from answer_cache import cache_scope
+
+    top_k = top_k or config.TOP_K_RESULTS
+    return (question.strip(), cache_scope(top_k, filters), get_vector_store().index_version)
+
+
+def get_memoized(key: Hashable) -> Optional[Dict]:
+    """Previously computed result for this exact query, if any."""
+    with _lock:
+        result = _query_memo.get(key)
+        if result is not None:
+            _query_memo.move_to_end(key)
+        return result
+
+
+def memoize(key: Hashable, result: Dict):
+    """Remember a finished query result, evicting the least recently used."""
+    with _lock:
+        _query_memo[key] = result
+        _query_memo.move_to_end(key)
+        while len(_query_memo) > config.QUERY_MEMO_MAX_ENTRIES:
+            _query_memo.popitem(last=False)
@@ -0,0 +1,93 @@
+"""
+Client side of the shared retrieval service (see retrieval_service.py).
+
+With RETRIEVAL_SERVICE_URL set, VectorStoreManager keeps no index or
+embedding model of its own: every operation is one JSON request to the
+service, which holds the single copy of both for all sessions and processes.
+"""
+import http.client
+import json
+import urllib.parse
+from typing import Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+import config
+
+
+class RetrievalClient:
+    """Calls operations of a retrieval service over HTTP on localhost."""
+
+    def __init__(self, url: str = None, timeout: float = None):
+        """
+        Args:
+            url: Service base URL (defaults to RETRIEVAL_SERVICE_URL)
+            timeout: Seconds to wait for a response (defaults to RETRIEVAL_SERVICE_TIMEOUT_SECONDS)
+        """
+        self.url = url or config.RETRIEVAL_SERVICE_URL
+        self.timeout = timeout or config.RETRIEVAL_SERVICE_TIMEOUT_SECONDS
+        parsed = urllib.parse.urlsplit(self.url)
+        if parsed.scheme != "http" or not parsed.hostname:
+            raise ValueError(f"Retrieval service URL must look like http://127.0.0.1:8765, got {self.url!r}")
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+
+    def call(self, operation: str, **arguments):
+        """
+        Run an operation on the service.
+
+        Args:
+            operation: VectorStoreManager method name, e.g. "similarity_search"
+            **arguments: Its keyword arguments (JSON-serializable)
+
+        Returns:
+            The operation's result
+        """
+        body = json.dumps(arguments).encode("utf-8")
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.request("POST", f"/{operation}", body, {"Content-Type": "application/json"})
+            response = connection.getresponse()
+            payload = json.loads(response.read() or b"{}")
+        except (ConnectionError, OSError) as e:
+            raise ConnectionError(f"Retrieval service at {self.url} is not reachable: {e}") from e
+        finally:
+            connection.close()
+
+        if response.status == 200:
+            return payload['result']
+        message = payload.get('error', response.reason)
+        if response.status in (400, 404):
+            raise ValueError(message)
+        raise RuntimeError(f"Retrieval service error: {message}")
+
+
+class RemoteEmbeddings(Embeddings):
+    """Embeddings computed by the service's model, for code that embeds queries itself."""
+
+    def __init__(self, client: RetrievalClient):
+        self.client = client
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.call("embed_documents", texts=texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.call("embed_query", text=text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.client.call("embed_queries", texts=texts)
+
+
+def encode_filters(filters: Dict) -> Dict:
+    """Search filters in JSON form: date bounds become Unix timestamps."""
+    if not filters:
+        return filters
+    from segment_store import _to_timestamp
+
+    encoded = dict(filters)
+    if encoded.get('doc_ids') is not None:
+        encoded['doc_ids'] = list(encoded['doc_ids'])
+    if encoded.get('date_range') is not None:
+        start, end = encoded['date_range']
+        encoded['date_range'] = [_to_timestamp(start), _to_timestamp(end, end_of_day=True)]
+    return encoded
@@ -0,0 +1,228 @@
+"""
+Shared local retrieval service.
+
+One process holds the index and the embedding model for every Streamlit
+session and CLI run on the machine, instead of one copy per session:
+
+    python retrieval_service.py --port 8765
+    RETRIEVAL_SERVICE_URL=http://127.0.0.1:8765 streamlit run app.py
+
+Requests are JSON over HTTP on localhost: POST /<operation> with the keyword
+arguments of the VectorStoreManager method of that name, answered with
+{"result": ...}. Searches, lookups and query embeddings run concurrently on a
+thread pool (the FAISS scans and the model release the GIL, so they use all
+cores). Index writes are queued to a single writer thread, so uploads from
+different sessions can no longer interleave in the index directory; document
+embeddings go through it too, since they feed the ingestion stats that
+add_documents reports. Each
+write publishes a new snapshot of the segment list, tombstones and document
+registry in one step; searches run against the snapshot current when they
+start and never see a half-applied write.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict
+
+import config
+
+# Operations served concurrently on the request threads
+READ_OPERATIONS = frozenset({
+    'similarity_search', 'similarity_search_many', 'has_document', 'list_documents',
+    'index_version', 'embed_query', 'embed_queries',
+})
+
+# Operations applied one at a time, in arrival order, by the writer thread
+WRITE_OPERATIONS = frozenset({
+    'add_documents', 'begin_document', 'begin_reindex', 'commit_document', 'upsert_document',
+    'delete_document', 'embed_documents',
+})
+
+
+class RetrievalService:
+    """Runs read operations concurrently and write operations through one writer."""
+
+    def __init__(self, manager=None):
+        """
+        Args:
+            manager: VectorStoreManager over a local index (by default one is
+                created, ignoring RETRIEVAL_SERVICE_URL)
+        """
+        if manager is None:
+            from vector_store import VectorStoreManager
+            manager = VectorStoreManager(service_url="")
+        self.manager = manager
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="retrieval-writer", daemon=True)
+        self._writer.start()
+
+    def handle(self, operation: str, arguments: Dict):
+        """
+        Run one operation.
+
+        Raises:
+            ValueError: For an unknown operation or invalid arguments
+        """
+        if operation in READ_OPERATIONS:
+            return self._read(operation, arguments)
+        if operation in WRITE_OPERATIONS:
+            future = Future()
+            self._writes.put((operation, arguments, future))
+            return future.result()
+        raise ValueError(f"Unknown operation: {operation}")
+
+    def _read(self, operation: str, arguments: Dict):
+        manager = self.manager
+        if operation == 'index_version':
+            return manager.index_version
+        if operation == 'embed_query':
+            return manager.embeddings.embed_query(arguments['text'])
+        if operation == 'embed_queries':
+            return manager.embeddings.embed_queries(arguments['texts'])
+        return getattr(manager, operation)(**arguments)
+
+    def _write(self, operation: str, arguments: Dict):
+        if operation == 'embed_documents':
+            return self.manager.embeddings.embed_documents(arguments['texts'])
+        return getattr(self.manager, operation)(**arguments)
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            if item is None:
+                return
+            operation, arguments, future = item
+            try:
+                future.set_result(self._write(operation, arguments))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def close(self):
+        """Finish queued writes and stop the writer thread."""
+        self._writes.put(None)
+        self._writer.join()
+
+
+class _PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles connections on a fixed-size thread pool."""
+
+    def __init__(self, address, handler, threads: int):
+        super().__init__(address, handler)
+        self.threads = threads
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="retrieval")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def make_server(service: RetrievalService, host: str = None, port: int = None, threads: int = None) -> HTTPServer:
+    """
+    HTTP server for a service; call serve_forever() on it.
+
+    Args:
+        service: The service answering requests
+        host: Interface to bind (defaults to RETRIEVAL_SERVICE_HOST, localhost)
+        port: Port to bind (defaults to RETRIEVAL_SERVICE_PORT; 0 picks a free one)
+        threads: Request threads (defaults to RETRIEVAL_SERVICE_THREADS)
+    """
+    host = host or config.RETRIEVAL_SERVICE_HOST
+    port = config.RETRIEVAL_SERVICE_PORT if port is None else port
+    threads = threads or config.RETRIEVAL_SERVICE_THREADS or 2 * (os.cpu_count() or 1)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/health":
+                self._reply(404, {'error': f"Unknown path: {self.path}"})
+                return
+            self._reply(200, {'result': {'status': 'ok', 'index_version': service.manager.index_version}})
+
+        def do_POST(self):
+            operation = self.path.strip("/").split("?")[0]
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                arguments = json.loads(self.rfile.read(length) or b"{}")
+                result = service.handle(operation, arguments)
+            except (ValueError, TypeError, KeyError) as e:
+                status = 404 if operation not in READ_OPERATIONS | WRITE_OPERATIONS else 400
+                self._reply(status, {'error': str(e)})
+                return
+            except Exception as e:
+                self._reply(500, {'error': f"{type(e).__name__}: {e}"})
+                return
+            self._reply(200, {'result': result})
+
+        def _reply(self, status: int, payload: Dict):
+            body = json.dumps(payload, default=_to_json).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return _PooledHTTPServer((host, port), Handler, threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=config.RETRIEVAL_SERVICE_HOST, help="Interface to bind")
+    parser.add_argument("--port", type=int, default=config.RETRIEVAL_SERVICE_PORT, help="Port to bind")
+    parser.add_argument("--threads", type=int, default=config.RETRIEVAL_SERVICE_THREADS or None,
+                        help="Request threads (default: 2 per CPU core)")
+    args = parser.parse_args()
+
+    service = RetrievalService()
+    if service.manager.store_type != "pinecone":
+        from segment_store import IndexLockedError
+        # Claim the index now: fail at startup, not on the first upload, if
+        # another service or a local ingest is writing to it
+        try:
+            service.manager.vector_store.acquire_writer_lock()
+        except IndexLockedError as e:
+            service.close()
+            raise SystemExit(str(e))
+    # Load the model now rather than on the first request
+    service.manager.embeddings.embed_query("warm up")
+    server = make_server(service, args.host, args.port, args.threads)
+    print(f"Retrieval service on http://{args.host}:{server.server_address[1]} "
+          f"({server.threads} threads, index: {service.manager.store_type})")
+    if config.METRICS_PORT:
+        import metrics
+        metrics.start_http_server(config.METRICS_PORT)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def _to_json(value):
+    """JSON fallback for numpy values in results and metadata."""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1180 @@
+"""
+Append-only, segment-based persistence for the local vector index.
+
+Every add_documents batch is written as a new immutable segment instead of
+re-saving the whole index. A segment is a set of files sharing a name prefix:
+
+    seg-000001.vectors.npy   float32 (n, dim) embedding matrix
+    seg-000001.ids.npy       int64 (n,) chunk ids, ascending
+    seg-000001.text.bin      UTF-8 chunk texts, back to back
+    seg-000001.offsets.npy   int64 (n + 1,) byte offsets into text.bin
+    seg-000001.pages.npy     int32 (n,) first page of each chunk (-1 if unknown)
+    seg-000001.page_ends.npy int32 (n,) last page of each chunk (-1 if unknown)
+    seg-000001.lengths.npy   int32 (n,) chunk_length metadata (-1 if absent)
+    seg-000001.char_starts.npy, .char_ends.npy
+                             int32 (n,) chunk offsets in the document text
+    seg-000001.meta.npy      int32 (n,) row of each chunk in meta.json
+    seg-000001.meta.json     the distinct remaining metadata dicts, in practice
+                             one per document (doc_id, filename, source)
+    seg-000001.hnsw.faiss    optional ANN index over the vectors (see ann_index)
+
+manifest.json lists the live segments, the document registry (which chunk ids
+belong to which document) and the ids of deleted chunks. It is replaced
+atomically, so a crash mid-write never leaves a half-visible segment. Every
+file but the small meta.json is memory-mapped on load, and a chunk's text and
+metadata dict are only materialized for the rows a search returns, so opening
+a large index is almost instant and costs almost no resident memory. Small segments are merged
+in a background thread to keep the segment count bounded; merging also drops
+deleted chunks for good. Segments that grow past FAISS_ANN_MIN_VECTORS get an
+approximate index of the configured type, built by the same background thread.
+
+Chunk ids are assigned in increasing order and only adjacent segments are
+merged, so every segment holds an ascending, disjoint id range. That lets a
+filtered search locate the chunks of selected documents by binary search and
+score only that subset.
+
+Only one process may write to an index: the first write takes an exclusive
+lock on writer.lock in the index directory (held until the process exits),
+and a store in another process that tries to write meanwhile fails with
+IndexLockedError instead of overwriting the manifest. Opening and searching
+need no lock: a store that does not hold it checks manifest.json before every
+read and reloads it when another process has replaced it, so a read-only
+process follows the writer instead of serving the snapshot it opened with.
+"""
+import json
+import mmap
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+from ann_index import (
+    INDEX_TYPES,
+    build_index,
+    choose_index_type,
+    configure_search,
+    find_index,
+    index_path,
+    search_index,
+)
+
+MANIFEST_NAME = "manifest.json"
+WRITER_LOCK_NAME = "writer.lock"
+
+
+class IndexLockedError(RuntimeError):
+    """Another process holds the writer lock of the index directory."""
+
+
+# Integer metadata fields stored as typed columns: (metadata key, file part)
+_METADATA_COLUMNS = (
+    ('page', 'pages'),
+    ('page_end', 'page_ends'),
+    ('chunk_length', 'lengths'),
+    ('char_start', 'char_starts'),
+    ('char_end', 'char_ends'),
+)
+
+
+def _write_json_atomic(path: str, data: Dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _save_npy(path: str, array: np.ndarray):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def _map_file(path: str):
+    """Read-only memory map of a file (empty bytes for an empty file)."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _split_metadata(metadatas: List[Dict]) -> Tuple[Dict[str, np.ndarray], List[Dict], np.ndarray]:
+    """
+    Split chunk metadata into typed columns and a table of distinct remainders.
+
+    Returns:
+        (columns, table, rows): an int32 array per _METADATA_COLUMNS part, -1
+        where the key is absent; the distinct remaining dicts (in practice one
+        per document: doc_id, filename, source); and each chunk's row in it
+    """
+    columns = {part: np.full(len(metadatas), -1, dtype=np.int32) for _, part in _METADATA_COLUMNS}
+    table, positions = [], {}
+    rows = np.empty(len(metadatas), dtype=np.int32)
+    for i, metadata in enumerate(metadatas):
+        rest = dict(metadata)
+        for key, part in _METADATA_COLUMNS:
+            value = rest.get(key)
+            # Anything that is not a small non-negative int stays in the table
+            if type(value) is int and 0 <= value < 2 ** 31:
+                columns[part][i] = rest.pop(key)
+        key = json.dumps(rest, sort_keys=True)
+        if key not in positions:
+            positions[key] = len(table)
+            table.append(rest)
+        rows[i] = positions[key]
+    return columns, table, rows
+
+
+def _convert_docs_jsonl(directory: str, name: str):
+    """Rewrite a segment's docs.jsonl (older format) as the columnar chunk store."""
+    docs_path = os.path.join(directory, f"{name}.docs.jsonl")
+    with open(docs_path, "rb") as f:
+        records = [json.loads(line) for line in f]
+    vectors = np.load(os.path.join(directory, f"{name}.vectors.npy"), mmap_mode="r")
+    ids = np.load(os.path.join(directory, f"{name}.ids.npy"))
+    # Writes the offsets, text and metadata files; vectors and ids are rewritten unchanged
+    _Segment.write(directory, name, vectors, ids, records).close()
+    os.remove(docs_path)
+
+
+class _Segment:
+    """A single immutable segment, memory-mapped from disk."""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.directory = directory
+        if not os.path.exists(self._path("text.bin")) and os.path.exists(self._path("docs.jsonl")):
+            _convert_docs_jsonl(directory, name)
+        self.vectors = np.load(self._path("vectors.npy"), mmap_mode="r")
+        self.ids = np.load(self._path("ids.npy"), mmap_mode="r")
+        self.offsets = np.load(self._path("offsets.npy"), mmap_mode="r")
+        self.columns = {part: self._load_column(part) for _, part in _METADATA_COLUMNS}
+        self.pages = self.columns['pages']
+        self.meta = np.load(self._path("meta.npy"), mmap_mode="r")
+        with open(self._path("meta.json")) as f:
+            self.meta_table = json.load(f)
+        # The mapping stays readable after compaction has unlinked the file,
+        # so readers still holding this segment are unaffected
+        self._text = _map_file(self._path("text.bin"))
+        self._deleted_cache = (None, None)
+        self.index_type = find_index(directory, name) or 'flat'
+        self._ann = None
+        self._ann_lock = threading.Lock()
+
+    def _path(self, part: str) -> str:
+        return os.path.join(self.directory, f"{self.name}.{part}")
+
+    def _load_column(self, part: str) -> np.ndarray:
+        # Segments written before a column existed read as all-absent
+        if not os.path.exists(self._path(f"{part}.npy")):
+            return np.full(len(self.ids), -1, dtype=np.int32)
+        return np.load(self._path(f"{part}.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def deleted_mask(self, deleted_ids: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Boolean mask of deleted rows, or None if no row is deleted.
+
+        Cached per tombstone array, so the membership test runs once per
+        delete rather than once per search.
+        """
+        cached_for, mask = self._deleted_cache
+        if cached_for is deleted_ids:
+            return mask
+        mask = None
+        if len(deleted_ids):
+            mask = np.isin(self.ids, deleted_ids)
+            if not mask.any():
+                mask = None
+        self._deleted_cache = (deleted_ids, mask)
+        return mask
+
+    def live_count(self, deleted_ids: np.ndarray) -> int:
+        mask = self.deleted_mask(deleted_ids)
+        return len(self) if mask is None else int(len(self) - mask.sum())
+
+    @classmethod
+    def write(
+        cls,
+        directory: str,
+        name: str,
+        vectors: np.ndarray,
+        ids: np.ndarray,
+        records: List[Dict]
+    ) -> "_Segment":
+        """Write a new segment to disk and open it."""
+        columns, meta_table, meta = _split_metadata([record['metadata'] for record in records])
+        for part, values in columns.items():
+            _save_npy(os.path.join(directory, f"{name}.{part}.npy"), values)
+        _save_npy(os.path.join(directory, f"{name}.meta.npy"), meta)
+        _write_json_atomic(os.path.join(directory, f"{name}.meta.json"), meta_table)
+        _save_npy(os.path.join(directory, f"{name}.vectors.npy"), np.ascontiguousarray(vectors, dtype=np.float32))
+        _save_npy(os.path.join(directory, f"{name}.ids.npy"), np.asarray(ids, dtype=np.int64))
+
+        encoded = [record['text'].encode("utf-8") for record in records]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        _save_npy(os.path.join(directory, f"{name}.offsets.npy"), offsets)
+        # Written last: its presence marks a complete segment when an older
+        # docs.jsonl segment is being converted
+        text_path = os.path.join(directory, f"{name}.text.bin")
+        with open(text_path + ".tmp", "wb") as f:
+            f.write(b"".join(encoded))
+        os.replace(text_path + ".tmp", text_path)
+        return cls(directory, name)
+
+    @classmethod
+    def merge(
+        cls,
+        directory: str,
+        name: str,
+        segments: List["_Segment"],
+        deleted_ids: np.ndarray
+    ) -> "_Segment":
+        """
+        Write the live rows of several segments as a new segment.
+
+        The segments must be adjacent and in id order, so the merged ids stay
+        ascending.
+        """
+        masks = [segment.deleted_mask(deleted_ids) for segment in segments]
+        live_rows = [
+            np.arange(len(segment)) if mask is None else np.flatnonzero(~mask)
+            for segment, mask in zip(segments, masks)
+        ]
+        total = sum(len(rows) for rows in live_rows)
+        dim = segments[0].vectors.shape[1]
+
+        vectors_path = os.path.join(directory, f"{name}.vectors.npy")
+        merged = np.lib.format.open_memmap(vectors_path + ".tmp", mode="w+", dtype=np.float32, shape=(total, dim))
+        row = 0
+        for segment, mask, rows in zip(segments, masks, live_rows):
+            merged[row:row + len(rows)] = segment.vectors if mask is None else segment.vectors[rows]
+            row += len(rows)
+        merged.flush()
+        del merged
+        os.replace(vectors_path + ".tmp", vectors_path)
+
+        # Text of untouched segments is copied as one block; only the
+        # offsets need shifting
+        text_path = os.path.join(directory, f"{name}.text.bin")
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        with open(text_path + ".tmp", "wb") as out:
+            for segment, mask, rows in zip(segments, masks, live_rows):
+                segment_offsets = np.asarray(segment.offsets)
+                if mask is None:
+                    out.write(segment._text)
+                    offsets.append(segment_offsets[1:] + base)
+                    base += int(segment_offsets[-1])
+                    continue
+                lengths = segment_offsets[rows + 1] - segment_offsets[rows]
+                for start, end in zip(segment_offsets[rows], segment_offsets[rows + 1]):
+                    out.write(segment._text[start:end])
+                offsets.append(np.cumsum(lengths) + base)
+                base += int(lengths.sum())
+        os.replace(text_path + ".tmp", text_path)
+
+        # Metadata tables are concatenated with duplicates folded together
+        meta_table, positions, meta = [], {}, []
+        for segment, rows in zip(segments, live_rows):
+            remap = np.empty(len(segment.meta_table), dtype=np.int32)
+            for i, entry in enumerate(segment.meta_table):
+                key = json.dumps(entry, sort_keys=True)
+                if key not in positions:
+                    positions[key] = len(meta_table)
+                    meta_table.append(entry)
+                remap[i] = positions[key]
+            meta.append(remap[np.asarray(segment.meta)[rows]] if len(remap) else np.zeros(len(rows), dtype=np.int32))
+
+        for _, part in _METADATA_COLUMNS:
+            values = np.concatenate([np.asarray(segment.columns[part])[rows] for segment, rows in zip(segments, live_rows)])
+            _save_npy(os.path.join(directory, f"{name}.{part}.npy"), values)
+        _save_npy(os.path.join(directory, f"{name}.meta.npy"), np.concatenate(meta))
+        _write_json_atomic(os.path.join(directory, f"{name}.meta.json"), meta_table)
+        ids = np.concatenate([np.asarray(segment.ids)[rows] for segment, rows in zip(segments, live_rows)])
+        _save_npy(os.path.join(directory, f"{name}.ids.npy"), ids)
+        _save_npy(os.path.join(directory, f"{name}.offsets.npy"), np.concatenate(offsets))
+        return cls(directory, name)
+
+    @property
+    def ann(self):
+        """The segment's ANN index, loaded on first use (None if flat or unreadable)."""
+        if self.index_type == 'flat':
+            return None
+        with self._ann_lock:
+            if self._ann is None:
+                import faiss
+                try:
+                    self._ann = faiss.read_index(index_path(self.directory, self.name, self.index_type))
+                except RuntimeError:
+                    # Removed by a concurrent rebuild or compaction; scan exactly instead
+                    return None
+                configure_search(self._ann)
+            return self._ann
+
+    def build_ann(self, index_type: str):
+        """Train and persist an ANN index of the given type, replacing any other."""
+        import faiss
+
+        index = build_index(self.vectors, index_type)
+        if index is not None:
+            path = index_path(self.directory, self.name, index_type)
+            faiss.write_index(index, path + ".tmp")
+            os.replace(path + ".tmp", path)
+        with self._ann_lock:
+            self._ann = index
+            previous, self.index_type = self.index_type, index_type
+        if previous not in ('flat', index_type):
+            os.remove(index_path(self.directory, self.name, previous))
+
+    def read(self, row: int) -> Dict:
+        """Materialize the text and metadata record of one row."""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        metadata = dict(self.meta_table[self.meta[row]]) if self.meta_table else {}
+        for key, part in _METADATA_COLUMNS:
+            value = int(self.columns[part][row])
+            if value >= 0:
+                metadata[key] = value
+        return {'text': self._text[start:end].decode("utf-8"), 'metadata': metadata}
+
+    def close(self):
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+
+    def delete_files(self):
+        parts = ["vectors.npy", "ids.npy", "offsets.npy", "text.bin", "meta.npy", "meta.json"]
+        parts += [f"{part}.npy" for _, part in _METADATA_COLUMNS]
+        parts += [f"{index_type}.faiss" for index_type in INDEX_TYPES[1:]]
+        for part in parts:
+            try:
+                os.remove(self._path(part))
+            except OSError:
+                pass
+
+
+class SegmentStore:
+    """Local vector index made of append-only, memory-mapped segments."""
+
+    def __init__(
+        self,
+        path: str = None,
+        max_segments: int = None,
+        background_compaction: bool = None,
+        index_type: str = None,
+        ann_min_vectors: int = None
+    ):
+        self.path = path or config.FAISS_INDEX_PATH
+        self.max_segments = max_segments or config.FAISS_MAX_SEGMENTS
+        self.background_compaction = (
+            config.FAISS_BACKGROUND_COMPACTION if background_compaction is None else background_compaction
+        )
+        self.index_type = index_type or config.FAISS_INDEX_TYPE
+        self.ann_min_vectors = config.FAISS_ANN_MIN_VECTORS if ann_min_vectors is None else ann_min_vectors
+        # Fail fast on a misconfigured index type
+        choose_index_type(0, self.index_type)
+        self._lock = threading.RLock()
+        self._compaction_lock = threading.Lock()
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._writer_lock = None
+        self._snapshot = ([], np.zeros(0, dtype=np.int64), {})
+
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+        if not self._segments and _has_legacy_index(self.path):
+            self._migrate_legacy_index()
+
+    def _read_manifest(self) -> Dict:
+        manifest_path = os.path.join(self.path, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        else:
+            manifest = {
+                'version': 0,
+                'dimension': None,
+                'next_id': 0,
+                'next_segment': 0,
+                'segments': [],
+                'documents': {},
+                'deleted_ids': []
+            }
+        manifest.setdefault('documents', {})
+        manifest.setdefault('deleted_ids', [])
+        return manifest
+
+    def _load(self):
+        # Segments already open are reused; a name is never reused for
+        # different content, but an ANN index may have been built since
+        opened = {
+            segment.name: segment for segment in self._snapshot[0]
+            if segment.index_type == (find_index(self.path, segment.name) or 'flat')
+        }
+        while True:
+            signature = _file_signature(os.path.join(self.path, MANIFEST_NAME))
+            manifest = self._read_manifest()
+            try:
+                segments = [opened.get(name) or _Segment(self.path, name) for name in manifest['segments']]
+                break
+            except FileNotFoundError:
+                # Another process compacted a segment away after the manifest
+                # was read; the current manifest lists its replacement
+                if _file_signature(os.path.join(self.path, MANIFEST_NAME)) == signature:
+                    raise
+        self._manifest = manifest
+        self._manifest_signature = signature
+        # (segments, deleted ids, document registry) as one tuple. Writers
+        # build new values and swap the tuple in _publish, never mutating the
+        # published ones, so a search reads a consistent snapshot without
+        # holding the lock and never sees half of a write.
+        self._snapshot = (
+            segments,
+            np.asarray(sorted(manifest['deleted_ids']), dtype=np.int64),
+            manifest['documents']
+        )
+
+    def refresh(self):
+        """
+        Reload the manifest if another process has replaced it since it was
+        read. Called before every read by a store that does not hold the
+        writer lock; costs one stat when nothing changed.
+        """
+        if self._writer_lock is not None:
+            return
+        if _file_signature(os.path.join(self.path, MANIFEST_NAME)) == self._manifest_signature:
+            return
+        with self._lock:
+            if self._writer_lock is None and (
+                _file_signature(os.path.join(self.path, MANIFEST_NAME)) != self._manifest_signature
+            ):
+                self._load()
+
+    def _current(self) -> Tuple[List[_Segment], np.ndarray, Dict[str, Dict]]:
+        """The published snapshot, after picking up other processes' writes."""
+        self.refresh()
+        return self._snapshot
+
+    def acquire_writer_lock(self):
+        """
+        Take the exclusive writer lock of the index directory, if this store
+        does not hold it yet. Called by every write; a writer that intends
+        to stay (the retrieval service) can call it up front to fail fast.
+
+        If another process wrote to the index since it was opened, the
+        manifest is reloaded first, so the write starts from the current
+        state rather than overwriting it.
+
+        Raises:
+            IndexLockedError: If another process holds the lock
+        """
+        with self._lock:
+            if self._writer_lock is not None:
+                return
+            self._writer_lock = _lock_directory(self.path)
+            if _file_signature(os.path.join(self.path, MANIFEST_NAME)) != self._manifest_signature:
+                self._load()
+
+    @property
+    def version(self) -> int:
+        """Counter bumped on every change to the indexed content."""
+        self.refresh()
+        return self._manifest['version']
+
+    @property
+    def _segments(self) -> List[_Segment]:
+        return self._snapshot[0]
+
+    @property
+    def _deleted(self) -> np.ndarray:
+        return self._snapshot[1]
+
+    def __len__(self) -> int:
+        segments, deleted, _ = self._current()
+        return sum(segment.live_count(deleted) for segment in segments)
+
+    def _new_segment_name(self) -> str:
+        self._manifest['next_segment'] += 1
+        return f"seg-{self._manifest['next_segment']:06d}"
+
+    def _publish(
+        self,
+        segments: List[_Segment],
+        bump_version: bool,
+        deleted: np.ndarray = None,
+        documents: Dict[str, Dict] = None
+    ):
+        """Atomically make a new segment list, tombstone set and registry visible on disk and in memory."""
+        if deleted is None:
+            deleted = self._deleted
+        manifest = dict(self._manifest)
+        manifest['segments'] = [segment.name for segment in segments]
+        manifest['deleted_ids'] = deleted.tolist()
+        if documents is not None:
+            manifest['documents'] = documents
+        if bump_version:
+            manifest['version'] += 1
+        _write_json_atomic(os.path.join(self.path, MANIFEST_NAME), manifest)
+        self._manifest = manifest
+        self._manifest_signature = _file_signature(os.path.join(self.path, MANIFEST_NAME))
+        self._snapshot = (segments, deleted, manifest['documents'])
+
+    def add(
+        self,
+        vectors: np.ndarray,
+        texts: List[str],
+        metadatas: List[Dict],
+        staged: bool = False
+    ) -> List[int]:
+        """
+        Append a batch of vectors as a new segment.
+
+        Chunks whose metadata carries a 'doc_id' are recorded under that
+        document in the registry, creating a partial entry if needed.
+
+        Args:
+            vectors: Array of shape (n, dim)
+            texts: Chunk texts, aligned with vectors
+            metadatas: Chunk metadata dicts, aligned with vectors
+            staged: Record the chunks as the document's replacement chunks
+                ('staged_ranges'), which commit_document swaps in; until
+                then the document keeps its current chunks and registry entry
+
+        Returns:
+            The ids assigned to the new chunks
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return []
+
+        with self._lock:
+            self.acquire_writer_lock()
+            dimension = self._manifest['dimension']
+            if dimension is None:
+                self._manifest['dimension'] = dimension = int(vectors.shape[1])
+            elif vectors.shape[1] != dimension:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match index dimension {dimension}"
+                )
+
+            start_id = self._manifest['next_id']
+            ids = np.arange(start_id, start_id + len(vectors), dtype=np.int64)
+            self._manifest['next_id'] = start_id + len(vectors)
+
+            records = [{'text': text, 'metadata': metadata} for text, metadata in zip(texts, metadatas)]
+            segment = _Segment.write(self.path, self._new_segment_name(), vectors, ids, records)
+            self._publish(
+                self._segments + [segment],
+                bump_version=True,
+                documents=self._register_chunk_ids(ids, metadatas, staged)
+            )
+
+        self._maybe_compact()
+        return ids.tolist()
+
+    def _register_chunk_ids(self, ids: np.ndarray, metadatas: List[Dict], staged: bool = False) -> Dict[str, Dict]:
+        """
+        Registry with new chunk ids recorded as contiguous [start, end)
+        ranges per document (a copy; the published one is left untouched).
+        """
+        key = 'staged_ranges' if staged else 'id_ranges'
+        documents = dict(self._manifest['documents'])
+        copied = set()
+        for chunk_id, metadata in zip(ids.tolist(), metadatas):
+            doc_id = metadata.get('doc_id')
+            if doc_id is None:
+                continue
+            if doc_id not in copied:
+                entry = documents.get(doc_id)
+                if entry is None:
+                    entry = {'filename': metadata.get('filename'), 'complete': False, 'id_ranges': []}
+                else:
+                    entry = dict(entry)
+                entry[key] = [list(id_range) for id_range in entry.get(key, [])]
+                documents[doc_id] = entry
+                copied.add(doc_id)
+            ranges = documents[doc_id][key]
+            if ranges and ranges[-1][1] == chunk_id:
+                ranges[-1][1] = chunk_id + 1
+            else:
+                ranges.append([chunk_id, chunk_id + 1])
+        return documents
+
+    @property
+    def documents(self) -> Dict[str, Dict]:
+        """Registry of indexed documents keyed by document id (treat as read-only)."""
+        return self._current()[2]
+
+    def has_document(self, doc_id: str) -> bool:
+        """True if the document has been fully indexed."""
+        entry = self._current()[2].get(doc_id)
+        return bool(entry and entry['complete'])
+
+    def commit_document(self, doc_id: str, info: Dict = None) -> List[List[int]]:
+        """
+        Mark a document as fully indexed and record its descriptive info.
+
+        If chunks were added for it with staged=True, they replace its
+        current chunks in the same step, so searches and the registry see
+        either the old chunks or the new ones, never neither.
+
+        Args:
+            doc_id: Document id used in the chunk metadata
+            info: Extra fields to store in the registry (e.g. filename, content_hash)
+
+        Returns:
+            The [start, end) id ranges of the chunks replaced (deleted)
+        """
+        with self._lock:
+            self.acquire_writer_lock()
+            documents = dict(self._manifest['documents'])
+            entry = dict(documents.get(doc_id) or {'complete': False, 'id_ranges': []})
+            retired = []
+            deleted = None
+            if 'staged_ranges' in entry:
+                retired = entry['id_ranges']
+                entry['id_ranges'] = entry.pop('staged_ranges')
+                deleted = np.union1d(self._deleted, _range_ids(retired))
+            entry.update(info or {})
+            # A re-index commits the same content again; keep the date it was
+            # first indexed so date_range filters do not move it to today.
+            if not entry.get('complete') or 'indexed_at' not in entry:
+                entry['indexed_at'] = time.time()
+            entry['complete'] = True
+            documents[doc_id] = entry
+            self._publish(self._segments, bump_version=True, deleted=deleted, documents=documents)
+
+        if retired:
+            self._maybe_compact()
+        return retired
+
+    def discard_staged(self, doc_id: str) -> List[List[int]]:
+        """
+        Delete chunks added for a document with staged=True that were never
+        committed, e.g. by an interrupted re-index. The document itself is
+        left as it is.
+
+        Returns:
+            The [start, end) id ranges of the chunks deleted
+        """
+        with self._lock:
+            self.acquire_writer_lock()
+            documents = dict(self._manifest['documents'])
+            entry = documents.get(doc_id)
+            if entry is None or 'staged_ranges' not in entry:
+                return []
+            entry = dict(entry)
+            staged = entry.pop('staged_ranges')
+            if entry['complete']:
+                documents[doc_id] = entry
+            else:
+                # Nothing but staged chunks was ever recorded for it
+                del documents[doc_id]
+            deleted = np.union1d(self._deleted, _range_ids(staged))
+            self._publish(self._segments, bump_version=True, deleted=deleted, documents=documents)
+
+        self._maybe_compact()
+        return staged
+
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Delete every chunk of a document.
+
+        Chunks are tombstoned rather than rewritten, so this costs time in
+        proportion to the document, not to the index; compaction removes them
+        from disk later.
+
+        Returns:
+            Number of chunks deleted
+        """
+        with self._lock:
+            self.acquire_writer_lock()
+            documents = dict(self._manifest['documents'])
+            entry = documents.pop(doc_id, None)
+            if entry is None:
+                return 0
+            chunk_ids = _range_ids(entry['id_ranges'] + entry.get('staged_ranges', []))
+            deleted = np.union1d(self._deleted, chunk_ids)
+            self._publish(self._segments, bump_version=True, deleted=deleted, documents=documents)
+
+        self._maybe_compact()
+        return len(chunk_ids)
+
+    def search(self, query_vector: np.ndarray, k: int, filters: Dict = None) -> List[Dict]:
+        """
+        L2 nearest-neighbour search over all segments.
+
+        Segments with an ANN index are searched approximately (see
+        ann_index); the rest, and every filtered search, are scanned exactly.
+
+        Args:
+            query_vector: Query embedding of shape (dim,)
+            k: Number of results to return
+            filters: Optional restriction of the searched chunks, see search_many
+
+        Returns:
+            List of dicts with 'id', 'text', 'metadata' and 'score' (squared L2
+            distance, lower is closer), best match first
+        """
+        query = np.asarray(query_vector, dtype=np.float32)[None, :]
+        return self.search_many(query, k, filters)[0]
+
+    def search_many(self, query_vectors: np.ndarray, k: int, filters: Dict = None) -> List[List[Dict]]:
+        """
+        Run search for every row of query_vectors, sharing each segment scan.
+
+        Filters are applied before scoring: the chunks of the selected
+        documents are located through the document registry and only those
+        vectors are scored, so a filtered search costs time in proportion to
+        the selected subset rather than the whole index.
+
+        Args:
+            query_vectors: Array of shape (m, dim)
+            k: Number of results per query
+            filters: Optional dict with any of
+                'doc_ids': list of document ids to search within,
+                'page_range': (first_page, last_page), inclusive,
+                'date_range': (start, end) bounds on the time a document was
+                    indexed, as datetimes, dates or Unix timestamps (either may be None)
+
+        Returns:
+            One result list per query, as returned by search
+        """
+        queries = np.ascontiguousarray(query_vectors, dtype=np.float32)
+        segments, deleted, documents = self._current()
+        if not segments or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        if filters:
+            candidates = self._filter_candidates(filters, segments, deleted, documents)
+            parts = self._scan_candidates(queries, k, segments, candidates)
+        else:
+            parts = self._scan_all(queries, k, segments, deleted)
+        return self._collect(parts, segments, k, len(queries))
+
+    def _scan_all(self, queries: np.ndarray, k: int, segments: List[_Segment], deleted: np.ndarray):
+        import faiss
+
+        parts = []
+        for segment_index, segment in enumerate(segments):
+            mask = segment.deleted_mask(deleted)
+            ann = segment.ann
+            if ann is not None:
+                # Tombstoned rows are excluded inside the ANN search itself
+                distances, rows = search_index(
+                    ann, segment.index_type, segment.vectors, queries, min(k, len(segment)), mask
+                )
+            else:
+                # Exact scan of a small segment: fetch enough extra neighbours
+                # to cover the rows that are tombstoned
+                extra = 0 if mask is None else int(mask.sum())
+                distances, rows = faiss.knn(
+                    queries, np.ascontiguousarray(segment.vectors), min(k + extra, len(segment))
+                )
+            if mask is not None:
+                dead = (rows >= 0) & mask[np.maximum(rows, 0)]
+                distances = np.where(dead, np.inf, distances)
+                rows = np.where(dead, -1, rows)
+            parts.append((segment_index, distances, rows))
+        return parts
+
+    def _scan_candidates(
+        self,
+        queries: np.ndarray,
+        k: int,
+        segments: List[_Segment],
+        candidates: List[Tuple[int, np.ndarray]]
+    ):
+        import faiss
+
+        parts = []
+        for segment_index, rows in candidates:
+            # Gathering from the memory map reads only the selected rows
+            subset = np.ascontiguousarray(segments[segment_index].vectors[rows])
+            distances, positions = faiss.knn(queries, subset, min(k, len(rows)))
+            parts.append((segment_index, distances, np.where(positions >= 0, rows[positions], -1)))
+        return parts
+
+    def _filter_candidates(
+        self,
+        filters: Dict,
+        segments: List[_Segment],
+        deleted: np.ndarray,
+        documents: Dict[str, Dict]
+    ) -> List[Tuple[int, np.ndarray]]:
+        """Resolve filters to (segment index, live rows) pairs, skipping empty ones."""
+        unknown = set(filters) - {'doc_ids', 'page_range', 'date_range'}
+        if unknown:
+            raise ValueError(f"Unknown search filter(s): {', '.join(sorted(unknown))}")
+
+        page_range = filters.get('page_range')
+        doc_ids = filters.get('doc_ids')
+        date_range = filters.get('date_range')
+
+        candidates = []
+        if doc_ids is None and date_range is None:
+            # Page-only filter: the page column is scanned, but still only
+            # matching vectors are scored
+            for segment_index, segment in enumerate(segments):
+                keep = _page_mask(segment.pages, page_range)
+                mask = segment.deleted_mask(deleted)
+                if mask is not None:
+                    keep &= ~mask
+                rows = np.flatnonzero(keep)
+                if len(rows):
+                    candidates.append((segment_index, rows))
+            return candidates
+
+        selected = documents.keys() if doc_ids is None else [d for d in doc_ids if d in documents]
+        if date_range is not None:
+            start, end = _to_timestamp(date_range[0]), _to_timestamp(date_range[1], end_of_day=True)
+            selected = [
+                doc_id for doc_id in selected
+                if (start is None or documents[doc_id].get('indexed_at', 0) >= start)
+                and (end is None or documents[doc_id].get('indexed_at', 0) <= end)
+            ]
+
+        ranges = [
+            np.arange(first, last, dtype=np.int64)
+            for doc_id in selected
+            for first, last in documents[doc_id]['id_ranges']
+        ]
+        if not ranges:
+            return candidates
+        ids = np.sort(np.concatenate(ranges))
+        if len(deleted):
+            ids = ids[~np.isin(ids, deleted)]
+
+        for segment_index, rows in _locate(segments, ids):
+            if page_range is not None:
+                rows = rows[_page_mask(segments[segment_index].pages[rows], page_range)]
+            if len(rows):
+                candidates.append((segment_index, rows))
+        return candidates
+
+    def filter_ids(self, filters: Dict) -> np.ndarray:
+        """Sorted ids of the live chunks matching filters (see search_many)."""
+        segments, deleted, documents = self._current()
+        candidates = self._filter_candidates(filters, segments, deleted, documents)
+        if not candidates:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate([
+            np.asarray(segments[segment_index].ids)[rows] for segment_index, rows in candidates
+        ]))
+
+    def get(self, ids: List[int], query_vector: np.ndarray = None) -> Dict[int, Dict]:
+        """
+        Load the records of chunks by id.
+
+        Args:
+            ids: Chunk ids
+            query_vector: If given, each record also gets its 'score' (squared
+                L2 distance to the query), as search would report it
+
+        Returns:
+            Mapping of id to {'text', 'metadata'} for every live id found
+        """
+        segments, deleted, _ = self._current()
+        wanted = np.unique(np.asarray(ids, dtype=np.int64))
+        if len(deleted):
+            wanted = wanted[~np.isin(wanted, deleted)]
+        records = {}
+        for segment_index, rows in _locate(segments, wanted):
+            segment = segments[segment_index]
+            if query_vector is not None:
+                differences = np.asarray(segment.vectors[rows], dtype=np.float32) - query_vector
+                distances = np.einsum("ij,ij->i", differences, differences)
+            for position, row in enumerate(rows):
+                record = segment.read(int(row))
+                if query_vector is not None:
+                    record['score'] = float(distances[position])
+                records[int(segment.ids[row])] = record
+        return records
+
+    def iter_records(self):
+        """Yield (id, record) for every live chunk, in id order."""
+        segments, deleted, _ = self._current()
+        for segment in segments:
+            mask = segment.deleted_mask(deleted)
+            for row in range(len(segment)):
+                if mask is None or not mask[row]:
+                    yield int(segment.ids[row]), segment.read(row)
+
+    def _collect(self, parts, segments: List[_Segment], k: int, query_count: int) -> List[List[Dict]]:
+        """Merge per-segment neighbours into the global top-k and load their records."""
+        if not parts:
+            return [[] for _ in range(query_count)]
+
+        distances = np.concatenate([part[1] for part in parts], axis=1)
+        rows = np.concatenate([part[2] for part in parts], axis=1)
+        owners = np.concatenate(
+            [np.full(part[2].shape, part[0]) for part in parts], axis=1
+        )
+
+        results = []
+        for q in range(query_count):
+            order = np.argsort(distances[q], kind="stable")[:k]
+            hits = []
+            for position in order:
+                row = rows[q, position]
+                if row < 0:
+                    continue
+                segment = segments[owners[q, position]]
+                record = segment.read(int(row))
+                hits.append({
+                    'id': int(segment.ids[row]),
+                    'text': record['text'],
+                    'metadata': record['metadata'],
+                    'score': float(distances[q, position])
+                })
+            results.append(hits)
+        return results
+
+    def _needs_compaction(self) -> bool:
+        if len(self._segments) > self.max_segments:
+            return True
+        deleted = self._deleted
+        return any(
+            len(segment) and segment.live_count(deleted) < len(segment) * (1 - config.FAISS_MAX_DELETED_RATIO)
+            for segment in self._segments
+        )
+
+    def _target_index_type(self, segment: _Segment) -> str:
+        return choose_index_type(len(segment), self.index_type, self.ann_min_vectors)
+
+    def _needs_indexing(self) -> bool:
+        return any(segment.index_type != self._target_index_type(segment) for segment in self._segments)
+
+    def _maybe_compact(self):
+        if not self._needs_compaction() and not self._needs_indexing():
+            return
+        if not self.background_compaction:
+            self.compact()
+            return
+        with self._lock:
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(
+                target=self.compact, name="segment-compaction", daemon=True
+            )
+            self._compaction_thread.start()
+
+    def compact(self):
+        """
+        Merge small segments and drop deleted chunks.
+
+        Size-tiered: each pass merges the run of half of max_segments adjacent
+        segments with the fewest live chunks, so a chunk is rewritten a
+        logarithmic number of times rather than on every add. A segment whose
+        deleted fraction exceeds FAISS_MAX_DELETED_RATIO is rewritten on its
+        own. Segments added while a merge runs are kept as is.
+        """
+        self.acquire_writer_lock()
+        with self._compaction_lock:
+            while self._needs_compaction():
+                with self._lock:
+                    deleted = self._deleted
+                    segments = self._segments
+                    if len(segments) > self.max_segments:
+                        # Merge the run of adjacent segments with the fewest
+                        # live chunks, keeping id ranges ascending
+                        merge_count = max(2, self.max_segments // 2)
+                        sizes = [segment.live_count(deleted) for segment in segments]
+                        start = min(
+                            range(len(segments) - merge_count + 1),
+                            key=lambda i: sum(sizes[i:i + merge_count])
+                        )
+                        to_merge = segments[start:start + merge_count]
+                    else:
+                        to_merge = [max(segments, key=lambda seg: len(seg) - seg.live_count(deleted))]
+                    name = self._new_segment_name()
+
+                # The expensive copy runs without the lock so adds and searches
+                # continue meanwhile; fully deleted segments are simply dropped
+                merged = None
+                if any(segment.live_count(deleted) for segment in to_merge):
+                    merged = _Segment.merge(self.path, name, to_merge, deleted)
+                    # Train the merged segment's ANN index before it goes live
+                    if self._target_index_type(merged) != 'flat':
+                        merged.build_ann(self._target_index_type(merged))
+
+                with self._lock:
+                    # Only appends happen concurrently, so the merged run is
+                    # still contiguous and the result takes its place
+                    position = self._segments.index(to_merge[0])
+                    replacement = [merged] if merged else []
+                    segments = (
+                        self._segments[:position] + replacement + self._segments[position + len(to_merge):]
+                    )
+                    # Tombstones of rows dropped by the merge are no longer
+                    # needed; deletes that arrived during the merge are kept
+                    kept_ids = merged.ids if merged else np.zeros(0, dtype=np.int64)
+                    dropped = np.setdiff1d(np.concatenate([s.ids for s in to_merge]), kept_ids)
+                    self._publish(
+                        segments,
+                        bump_version=False,
+                        deleted=np.setdiff1d(self._deleted, dropped)
+                    )
+
+                for segment in to_merge:
+                    segment.delete_files()
+
+        self.build_indexes()
+
+    def build_indexes(self):
+        """
+        Bring every segment's ANN index in line with the configured type.
+
+        Covers segments that passed the size threshold without a merge (a
+        large add, a migrated legacy index) and existing segments after
+        FAISS_INDEX_TYPE changes. Searches keep using the old index until the
+        new one is swapped in.
+        """
+        self.acquire_writer_lock()
+        with self._compaction_lock:
+            for segment in list(self._segments):
+                target = self._target_index_type(segment)
+                if segment.index_type != target:
+                    segment.build_ann(target)
+
+    def wait_for_compaction(self):
+        """Block until any running background compaction has finished."""
+        thread = self._compaction_thread
+        if thread:
+            thread.join()
+
+    def _migrate_legacy_index(self):
+        """Import an index written by LangChain's FAISS.save_local as the first segment."""
+        import faiss
+        import pickle
+
+        self.acquire_writer_lock()
+        if self._segments:
+            # Another process migrated it before the lock was free
+            return
+
+        index = faiss.read_index(os.path.join(self.path, "index.faiss"))
+        with open(os.path.join(self.path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        if index.ntotal == 0:
+            return
+
+        vectors = index.reconstruct_n(0, index.ntotal)
+        texts, metadatas = [], []
+        for position in range(index.ntotal):
+            doc = docstore.search(index_to_docstore_id[position])
+            texts.append(doc.page_content)
+            metadatas.append(doc.metadata)
+        self.add(vectors, texts, metadatas)
+
+
+def _lock_directory(path: str):
+    """
+    Exclusive, non-blocking flock on the index's writer lock file; released
+    when the returned file is closed or the process exits.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        # Not available on Windows; run a single writer per index there
+        return True
+    lock = open(os.path.join(path, WRITER_LOCK_NAME), "a+")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.seek(0)
+        owner = lock.read().strip() or "unknown"
+        lock.close()
+        if owner == str(os.getpid()):
+            raise IndexLockedError(
+                f"The index at {path} is being written by another SegmentStore in this process; "
+                "open it once and share that store (or VectorStoreManager) instead."
+            )
+        raise IndexLockedError(
+            f"The index at {path} is being written by another process (pid {owner}). "
+            "Only one process may write to an index: if the retrieval service is running, "
+            "set RETRIEVAL_SERVICE_URL to use it; otherwise stop the other writer first."
+        )
+    lock.seek(0)
+    lock.truncate()
+    lock.write(str(os.getpid()))
+    lock.flush()
+    return lock
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """(inode, size, mtime) of a file, or None if it does not exist; changes when it is replaced."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def _range_ids(id_ranges: List[List[int]]) -> np.ndarray:
+    """Chunk ids in a list of [start, end) ranges."""
+    chunk_ids = [np.arange(start, end, dtype=np.int64) for start, end in id_ranges]
+    return np.concatenate(chunk_ids) if chunk_ids else np.zeros(0, dtype=np.int64)
+
+
+def _has_legacy_index(path: str) -> bool:
+    return (
+        os.path.exists(os.path.join(path, "index.faiss"))
+        and os.path.exists(os.path.join(path, "index.pkl"))
+    )
+
+
+def _locate(segments: List[_Segment], ids: np.ndarray):
+    """
+    Map sorted chunk ids to (segment index, rows) pairs; ids that are not
+    present are skipped.
+
+    Segments hold ascending, disjoint id ranges, so each id's segment is
+    found by its first id and its row by binary search within the segment.
+    """
+    if not len(ids) or not segments:
+        return
+    first_ids = np.asarray([segment.ids[0] for segment in segments])
+    owners = np.searchsorted(first_ids, ids, side="right") - 1
+    for segment_index in np.unique(owners[owners >= 0]):
+        segment = segments[segment_index]
+        wanted = ids[owners == segment_index]
+        rows = np.searchsorted(segment.ids, wanted)
+        found = rows < len(segment)
+        found[found] = segment.ids[rows[found]] == wanted[found]
+        rows = rows[found]
+        if len(rows):
+            yield int(segment_index), rows
+
+
+def _page_mask(pages: np.ndarray, page_range: Optional[Tuple[int, int]]) -> np.ndarray:
+    keep = np.ones(len(pages), dtype=bool)
+    if page_range is not None:
+        first, last = page_range
+        if first is not None:
+            keep &= pages >= first
+        if last is not None:
+            keep &= pages <= last
+    return keep
+
+
+def _to_timestamp(value, end_of_day: bool = False) -> Optional[float]:
+    """Convert a datetime, date or number to a Unix timestamp; a date used as
+    an upper bound covers the whole day."""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, date):
+        day = datetime(value.year, value.month, value.day)
+        return day.timestamp() + (86400 if end_of_day else 0)
+    return float(value)
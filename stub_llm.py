@@ -0,0 +1,113 @@
+"""
+Local stand-in for the Groq chat model.
+
+Answers deterministically from the prompt (citing the pages of the excerpts
+it was given) with configurable latency, and can inject rate-limit errors.
+Used to exercise batch querying, streaming and benchmarks without network
+access or API keys.
+"""
+import asyncio
+import re
+import threading
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class StubRateLimitError(Exception):
+    """Mimics the 429 error raised by the Groq client."""
+
+    status_code = 429
+
+
+class StubChatModel(BaseChatModel):
+    """Deterministic fake chat model with latency and rate-limit injection."""
+
+    latency_seconds: float = 0.0
+    # Raise StubRateLimitError whenever more than this many calls overlap (0 = never)
+    max_concurrent_calls: int = 0
+    calls: int = 0
+    rate_limited_calls: int = 0
+
+    _active: int = 0
+    _lock: Any = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._active = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "legal-eagle-stub"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        prompt = messages[-1].content if messages else ""
+        pages = sorted(set(re.findall(r"\[Excerpt \d+ - Page (\w+)\]", prompt)), key=str)
+        question = re.search(r"Question: (.*)", prompt)
+        question = question.group(1).strip() if question else ""
+        if not pages:
+            return "Answer: I cannot find this information in the provided contract"
+        citation = ", ".join(f"[Page {page}]" for page in pages)
+        return f"Answer: The contract addresses \"{question}\" in the cited excerpts {citation}"
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self._active += 1
+            if self.max_concurrent_calls and self._active > self.max_concurrent_calls:
+                self._active -= 1
+                self.rate_limited_calls += 1
+                raise StubRateLimitError("Rate limit reached (429): too many concurrent requests")
+
+    def _exit(self):
+        with self._lock:
+            self._active -= 1
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        self._enter()
+        try:
+            time.sleep(self.latency_seconds)
+            answer = self._answer(messages)
+        finally:
+            self._exit()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency_seconds)
+            answer = self._answer(messages)
+        finally:
+            self._exit()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=answer))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        answer = self._answer(messages)
+        tokens = re.findall(r"\S+\s*", answer)
+        # Spread the latency over the tokens, like a real streaming response
+        delay = self.latency_seconds / max(len(tokens), 1)
+        for token in tokens:
+            time.sleep(delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,149 @@
+"""Tests for the block-based BM25 index."""
+import math
+import threading
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+QUERIES = [
+    "termination notice",
+    "governing law of the contract",
+    "indemnification party liability 12.3",
+    "confidential information disclosure term",
+    "zebra",
+]
+
+
+def _corpus(count, seed=0):
+    """Chunks drawn from a skewed vocabulary, so common terms have long posting lists."""
+    rng = np.random.default_rng(seed)
+    vocabulary = (
+        "contract party agreement term notice termination law governing confidential information "
+        "disclosure indemnification liability payment fee invoice clause section 12.3 4.2.1 breach "
+        "remedy warranty assignment force majeure arbitration venue schedule exhibit"
+    ).split()
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    return [
+        " ".join(rng.choice(vocabulary, size=rng.integers(5, 60), p=weights))
+        for _ in range(count)
+    ]
+
+
+def _brute_force(chunks, query, k, k1, b, allowed=None):
+    """Exhaustive BM25 over {chunk_id: text}, best first."""
+    tokenized = {chunk_id: tokenize(text) for chunk_id, text in chunks.items()}
+    average = sum(len(tokens) for tokens in tokenized.values()) / len(tokenized)
+    terms = list(dict.fromkeys(tokenize(query)))
+    df = Counter(term for tokens in tokenized.values() for term in set(tokens))
+    scores = {}
+    for chunk_id, tokens in tokenized.items():
+        counts = Counter(tokens)
+        score = 0.0
+        for term in terms:
+            if counts[term]:
+                idf = math.log(1 + (len(tokenized) - df[term] + 0.5) / (df[term] + 0.5))
+                norm = k1 * (1 - b + b * len(tokens) / average)
+                score += idf * counts[term] * (k1 + 1) / (counts[term] + norm)
+        if score and (allowed is None or chunk_id in allowed):
+            scores[chunk_id] = score
+    return sorted(scores.items(), key=lambda item: -item[1])[:k]
+
+
+def _assert_same_ranking(results, expected):
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected], rel=1e-9)
+    # Ids may only differ between chunks with equal scores
+    expected_scores = dict(expected)
+    for chunk_id, score in results:
+        assert expected_scores.get(chunk_id, score) == pytest.approx(score, rel=1e-9)
+
+
+def _index(path, chunks, batch=50, **kwargs):
+    kwargs.setdefault('background_merge', False)
+    index = BM25Index(str(path), **kwargs)
+    ids = sorted(chunks)
+    for start in range(0, len(ids), batch):
+        index.add(ids[start:start + batch], [chunks[chunk_id] for chunk_id in ids[start:start + batch]])
+    return index
+
+
+@pytest.mark.parametrize("k", [1, 5, 20])
+def test_maxscore_top_k_matches_brute_force(tmp_path, k):
+    chunks = dict(enumerate(_corpus(600)))
+    index = _index(tmp_path, chunks)
+    assert len(index._snapshot[0]) > 1
+    for query in QUERIES:
+        _assert_same_ranking(index.search(query, k), _brute_force(chunks, query, k, index.k1, index.b))
+
+
+def test_allowed_ids_restrict_results(tmp_path):
+    chunks = dict(enumerate(_corpus(300, seed=1)))
+    index = _index(tmp_path, chunks)
+    allowed = np.arange(100, 180, dtype=np.int64)
+    for query in QUERIES:
+        results = index.search(query, 10, allowed_ids=allowed)
+        assert all(100 <= chunk_id < 180 for chunk_id, _ in results)
+        _assert_same_ranking(
+            results, _brute_force(chunks, query, 10, index.k1, index.b, allowed=set(allowed.tolist()))
+        )
+
+
+def test_remove_ranges_and_reopen(tmp_path):
+    chunks = dict(enumerate(_corpus(400, seed=2)))
+    index = _index(tmp_path, chunks)
+    index.remove_ranges([(20, 70), (300, 310)])
+    remaining = {
+        chunk_id: text for chunk_id, text in chunks.items()
+        if not (20 <= chunk_id < 70 or 300 <= chunk_id < 310)
+    }
+
+    reopened = BM25Index(str(tmp_path))
+    for current in (index, reopened):
+        assert current._snapshot[1] == len(remaining)
+        for query in QUERIES:
+            _assert_same_ranking(current.search(query, 10), _brute_force(remaining, query, 10, index.k1, index.b))
+
+
+def test_search_during_merge_sees_a_consistent_index(tmp_path, monkeypatch):
+    chunks = dict(enumerate(_corpus(1000, seed=3)))
+    # Adds without merging, so the merge below has many blocks to combine
+    monkeypatch.setattr(BM25Index, "merge", lambda self: None)
+    index = _index(tmp_path, chunks, batch=20)
+    monkeypatch.undo()
+    block_count = len(index._snapshot[0])
+    expected = {query: _brute_force(chunks, query, 10, index.k1, index.b) for query in QUERIES}
+
+    merging = threading.Thread(target=index.merge)
+    merging.start()
+    searches = 0
+    while merging.is_alive() or not searches:
+        for query in QUERIES:
+            _assert_same_ranking(index.search(query, 10), expected[query])
+            # Another process opening the directory mid-merge sees a whole index too
+            _assert_same_ranking(BM25Index(str(tmp_path)).search(query, 10), expected[query])
+            searches += 1
+    merging.join()
+
+    assert len(index._snapshot[0]) < block_count
+    for query in QUERIES:
+        _assert_same_ranking(index.search(query, 10), expected[query])
+
+
+def test_reader_follows_writes_of_another_index(tmp_path):
+    writer = BM25Index(str(tmp_path), background_merge=False)
+    writer.add([0, 1], ["termination notice", "payment fee"])
+    reader = BM25Index(str(tmp_path))
+
+    writer.add([2], ["termination for breach"])
+    writer.set_version(7)
+    assert reader.version == 7
+    assert {chunk_id for chunk_id, _ in reader.search("termination", 5)} == {0, 2}
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1, 4]])
+    assert max(fused, key=fused.get) == 1
+    assert fused[3] > fused[2] and fused[3] > fused[4]
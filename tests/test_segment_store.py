@@ -0,0 +1,264 @@
+"""Tests for the append-only segment store behind the local FAISS index."""
+import json
+import os
+import time
+
+import numpy as np
+import pytest
+
+from segment_store import MANIFEST_NAME, SegmentStore
+
+DIMENSION = 8
+
+
+def _store(path, **kwargs):
+    kwargs.setdefault('background_compaction', False)
+    kwargs.setdefault('max_segments', 4)
+    return SegmentStore(str(path), **kwargs)
+
+
+def _chunks(rng, doc_id, count, first_page=1):
+    vectors = rng.standard_normal((count, DIMENSION)).astype(np.float32)
+    texts = [f"{doc_id} chunk {i} – clause {i}" for i in range(count)]
+    metadatas = [
+        {'doc_id': doc_id, 'filename': f"{doc_id}.pdf", 'page': first_page + i, 'chunk_length': len(text)}
+        for i, text in enumerate(texts)
+    ]
+    return vectors, texts, metadatas
+
+
+def _add_document(store, rng, doc_id, count, first_page=1, staged=False):
+    vectors, texts, metadatas = _chunks(rng, doc_id, count, first_page)
+    ids = store.add(vectors, texts, metadatas, staged=staged)
+    store.commit_document(doc_id, {'filename': f"{doc_id}.pdf", 'content_hash': doc_id})
+    return dict(zip(ids, vectors))
+
+
+def _brute_force(live, query, k):
+    ids = sorted(live)
+    distances = [float(np.sum((live[chunk_id] - query) ** 2)) for chunk_id in ids]
+    return [ids[i] for i in np.argsort(distances, kind="stable")[:k]]
+
+
+def _release(store):
+    # Lets another store in this process take the writer lock, as if the
+    # process holding it had exited
+    store._writer_lock.close()
+    store._writer_lock = None
+
+
+def test_search_matches_brute_force_across_segments(tmp_path):
+    rng = np.random.default_rng(0)
+    store = _store(tmp_path)
+    live = {}
+    for i in range(3):
+        live.update(_add_document(store, rng, f"doc{i}", 20))
+
+    assert len(store) == 60
+    for query in rng.standard_normal((5, DIMENSION)).astype(np.float32):
+        hits = store.search(query, 10)
+        assert [hit['id'] for hit in hits] == _brute_force(live, query, 10)
+        assert [hit['score'] for hit in hits] == sorted(hit['score'] for hit in hits)
+
+
+def test_records_round_trip(tmp_path):
+    rng = np.random.default_rng(1)
+    store = _store(tmp_path)
+    vectors, texts, metadatas = _chunks(rng, "contract", 3)
+    metadatas[0].update(page_end=2, char_start=0, char_end=40)
+    # Values that do not fit an int32 column stay in the metadata table
+    metadatas[1].update(page="iv", char_start=-1, source="upload")
+    del metadatas[2]['page']
+    ids = store.add(vectors, texts, metadatas)
+
+    records = store.get(ids)
+    assert [records[chunk_id]['text'] for chunk_id in ids] == texts
+    assert [records[chunk_id]['metadata'] for chunk_id in ids] == metadatas
+    # Chunks 0 and 2 differ only in their columns and share one table row
+    assert len(_store(tmp_path)._segments[0].meta_table) == 2
+
+
+def test_records_survive_merges(tmp_path):
+    rng = np.random.default_rng(9)
+    store = _store(tmp_path, max_segments=2)
+    expected = {}
+    for i in range(5):
+        vectors, texts, metadatas = _chunks(rng, f"doc{i}", 4)
+        expected.update(zip(store.add(vectors, texts, metadatas), zip(texts, metadatas)))
+    store.delete_document("doc1")
+    store.compact()
+
+    records = store.get(list(expected))
+    assert {chunk_id: (record['text'], record['metadata']) for chunk_id, record in records.items()} == {
+        chunk_id: value for chunk_id, value in expected.items() if value[1]['doc_id'] != "doc1"
+    }
+
+
+def test_docs_jsonl_segment_is_converted_on_open(tmp_path):
+    rng = np.random.default_rng(10)
+    store = _store(tmp_path)
+    vectors, texts, metadatas = _chunks(rng, "legacy", 3)
+    ids = store.add(vectors, texts, metadatas)
+    name = store._segments[0].name
+    _release(store)
+    # Rewrite the segment in the older format: one JSON record per line
+    for part in os.listdir(tmp_path):
+        if part.startswith(name) and not part.endswith(("vectors.npy", "ids.npy")):
+            os.remove(os.path.join(tmp_path, part))
+    with open(os.path.join(tmp_path, f"{name}.docs.jsonl"), "w") as f:
+        for text, metadata in zip(texts, metadatas):
+            f.write(json.dumps({'text': text, 'metadata': metadata}) + "\n")
+
+    reopened = _store(tmp_path)
+    assert not os.path.exists(os.path.join(tmp_path, f"{name}.docs.jsonl"))
+    records = reopened.get(ids)
+    assert [records[chunk_id]['text'] for chunk_id in ids] == texts
+    assert [records[chunk_id]['metadata'] for chunk_id in ids] == metadatas
+
+
+def test_delete_document(tmp_path):
+    rng = np.random.default_rng(2)
+    store = _store(tmp_path)
+    kept = _add_document(store, rng, "kept", 10)
+    removed = _add_document(store, rng, "removed", 10)
+
+    assert store.delete_document("removed") == 10
+    assert not store.has_document("removed")
+    assert "removed" not in store.documents
+    assert len(store) == 10
+    hits = store.search(next(iter(removed.values())), 20)
+    assert {hit['id'] for hit in hits} == set(kept)
+    assert store.get(list(removed)) == {}
+
+
+def test_compaction_keeps_ids_ascending_and_results(tmp_path):
+    rng = np.random.default_rng(3)
+    store = _store(tmp_path, max_segments=4)
+    live = {}
+    for i in range(12):
+        live.update(_add_document(store, rng, f"doc{i:02d}", 5))
+    for doc_id in ("doc03", "doc04", "doc09"):
+        for chunk_id in range(*store.documents[doc_id]['id_ranges'][0]):
+            del live[chunk_id]
+        store.delete_document(doc_id)
+    store.compact()
+
+    segments = store._segments
+    assert len(segments) <= 4
+    all_ids = np.concatenate([np.asarray(segment.ids) for segment in segments])
+    assert np.all(np.diff(all_ids) > 0)
+    assert sorted(all_ids.tolist()) == sorted(live)
+    assert len(store._deleted) == 0
+    for query in rng.standard_normal((5, DIMENSION)).astype(np.float32):
+        assert [hit['id'] for hit in store.search(query, 8)] == _brute_force(live, query, 8)
+
+    reopened = _store(tmp_path)
+    assert [segment.name for segment in reopened._segments] == [segment.name for segment in segments]
+    assert len(reopened) == len(live)
+
+
+def test_filters_select_before_ranking(tmp_path):
+    rng = np.random.default_rng(4)
+    store = _store(tmp_path)
+    first = _add_document(store, rng, "first", 10)
+    cutoff = time.time()
+    time.sleep(0.01)
+    second = _add_document(store, rng, "second", 10)
+    query = rng.standard_normal(DIMENSION).astype(np.float32)
+
+    hits = store.search(query, 20, {'doc_ids': ["first"]})
+    assert [hit['id'] for hit in hits] == _brute_force(first, query, 20)
+
+    hits = store.search(query, 20, {'page_range': (3, 5)})
+    assert sorted(hit['metadata']['page'] for hit in hits) == [3, 3, 4, 4, 5, 5]
+
+    hits = store.search(query, 20, {'doc_ids': ["second"], 'page_range': (None, 2)})
+    assert sorted(hit['id'] for hit in hits) == sorted(second)[:2]
+
+    hits = store.search(query, 20, {'date_range': (cutoff, None)})
+    assert {hit['id'] for hit in hits} == set(second)
+    hits = store.search(query, 20, {'date_range': (None, cutoff)})
+    assert {hit['id'] for hit in hits} == set(first)
+
+    assert store.search(query, 20, {'doc_ids': ["unknown"]}) == []
+    assert store.filter_ids({'doc_ids': ["first"]}).tolist() == sorted(first)
+
+
+def test_staged_chunks_replace_the_document_on_commit(tmp_path):
+    rng = np.random.default_rng(5)
+    store = _store(tmp_path)
+    old = _add_document(store, rng, "contract", 6)
+    indexed_at = store.documents["contract"]['indexed_at']
+    query = rng.standard_normal(DIMENSION).astype(np.float32)
+
+    vectors, texts, metadatas = _chunks(rng, "contract", 4)
+    new_ids = store.add(vectors, texts, metadatas, staged=True)
+    # Until the commit, the document is searched through its current chunks
+    assert store.has_document("contract")
+    assert {hit['id'] for hit in store.search(query, 20, {'doc_ids': ["contract"]})} == set(old)
+
+    retired = store.commit_document("contract", {'filename': "contract.pdf", 'content_hash': "contract"})
+    assert retired == [[min(old), max(old) + 1]]
+    assert {hit['id'] for hit in store.search(query, 20)} == set(new_ids)
+    assert store.documents["contract"]['indexed_at'] == indexed_at
+
+
+def test_discarded_staged_chunks_leave_the_document_unchanged(tmp_path):
+    rng = np.random.default_rng(6)
+    store = _store(tmp_path)
+    old = _add_document(store, rng, "contract", 6)
+    vectors, texts, metadatas = _chunks(rng, "contract", 4)
+    store.add(vectors, texts, metadatas, staged=True)
+
+    reopened_before_commit = _store(tmp_path)
+    assert 'staged_ranges' in reopened_before_commit.documents["contract"]
+
+    store.discard_staged("contract")
+    assert store.documents["contract"]['id_ranges'] == [[min(old), max(old) + 1]]
+    assert 'staged_ranges' not in store.documents["contract"]
+    assert {hit['id'] for hit in store.search(vectors[0], 20)} == set(old)
+
+
+def test_reopen_after_crash_between_segment_write_and_publish(tmp_path, monkeypatch):
+    rng = np.random.default_rng(7)
+    store = _store(tmp_path)
+    live = _add_document(store, rng, "kept", 5)
+
+    def crash(*args, **kwargs):
+        raise OSError("simulated crash")
+
+    vectors, texts, metadatas = _chunks(rng, "lost", 5)
+    with monkeypatch.context() as patch:
+        patch.setattr(SegmentStore, "_publish", crash)
+        with pytest.raises(OSError):
+            store.add(vectors, texts, metadatas)
+    _release(store)
+    # A manifest replacement cut short leaves its temporary file behind
+    with open(os.path.join(tmp_path, MANIFEST_NAME + ".tmp"), "w") as f:
+        f.write('{"version": ')
+
+    reopened = _store(tmp_path)
+    assert len(reopened) == 5
+    assert "lost" not in reopened.documents
+    assert {hit['id'] for hit in reopened.search(vectors[0], 20)} == set(live)
+
+    # The orphaned segment's name is reused and its files overwritten
+    live.update(_add_document(reopened, rng, "next", 5))
+    assert len(reopened) == 10
+    assert {hit['id'] for hit in reopened.search(vectors[0], 20)} == set(live)
+    with open(os.path.join(tmp_path, MANIFEST_NAME)) as f:
+        assert len(json.load(f)['segments']) == 2
+
+
+def test_reader_follows_writes_of_another_store(tmp_path):
+    rng = np.random.default_rng(8)
+    writer = _store(tmp_path)
+    _add_document(writer, rng, "first", 5)
+    reader = _store(tmp_path)
+    assert reader.version == writer.version
+
+    second = _add_document(writer, rng, "second", 5)
+    writer.delete_document("first")
+    assert reader.version == writer.version
+    assert set(reader.documents) == {"second"}
+    assert {hit['id'] for hit in reader.search(next(iter(second.values())), 20)} == set(second)
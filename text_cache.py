@@ -0,0 +1,134 @@
+"""
+Persistent cache of extracted PDF page text.
+
+Text extraction is the slowest part of re-indexing, and its output only
+depends on the PDF bytes and the extractor. Pages are therefore stored
+zlib-compressed under (extractor version, SHA-256 of the PDF), so changing
+the chunking, the splitter or the embedding model re-uses the text instead of
+parsing every contract again. Pages are stored one row each and can be read
+lazily, one at a time.
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+import config
+
+
+class TextCache:
+    """SQLite-backed store of compressed page text, keyed by PDF content hash."""
+
+    def __init__(self, path: str = None, extractor: str = None):
+        """
+        Args:
+            path: Database file (defaults to TEXT_CACHE_PATH)
+            extractor: Extractor version; entries written by another version
+                are ignored (defaults to pdf_processor.EXTRACTOR_VERSION)
+        """
+        if extractor is None:
+            from pdf_processor import EXTRACTOR_VERSION
+            extractor = EXTRACTOR_VERSION
+        self.path = path or config.TEXT_CACHE_PATH
+        self.extractor = extractor
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                extractor TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                PRIMARY KEY (extractor, content_hash)
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                extractor TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text BLOB NOT NULL,
+                PRIMARY KEY (extractor, content_hash, page)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def has(self, content_hash: str) -> bool:
+        """True if every page of the document is cached."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM documents WHERE extractor = ? AND content_hash = ?",
+                (self.extractor, content_hash),
+            ).fetchone()
+        return row is not None
+
+    def get(self, content_hash: str) -> Optional[List[Tuple[str, int]]]:
+        """All (text, page_number) tuples of a document in page order, or None if not cached."""
+        if not self.has(content_hash):
+            return None
+        return list(self.iter_pages(content_hash))
+
+    def iter_pages(self, content_hash: str) -> Iterator[Tuple[str, int]]:
+        """Yield a cached document's (text, page_number) tuples in page order, decompressing one at a time."""
+        with self._lock:
+            page_numbers = [
+                page for (page,) in self._conn.execute(
+                    "SELECT page FROM pages WHERE extractor = ? AND content_hash = ? ORDER BY page",
+                    (self.extractor, content_hash),
+                )
+            ]
+        for page_number in page_numbers:
+            text = self.page(content_hash, page_number)
+            if text is not None:
+                yield text, page_number
+
+    def page(self, content_hash: str, page_number: int) -> Optional[str]:
+        """Text of one page, or None if it is not cached (or had no text)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM pages WHERE extractor = ? AND content_hash = ? AND page = ?",
+                (self.extractor, content_hash, page_number),
+            ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def put(self, content_hash: str, text_with_pages: List[Tuple[str, int]]):
+        """
+        Store the extracted pages of a document, replacing any earlier entry.
+
+        Args:
+            content_hash: SHA-256 of the PDF bytes
+            text_with_pages: (text, page_number) tuples of every non-empty page
+        """
+        rows = [
+            (self.extractor, content_hash, page_number, zlib.compress(text.encode("utf-8")))
+            for text, page_number in text_with_pages
+        ]
+        key = (self.extractor, content_hash)
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE extractor = ? AND content_hash = ?", key)
+            self._conn.executemany(
+                "INSERT INTO pages (extractor, content_hash, page, text) VALUES (?, ?, ?, ?)", rows
+            )
+            # Written last, in the same transaction: a document is only
+            # listed once all of its pages are there
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (extractor, content_hash, pages, stored_at) "
+                "VALUES (?, ?, ?, ?)",
+                (*key, len(rows), time.time()),
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        """Number of cached documents for this extractor version."""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE extractor = ?", (self.extractor,)
+            ).fetchone()
+        return count
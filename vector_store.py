@@ -2,46 +2,100 @@
 Vector store management module for Pinecone and FAISS.
 Uses HuggingFace sentence-transformers for free embeddings.
 """
+import hashlib
 import os
 from typing import List, Dict
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import numpy as np
+from langchain_core.embeddings import Embeddings
 import config
+import metrics
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from embedding_engine import EmbeddingEngine
+from segment_store import IndexLockedError, SegmentStore
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from pinecone_upsert import PineconeUpserter
+from retrieval_client import RemoteEmbeddings, RetrievalClient, encode_filters
 
-# Conditional Pinecone import
-try:
-    from langchain_community.vectorstores import Pinecone
-    try:
-        import pinecone
-    except Exception:
-        # Handle case where pinecone package has issues
-        pinecone = None
-    PINECONE_AVAILABLE = True
-except (ImportError, Exception):
-    PINECONE_AVAILABLE = False
-    Pinecone = None
+# Pinecone is imported on first use so FAISS-only runs skip the import cost
+pinecone = None
+PINECONE_AVAILABLE = None
+
+
+def _load_pinecone() -> bool:
+    """Conditionally import the Pinecone client; returns whether it is available."""
+    global pinecone, PINECONE_AVAILABLE
+    if PINECONE_AVAILABLE is None:
+        try:
+            import pinecone
+            PINECONE_AVAILABLE = True
+        except Exception:
+            # Handle case where pinecone package is missing or has issues
+            PINECONE_AVAILABLE = False
+            pinecone = None
+    return PINECONE_AVAILABLE
 
 
 class VectorStoreManager:
-    """Manages vector store operations for both Pinecone and FAISS."""
+    """
+    Manages vector store operations for both Pinecone and FAISS.
     
-    def __init__(self):
-        # Use HuggingFace embeddings (free, no API key needed)
-        self.embeddings = HuggingFaceEmbeddings(
-            model_name=config.EMBEDDING_MODEL,
-            model_kwargs={'device': 'cpu'}  # Use CPU to avoid GPU requirements
-        )
+    With a retrieval service configured it is a thin client of the service,
+    which holds the one index and embedding model (store_type "service").
+    """
+    
+    def __init__(self, embeddings: Embeddings = None, service_url: str = None, pinecone_index=None):
+        """
+        Args:
+            embeddings: Optional embedding model to use instead of the
+                configured sentence-transformers model (e.g. for benchmarks)
+            service_url: Retrieval service to use instead of a local index
+                (defaults to RETRIEVAL_SERVICE_URL; "" forces a local index)
+            pinecone_index: Pinecone index object to use instead of connecting
+                with PINECONE_API_KEY (e.g. fake_pinecone.FakePineconeIndex);
+                selects the Pinecone backend
+        """
+        self.lexical_index = None
+        # Pinecone has no local manifest; count writes made through this manager
+        self._pinecone_version = 0
+        service_url = config.RETRIEVAL_SERVICE_URL if service_url is None else service_url
+        if service_url:
+            self.store_type = "service"
+            self.vector_store = RetrievalClient(service_url)
+            self.embeddings = RemoteEmbeddings(self.vector_store)
+            return
+        
+        # Use HuggingFace sentence-transformers (free, no API key needed) through
+        # the length-bucketed engine, fronted by the on-disk cache so unchanged
+        # chunks are never re-encoded. The model (and torch) load on first use.
+        if embeddings is None:
+            embeddings = EmbeddingEngine(config.EMBEDDING_MODEL, device='cpu')  # Use CPU to avoid GPU requirements
+        self.embeddings = CachedEmbeddings(embeddings, EmbeddingCache())
         self.vector_store = None
-        self.store_type = config.VECTOR_STORE_TYPE
+        self.pinecone_upserter = None
+        self.store_type = "pinecone" if pinecone_index is not None else config.VECTOR_STORE_TYPE
         
         if self.store_type == "pinecone":
-            self._initialize_pinecone()
+            self._initialize_pinecone(pinecone_index)
         else:
             self._initialize_faiss()
     
-    def _initialize_pinecone(self):
-        """Initialize Pinecone vector store."""
-        if not PINECONE_AVAILABLE:
+    def _initialize_pinecone(self, index=None):
+        """
+        Initialize the Pinecone vector store.
+        
+        The index is used directly rather than through the LangChain wrapper:
+        writes go through a PineconeUpserter (batched, concurrent, retried)
+        and chunk text is kept under the 'text' metadata key, as the wrapper
+        stored it.
+        """
+        if index is None:
+            index = self._connect_pinecone()
+        self.vector_store = index
+        self.pinecone_upserter = PineconeUpserter(index)
+    
+    def _connect_pinecone(self):
+        """Open the configured Pinecone index, creating it if needed."""
+        if not _load_pinecone():
             raise ImportError("Pinecone is not installed. Install it with: pip install pinecone-client")
         
         if not config.PINECONE_API_KEY:
@@ -63,10 +117,7 @@ class VectorStoreManager:
                     metric="cosine"
                 )
             
-            self.vector_store = Pinecone.from_existing_index(
-                index_name=config.PINECONE_INDEX_NAME,
-                embedding=self.embeddings
-            )
+            return pc.Index(config.PINECONE_INDEX_NAME)
         except ImportError:
             # Fallback to older Pinecone API (v2)
             pinecone.init(
@@ -84,84 +135,492 @@ class VectorStoreManager:
                     metric="cosine"
                 )
             
-            self.vector_store = Pinecone.from_existing_index(
-                index_name=config.PINECONE_INDEX_NAME,
-                embedding=self.embeddings
-            )
+            return pinecone.Index(config.PINECONE_INDEX_NAME)
     
     def _initialize_faiss(self):
-        """Initialize FAISS vector store (local)."""
-        if os.path.exists(config.FAISS_INDEX_PATH):
-            self.vector_store = FAISS.load_local(
-                config.FAISS_INDEX_PATH,
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
-        else:
-            # Will be created when documents are added
-            self.vector_store = None
+        """
+        Initialize the local FAISS vector store.
+        
+        The index is kept as append-only segments under FAISS_INDEX_PATH; an
+        index saved by an older version with FAISS.save_local is imported on
+        first open.
+        
+        With HYBRID_SEARCH enabled, a BM25 index over the same chunks is kept
+        alongside; it is rebuilt from the segments if it is out of sync.
+        """
+        self.vector_store = SegmentStore(config.FAISS_INDEX_PATH)
+        
+        if config.HYBRID_SEARCH:
+            self.lexical_index = BM25Index(os.path.join(config.FAISS_INDEX_PATH, "lexical"))
+            self._rebuild_stale_lexical_index()
     
-    def add_documents(self, chunks: List[Dict]):
+    def _rebuild_stale_lexical_index(self):
+        """
+        Rebuild the BM25 index from the segments if its version differs from
+        theirs, e.g. after a writer crashed between the two. Runs on open and
+        before every local write; a process that cannot take the writer lock
+        leaves it to the writer and picks up its result on the next search.
+        """
+        if self.lexical_index is None or self.lexical_index.version == self.vector_store.version:
+            return
+        # Taking the lock reloads both indexes, which may now agree
+        if not self._can_write() or self.lexical_index.version == self.vector_store.version:
+            return
+        legacy_path = os.path.join(config.FAISS_INDEX_PATH, "lexical.sqlite")
+        if os.path.exists(legacy_path):
+            # Postings of older versions, replaced by the blocks in lexical/
+            os.remove(legacy_path)
+        self.lexical_index.clear()
+        batch_ids, batch_texts = [], []
+        for chunk_id, record in self.vector_store.iter_records():
+            batch_ids.append(chunk_id)
+            batch_texts.append(record['text'])
+            if len(batch_ids) >= 1000:
+                self.lexical_index.add(batch_ids, batch_texts)
+                batch_ids, batch_texts = [], []
+        self.lexical_index.add(batch_ids, batch_texts)
+        self.lexical_index.set_version(self.vector_store.version)
+    
+    def _can_write(self) -> bool:
+        """
+        Take the index's writer lock if it is free. Rebuilding the lexical
+        index is a write; while another process holds the lock, that process
+        keeps it in sync and this one only reads.
+        """
+        try:
+            self.vector_store.acquire_writer_lock()
+            return True
+        except IndexLockedError:
+            return False
+    
+    @property
+    def index_version(self) -> int:
+        """Counter that changes whenever the indexed corpus changes."""
+        if self.store_type == "service":
+            return self.vector_store.call("index_version")
+        if self.store_type == "pinecone":
+            return self._pinecone_version
+        return self.vector_store.version
+    
+    def _sync_lexical_version(self):
+        if self.lexical_index is not None:
+            self.lexical_index.set_version(self.vector_store.version)
+    
+    def _delete_local_document(self, doc_id: str) -> int:
+        """Delete a document from the FAISS store and the lexical index."""
+        self._rebuild_stale_lexical_index()
+        entry = self.vector_store.documents.get(doc_id)
+        if entry is None:
+            return 0
+        deleted = self.vector_store.delete_document(doc_id)
+        self._remove_lexical(entry['id_ranges'] + entry.get('staged_ranges', []))
+        return deleted
+    
+    def _remove_lexical(self, id_ranges: List[List[int]]):
+        if self.lexical_index is not None and id_ranges:
+            self.lexical_index.remove_ranges(id_ranges)
+            self._sync_lexical_version()
+    
+    def add_documents(self, chunks: List[Dict], staged: bool = False) -> Dict[str, int]:
         """
         Add document chunks to the vector store.
         
         Args:
             chunks: List of dictionaries with 'text' and 'metadata' keys
+            staged: Add them as replacement chunks of their document, swapped
+                in for its current ones by commit_document (see begin_reindex)
+            
+        Returns:
+            Dictionary with 'cache_hits' and 'cache_misses' embedding counts,
+            plus 'embedded_chunks' and 'embed_seconds' spent in the model
         """
+        with metrics.span("index.add", chunks=len(chunks)) as add_span:
+            stats = self._add_documents(chunks, staged)
+            add_span.set(cache_hits=stats['cache_hits'], cache_misses=stats['cache_misses'])
+        metrics.increment("chunks_indexed", len(chunks))
+        metrics.increment("embedding_cache_lookups", stats['cache_hits'], result="hit")
+        metrics.increment("embedding_cache_lookups", stats['cache_misses'], result="miss")
+        return stats
+    
+    def _add_documents(self, chunks: List[Dict], staged: bool) -> Dict[str, int]:
+        if self.store_type == "service":
+            return self.vector_store.call("add_documents", chunks=chunks, staged=staged)
+        
+        self.embeddings.take_stats()
         texts = [chunk['text'] for chunk in chunks]
         metadatas = [chunk['metadata'] for chunk in chunks]
         
         if self.store_type == "pinecone":
-            if self.vector_store:
-                self.vector_store.add_texts(texts=texts, metadatas=metadatas)
-            else:
-                self.vector_store = Pinecone.from_texts(
-                    texts=texts,
-                    embedding=self.embeddings,
-                    metadatas=metadatas,
-                    index_name=config.PINECONE_INDEX_NAME
+            # Deterministic ids make re-adding the same chunk, or retrying a
+            # request whose response was lost, an overwrite
+            ids = [_chunk_vector_id(text, metadata) for text, metadata in zip(texts, metadatas)]
+            with metrics.span("embed"):
+                vectors = self.embeddings.embed_documents(texts)
+            with metrics.span("index.write") as write_span:
+                upserted = self.pinecone_upserter.upsert(
+                    ids, vectors, [dict(metadata, text=text) for text, metadata in zip(texts, metadatas)]
                 )
+                write_span.set(requests=upserted['requests'], retries=upserted['retries'])
+            metrics.increment("pinecone_upsert_retries", upserted['retries'])
+            self._pinecone_version += 1
         else:
-            # FAISS
-            if self.vector_store:
-                self.vector_store.add_texts(texts=texts, metadatas=metadatas)
-            else:
-                self.vector_store = FAISS.from_texts(
-                    texts=texts,
-                    embedding=self.embeddings,
-                    metadatas=metadatas
-                )
+            # FAISS: each batch is persisted as a new segment, so the cost of
+            # an add no longer grows with the size of the whole index
+            self._rebuild_stale_lexical_index()
+            with metrics.span("embed"):
+                vectors = self.embeddings.embed_documents(texts)
+            with metrics.span("index.write"):
+                ids = self.vector_store.add(np.asarray(vectors, dtype=np.float32), texts, metadatas, staged=staged)
+            if self.lexical_index is not None:
+                with metrics.span("lexical.add"):
+                    self.lexical_index.add(ids, texts)
+                    self._sync_lexical_version()
+        
+        return self.embeddings.take_stats()
+    
+    def has_document(self, doc_id: str) -> bool:
+        """
+        Check whether a document is already fully indexed.
+        
+        The Pinecone backend keeps no document registry, so it always reports
+        False; its deterministic chunk ids make re-adding a document an overwrite.
+        """
+        if self.store_type == "service":
+            return self.vector_store.call("has_document", doc_id=doc_id)
+        if self.store_type == "pinecone":
+            return False
+        return self.vector_store.has_document(doc_id)
+    
+    def begin_document(self, document: Dict):
+        """
+        Prepare to (re)index a document, discarding chunks left over from an
+        earlier, interrupted attempt at the same document.
+        
+        Args:
+            document: Identity from pdf_processor.document_identity
+        """
+        if self.store_type == "service":
+            self.vector_store.call("begin_document", document=document)
+        elif self.store_type != "pinecone":
+            self._delete_local_document(document['doc_id'])
+    
+    def begin_reindex(self, document: Dict):
+        """
+        Prepare to re-index an indexed document in place. Its new chunks are
+        added with staged=True and replace the current ones only when
+        commit_document succeeds; until then the document stays searchable
+        and keeps its registry entry. Staged chunks left over from an earlier,
+        interrupted attempt are discarded.
+        
+        Args:
+            document: Identity of the indexed document
+        """
+        if self.store_type == "service":
+            self.vector_store.call("begin_reindex", document=document)
+        elif self.store_type != "pinecone":
+            self._rebuild_stale_lexical_index()
+            self._remove_lexical(self.vector_store.discard_staged(document['doc_id']))
+    
+    def commit_document(self, document: Dict) -> int:
+        """
+        Mark a document as fully indexed and remove older versions of the same file.
+        
+        Chunks added with staged=True replace the document's current chunks.
+        
+        Args:
+            document: Identity from pdf_processor.document_identity
             
-            # Save FAISS index locally
-            os.makedirs(config.FAISS_INDEX_PATH, exist_ok=True)
-            self.vector_store.save_local(config.FAISS_INDEX_PATH)
+        Returns:
+            Number of older versions removed
+        """
+        if self.store_type == "service":
+            return self.vector_store.call("commit_document", document=document)
+        if self.store_type == "pinecone":
+            self._pinecone_version += 1
+            self.vector_store.delete(filter={
+                'filename': document['filename'],
+                'doc_id': {'$ne': document['doc_id']}
+            })
+            return 0
+        
+        self._rebuild_stale_lexical_index()
+        retired = self.vector_store.commit_document(document['doc_id'], {
+            'filename': document['filename'],
+            'content_hash': document['content_hash']
+        })
+        self._remove_lexical(retired)
+        self._sync_lexical_version()
+        stale = [
+            doc_id for doc_id, entry in self.vector_store.documents.items()
+            if entry.get('filename') == document['filename'] and doc_id != document['doc_id']
+        ]
+        for doc_id in stale:
+            self._delete_local_document(doc_id)
+        return len(stale)
     
-    def similarity_search(self, query: str, k: int = None) -> List[Dict]:
+    def upsert_document(self, document: Dict, chunks: List[Dict]) -> bool:
+        """
+        Add or replace a whole document.
+        
+        Args:
+            document: Identity from pdf_processor.document_identity
+            chunks: The document's chunks, tagged with its doc_id
+            
+        Returns:
+            False if the same version was already indexed (nothing is done),
+            True otherwise
+        """
+        if self.store_type == "service":
+            # One writer job, so no other write lands between its steps
+            return self.vector_store.call("upsert_document", document=document, chunks=chunks)
+        if self.has_document(document['doc_id']):
+            return False
+        self.begin_document(document)
+        self.add_documents(chunks)
+        self.commit_document(document)
+        return True
+    
+    def delete_document(self, doc_id: str) -> int:
+        """
+        Delete every chunk of a document without rebuilding the index.
+        
+        Returns:
+            Number of chunks deleted (Pinecone does not report a count and returns 0)
+        """
+        if self.store_type == "service":
+            return self.vector_store.call("delete_document", doc_id=doc_id)
+        if self.store_type == "pinecone":
+            self._pinecone_version += 1
+            self.vector_store.delete(filter={'doc_id': doc_id})
+            return 0
+        return self._delete_local_document(doc_id)
+    
+    def list_documents(self) -> Dict[str, Dict]:
+        """Registry of indexed documents keyed by doc_id (empty for Pinecone)."""
+        if self.store_type == "service":
+            return self.vector_store.call("list_documents")
+        if self.store_type == "pinecone":
+            return {}
+        return {
+            doc_id: entry for doc_id, entry in self.vector_store.documents.items()
+            if entry.get('complete')
+        }
+    
+    def similarity_search(
+        self,
+        query: str,
+        k: int = None,
+        filters: Dict = None,
+        query_vector: List[float] = None
+    ) -> List[Dict]:
         """
         Perform similarity search on the vector store.
         
         Args:
             query: Query string
             k: Number of results to return
+            filters: Optional dict restricting the search to 'doc_ids' (list),
+                'page_range' ((first, last) inclusive) and/or 'date_range'
+                ((start, end) on indexing time). Filters are applied inside the
+                index, before ranking.
+            query_vector: Embedding of query, if the caller already computed it
             
         Returns:
             List of documents with similarity scores and metadata
         """
-        if not self.vector_store:
+        if self.vector_store is None:
             raise ValueError("Vector store not initialized. Please add documents first.")
         
         k = k or config.TOP_K_RESULTS
+        with metrics.span("retrieval.search", k=k, filtered=bool(filters)) as search_span:
+            results = self._similarity_search(query, k, filters, query_vector)
+            search_span.set(results=len(results))
+        return results
+    
+    def _similarity_search(self, query: str, k: int, filters: Dict, query_vector: List[float]) -> List[Dict]:
+        if self.store_type == "service":
+            # The service embeds the query itself unless a vector is given
+            return self.vector_store.call(
+                "similarity_search",
+                query=query,
+                k=k,
+                filters=encode_filters(filters),
+                query_vector=None if query_vector is None else [float(value) for value in query_vector]
+            )
+        
+        if query_vector is None:
+            with metrics.span("embed_query"):
+                query_vector = self.embeddings.embed_query(query)
+        
+        if self.store_type != "pinecone":
+            query_vector = np.asarray(query_vector, dtype=np.float32)
+            if self.lexical_index is not None:
+                return self._hybrid_search(query, query_vector, k, filters)
+            with metrics.span("search.vector"):
+                hits = self.vector_store.search(query_vector, k, filters)
+            return [
+                {'text': hit['text'], 'metadata': hit['metadata'], 'score': hit['score']}
+                for hit in hits
+            ]
         
         # Perform similarity search
-        docs = self.vector_store.similarity_search_with_score(query, k=k)
+        with metrics.span("search.vector"):
+            response = self.vector_store.query(
+                vector=[float(value) for value in query_vector],
+                top_k=k,
+                filter=_pinecone_filter(filters) if filters else None,
+                include_metadata=True
+            )
         
         results = []
-        for doc, score in docs:
+        for match in response['matches']:
+            metadata = dict(match['metadata'] or {})
+            text = metadata.pop('text', '')
             results.append({
-                'text': doc.page_content,
-                'metadata': doc.metadata,
-                'score': float(score)
+                'text': text,
+                'metadata': metadata,
+                'score': float(match['score'])
             })
         
         return results
+    
+    def similarity_search_many(
+        self,
+        queries: List[str],
+        query_vectors: List[List[float]] = None,
+        k: int = None,
+        filters: Dict = None
+    ) -> List[List[Dict]]:
+        """
+        Run similarity_search for many queries at once.
+        
+        Queries are embedded in a single batched call (unless query_vectors is
+        given) and, for the FAISS store, every segment is scanned once for all
+        queries together.
+        
+        Returns:
+            One result list per query, in the order of queries
+        """
+        if self.vector_store is None:
+            raise ValueError("Vector store not initialized. Please add documents first.")
+        
+        k = k or config.TOP_K_RESULTS
+        if self.store_type == "service":
+            return self.vector_store.call(
+                "similarity_search_many",
+                queries=queries,
+                query_vectors=None if query_vectors is None else [
+                    [float(value) for value in vector] for vector in query_vectors
+                ],
+                k=k,
+                filters=encode_filters(filters)
+            )
+        
+        if query_vectors is None:
+            query_vectors = self.embeddings.embed_queries(queries)
+        
+        if self.store_type == "pinecone":
+            return [
+                self.similarity_search(query, k=k, filters=filters, query_vector=vector)
+                for query, vector in zip(queries, query_vectors)
+            ]
+        
+        matrix = np.asarray(query_vectors, dtype=np.float32)
+        if self.lexical_index is None:
+            return [
+                [{'text': hit['text'], 'metadata': hit['metadata'], 'score': hit['score']} for hit in hits]
+                for hits in self.vector_store.search_many(matrix, k, filters)
+            ]
+        
+        depth = max(k, config.HYBRID_CANDIDATES)
+        all_vector_hits = self.vector_store.search_many(matrix, depth, filters)
+        allowed_ids = self.vector_store.filter_ids(filters) if filters else None
+        return [
+            self._fuse(query, vector, vector_hits, k, allowed_ids)
+            for query, vector, vector_hits in zip(queries, matrix, all_vector_hits)
+        ]
+    
+    def _hybrid_search(self, query: str, query_vector: np.ndarray, k: int, filters: Dict = None) -> List[Dict]:
+        """
+        Fuse vector and BM25 rankings with reciprocal rank fusion.
+        
+        Each retriever contributes its top HYBRID_CANDIDATES. Results are in
+        fused order; 'score' stays the vector distance (squared L2, lower is
+        closer) as in a plain vector search, also for keyword-only hits, and
+        'fused_score' (higher is better) and 'bm25_score' are added.
+        """
+        depth = max(k, config.HYBRID_CANDIDATES)
+        with metrics.span("search.vector"):
+            vector_hits = self.vector_store.search(query_vector, depth, filters)
+        allowed_ids = self.vector_store.filter_ids(filters) if filters else None
+        return self._fuse(query, query_vector, vector_hits, k, allowed_ids)
+    
+    def _fuse(
+        self,
+        query: str,
+        query_vector: np.ndarray,
+        vector_hits: List[Dict],
+        k: int,
+        allowed_ids: np.ndarray = None
+    ) -> List[Dict]:
+        """Merge vector hits with BM25 hits for the same query by reciprocal rank fusion."""
+        depth = max(k, config.HYBRID_CANDIDATES)
+        with metrics.span("search.lexical"):
+            lexical_hits = self.lexical_index.search(query, depth, allowed_ids=allowed_ids)
+        
+        fused = reciprocal_rank_fusion([
+            [hit['id'] for hit in vector_hits],
+            [chunk_id for chunk_id, _ in lexical_hits]
+        ])
+        top_ids = sorted(fused, key=lambda chunk_id: -fused[chunk_id])[:k]
+        
+        vector_by_id = {hit['id']: hit for hit in vector_hits}
+        bm25_by_id = dict(lexical_hits)
+        # Lexical-only hits still need their text, metadata and vector distance
+        records = self.vector_store.get(
+            [chunk_id for chunk_id in top_ids if chunk_id not in vector_by_id], query_vector=query_vector
+        )
+        records.update(vector_by_id)
+        
+        results = []
+        for chunk_id in top_ids:
+            record = records.get(chunk_id)
+            if record is None:
+                continue
+            result = {
+                'text': record['text'],
+                'metadata': record['metadata'],
+                'score': record['score'],
+                'fused_score': fused[chunk_id]
+            }
+            if chunk_id in bm25_by_id:
+                result['bm25_score'] = bm25_by_id[chunk_id]
+            results.append(result)
+        
+        return results
+
 
+def _chunk_vector_id(text: str, metadata: Dict) -> str:
+    """Stable vector id for a chunk, derived from its document, page and text."""
+    key = f"{metadata.get('doc_id', '')}|{metadata.get('page', '')}|{text}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def _pinecone_filter(filters: Dict) -> Dict:
+    """Translate search filters to a Pinecone metadata filter."""
+    if filters.get('date_range') is not None:
+        raise ValueError("Date filters are only supported by the FAISS vector store")
+    
+    conditions = {}
+    if filters.get('doc_ids') is not None:
+        conditions['doc_id'] = {'$in': list(filters['doc_ids'])}
+    if filters.get('page_range') is not None:
+        first, last = filters['page_range']
+        page = {}
+        if first is not None:
+            page['$gte'] = first
+        if last is not None:
+            page['$lte'] = last
+        if page:
+            conditions['page'] = page
+    return conditions